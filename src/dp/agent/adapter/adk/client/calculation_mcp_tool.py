@@ -138,7 +138,7 @@ class CalculationMCPTool(MCPTool):
                 status = res.content[0].text
                 await self.log("info", "Job %s status is %s" % (
                     job_id, status), tool_context)
-                if status != "Running":
+                if status not in ["Pending", "Running"]:
                     break
             await asyncio.sleep(self.query_interval)
 
@@ -278,7 +278,7 @@ class BackgroundJobWatcher:
                 logger.error(res.content[0].text)
                 continue
             status = res.content[0].text
-            if status != "Running":
+            if status not in ["Pending", "Running"]:
                 res = await self.toolset.results_tool.run_async(
                     args={"job_id": job_id, "executor": self.toolset.executor,
                           "storage": self.toolset.storage},
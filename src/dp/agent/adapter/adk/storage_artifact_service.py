@@ -9,7 +9,7 @@ from google.adk.artifacts import BaseArtifactService
 from google.genai import types
 from typing_extensions import override
 
-from ...server.storage import BaseStorage
+from ...server.storage import BaseStorage, run_async
 
 logger = logging.getLogger(__name__)
 
@@ -80,7 +80,7 @@ class StorageArtifactService(BaseArtifactService):
             path = os.path.join(tmpdir, filename)
             with open(path, "wb") as f:
                 f.write(artifact.inline_data.data)
-            self.storage._upload(key, path)
+            await self.storage._aupload(key, path)
 
         return version
 
@@ -110,7 +110,7 @@ class StorageArtifactService(BaseArtifactService):
         )
         with tempfile.TemporaryDirectory() as tmpdir:
             path = os.path.join(tmpdir, filename)
-            self.storage._download(key, path)
+            await self.storage._adownload(key, path)
             with open(path, "rb") as f:
                 artifact_bytes = f.read()
 
@@ -127,13 +127,14 @@ class StorageArtifactService(BaseArtifactService):
         filenames = set()
 
         session_prefix = f"{app_name}/{user_id}/{session_id}/"
-        keys = self.storage.list(session_prefix)
+        keys = await self.storage.alist(session_prefix)
         for key in keys:
             _, _, _, filename, _ = key.split("/")[-5:]
             filenames.add(filename)
 
         user_namespace_prefix = f"{app_name}/{user_id}/user/"
-        user_namespace_keys = self.storage.list(user_namespace_prefix)
+        user_namespace_keys = await self.storage.alist(
+            user_namespace_prefix)
         for key in user_namespace_keys:
             _, _, _, filename, _ = key.split("/")[-5:]
             filenames.add(filename)
@@ -151,7 +152,7 @@ class StorageArtifactService(BaseArtifactService):
         self, *, app_name: str, user_id: str, session_id: str, filename: str
     ) -> list[int]:
         prefix = self._get_key(app_name, user_id, session_id, filename, "")
-        keys = self.storage.list(prefix)
+        keys = await self.storage.alist(prefix)
         versions = []
         for key in keys:
             _, _, _, _, version = key.split("/")[-5:]
@@ -181,4 +182,4 @@ class StorageArtifactService(BaseArtifactService):
         key = self._get_key(
             app_name, user_id, session_id, filename, version
         )
-        return self.storage.get_http_url(key)
+        return await run_async(self.storage.get_http_url, key)
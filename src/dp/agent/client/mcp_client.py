@@ -144,7 +144,7 @@ class MCPClient:
             else:
                 status = res.content[0].text
                 logger.info("Job %s status is %s" % (job_id, status))
-                if status != "Running":
+                if status not in ["Pending", "Running"]:
                     break
             await asyncio.sleep(self.query_interval)
 
@@ -0,0 +1,189 @@
+import hashlib
+import json
+import os
+import shutil
+import stat
+import threading
+import uuid
+from collections import OrderedDict
+
+from .storage.base_storage import link_file
+from .utils import get_logger
+
+logger = get_logger(__name__)
+
+
+def parse_size(size):
+    """Parse a size like 1024, "512M" or "10G" into bytes"""
+    if isinstance(size, (int, float)):
+        return int(size)
+    size = size.strip().upper().rstrip("B")
+    units = {"K": 1 << 10, "M": 1 << 20, "G": 1 << 30, "T": 1 << 40}
+    if size and size[-1] in units:
+        return int(float(size[:-1]) * units[size[-1]])
+    return int(size)
+
+
+def set_read_only(path):
+    for root, _, files in os.walk(path):
+        for f in files:
+            os.chmod(os.path.join(root, f), 0o444)
+
+
+def get_tree_size(path):
+    if os.path.isfile(path):
+        return os.path.getsize(path)
+    size = 0
+    for root, _, files in os.walk(path):
+        for f in files:
+            size += os.path.getsize(os.path.join(root, f))
+    return size
+
+
+class ArtifactCache:
+    def __init__(self, root: str, max_size=10 << 30):
+        """
+        Content-addressed cache of downloaded input artifacts shared across
+        jobs. Entries are keyed by URI and the remote md5/etag, evicted in
+        LRU order when the total size exceeds max_size, and materialized in
+        job workdirs by reflink or else copied, so tools modifying their
+        input files in place never touch the read-only cache entries.
+
+        Args:
+            root: The directory of the cache
+            max_size: The maximum total size of cached artifacts in bytes
+                (or a string like "10G")
+        """
+        self.root = os.path.abspath(root)
+        self.max_size = parse_size(max_size)
+        self.hits = 0
+        self.misses = 0
+        self.bytes_saved = 0
+        self.evictions = 0
+        self._lock = threading.Lock()
+        self._key_locks = {}
+        self._entries = OrderedDict()
+        os.makedirs(self.root, exist_ok=True)
+        self._load()
+
+    def _load(self):
+        entries = []
+        for digest in os.listdir(self.root):
+            meta_file = os.path.join(self.root, digest, "meta.json")
+            if not os.path.isfile(meta_file):
+                if digest.startswith(".tmp-"):
+                    shutil.rmtree(os.path.join(self.root, digest),
+                                  ignore_errors=True)
+                continue
+            with open(meta_file, "r") as f:
+                meta = json.load(f)
+            entries.append((os.path.getmtime(meta_file), digest, meta))
+        for _, digest, meta in sorted(entries):
+            self._entries[digest] = meta
+
+    def stats(self):
+        with self._lock:
+            return {
+                "hits": self.hits,
+                "misses": self.misses,
+                "bytes_saved": self.bytes_saved,
+                "evictions": self.evictions,
+                "entries": len(self._entries),
+                "size": sum(meta["size"] for meta in self._entries.values()),
+                "max_size": self.max_size,
+            }
+
+    def _key_lock(self, digest):
+        with self._lock:
+            if digest not in self._key_locks:
+                self._key_locks[digest] = threading.Lock()
+            return self._key_locks[digest]
+
+    def fetch(self, storage, key: str, uri: str, path: str,
+              workdir: str = None) -> str:
+        """
+        Download key of storage into the directory path through the cache,
+        return the local path as BaseStorage.download does
+        """
+        if workdir is not None and not os.path.isabs(path):
+            local_path = self.fetch(storage, key, uri,
+                                    os.path.join(workdir, path))
+            return os.path.relpath(local_path, workdir)
+        try:
+            md5 = storage.get_md5(key)
+        except Exception:
+            md5 = None
+        if not md5:
+            return storage.download(key, path, workdir)
+        digest = hashlib.sha256(("%s\n%s" % (uri, md5)).encode()).hexdigest()
+        with self._key_lock(digest):
+            with self._lock:
+                meta = self._entries.get(digest)
+                if meta is not None:
+                    self._entries.move_to_end(digest)
+                    self.hits += 1
+                    self.bytes_saved += meta["size"]
+            entry_dir = os.path.join(self.root, digest)
+            if meta is not None:
+                os.utime(os.path.join(entry_dir, "meta.json"))
+                logger.info("Artifact cache hit for %s" % uri)
+            else:
+                meta = self._populate(digest, storage, key, uri, md5)
+            self._materialize(os.path.join(entry_dir, "data"), path)
+        self._evict(keep=digest)
+        return os.path.normpath(os.path.join(path, meta["rel_path"]))
+
+    def _populate(self, digest, storage, key, uri, md5):
+        staging = os.path.join(self.root, ".tmp-%s" % uuid.uuid4().hex)
+        data_dir = os.path.join(staging, "data")
+        try:
+            local_path = storage.download(key, data_dir)
+            meta = {
+                "uri": uri,
+                "md5": md5,
+                "rel_path": os.path.relpath(local_path, data_dir),
+                "size": get_tree_size(data_dir),
+            }
+            set_read_only(data_dir)
+            with open(os.path.join(staging, "meta.json"), "w") as f:
+                json.dump(meta, f)
+            os.rename(staging, os.path.join(self.root, digest))
+        finally:
+            shutil.rmtree(staging, ignore_errors=True)
+        with self._lock:
+            self._entries[digest] = meta
+            self.misses += 1
+        return meta
+
+    def _materialize(self, data_dir, path):
+        for root, _, files in os.walk(data_dir):
+            target_dir = os.path.join(path, os.path.relpath(root, data_dir))
+            os.makedirs(target_dir, exist_ok=True)
+            for f in files:
+                dst = os.path.join(target_dir, f)
+                link_file(os.path.join(root, f), dst, hardlink=False)
+                os.chmod(dst, os.stat(dst).st_mode | stat.S_IWUSR)
+
+    def _evict(self, keep=None):
+        with self._lock:
+            total = sum(meta["size"] for meta in self._entries.values())
+            for digest in list(self._entries):
+                if total <= self.max_size:
+                    break
+                if digest == keep:
+                    continue
+                key_lock = self._key_locks.get(digest)
+                if key_lock is not None and not key_lock.acquire(
+                        blocking=False):
+                    continue
+                try:
+                    meta = self._entries.pop(digest)
+                    shutil.rmtree(os.path.join(self.root, digest),
+                                  ignore_errors=True)
+                    total -= meta["size"]
+                    self.evictions += 1
+                    logger.info("Artifact %s evicted from cache" %
+                                meta["uri"])
+                finally:
+                    if key_lock is not None:
+                        key_lock.release()
@@ -1,15 +1,16 @@
+import asyncio
 import inspect
 import json
 import os
+import threading
+import time
 from collections.abc import Callable
-from contextlib import contextmanager
-from copy import deepcopy
+from concurrent.futures import ThreadPoolExecutor
 from datetime import datetime
 from pathlib import Path
-from urllib.parse import urlparse
 from typing import Annotated, Literal, Optional, List, Dict
 
-from mcp.server.fastmcp import FastMCP
+from mcp.server.fastmcp import Context, FastMCP
 from mcp.server.fastmcp.utilities.context_injection import (
     find_context_parameter,
 )
@@ -19,108 +20,436 @@ from mcp.server.fastmcp.utilities.func_metadata import (
 )
 from mcp.server.sse import SseServerTransport
 from pydantic import BaseModel, Field, create_model
-from starlette.responses import JSONResponse
+from starlette.responses import JSONResponse, PlainTextResponse
 from starlette.routing import Route
 
+from . import metrics
+from .artifact_cache import ArtifactCache
 from .executor import executor_dict
-from .storage import storage_dict
+from .executor.scheduler import get_scheduler
+from .job_registry import FINISHED_STATUS, JobRegistry, format_time
+from .pool import InstancePool, hash_config
+from .result_cache import ResultCache, make_key
+from .storage import parse_uri, run_async, storage_dict
 from .utils import get_logger, JobResult, Tool
 logger = get_logger(__name__)
 
 
-def parse_uri(uri):
-    scheme = urlparse(uri).scheme
-    if scheme == "":
-        key = uri
-        scheme = "local"
-    else:
-        key = uri[len(scheme)+3:]
-    return scheme, key
+def parse_concurrency(value):
+    """
+    Parse a concurrency spec like "8" or "8,oss=16,http=4" into a dict
+    mapping storage scheme to the limit, with "default" for other schemes
+    """
+    concurrency = {}
+    for item in str(value).split(","):
+        item = item.strip()
+        if not item:
+            continue
+        if "=" in item:
+            scheme, limit = item.split("=", 1)
+            concurrency[scheme.strip()] = int(limit)
+        else:
+            concurrency["default"] = int(item)
+    return concurrency
+
+
+config = {
+    "download_concurrency": parse_concurrency(os.environ.get(
+        "DP_AGENT_DOWNLOAD_CONCURRENCY", "8")),
+    "upload_concurrency": int(os.environ.get(
+        "DP_AGENT_UPLOAD_CONCURRENCY", "4")),
+    "artifact_cache_dir": os.environ.get("DP_AGENT_ARTIFACT_CACHE_DIR"),
+    "artifact_cache_size": os.environ.get("DP_AGENT_ARTIFACT_CACHE_SIZE",
+                                          "10G"),
+    "pool_ttl": float(os.environ.get("DP_AGENT_POOL_TTL", "3600")),
+    # directory of the server fixed at startup, relative paths of the
+    # server's files are resolved against it
+    "base_dir": os.path.abspath(os.environ.get("DP_AGENT_BASE_DIR", ".")),
+    "job_registry": os.environ.get("DP_AGENT_JOB_REGISTRY", "jobs.db"),
+    "result_cache_ttl": float(os.environ.get("DP_AGENT_RESULT_CACHE_TTL",
+                                             "86400")),
+    "result_cache_size": int(os.environ.get("DP_AGENT_RESULT_CACHE_SIZE",
+                                            "1024")),
+}
+PATH_ANNOTATIONS = [Path, Optional[Path], List[Path], Optional[List[Path]],
+                    Dict[str, Path], Optional[Dict[str, Path]],
+                    Dict[str, List[Path]], Optional[Dict[str, List[Path]]]]
+
+
+def build_storage(storage_config: dict):
+    storage_type = storage_config.pop("type")
+    return storage_dict[storage_type](**storage_config)
+
+
+def build_executor(executor_config: dict):
+    executor_type = executor_config.pop("type")
+    return executor_dict[executor_type](**executor_config)
+
+
+# Storages and executors are reused across calls with the same config
+storage_pool = InstancePool(build_storage, ttl=config["pool_ttl"])
+executor_pool = InstancePool(build_executor, ttl=config["pool_ttl"])
 
 
 def init_storage(storage_config: Optional[dict] = None):
     if not storage_config:
         storage_config = {"type": "local"}
-    storage_config = deepcopy(storage_config)
-    storage_type = storage_config.pop("type")
-    storage = storage_dict[storage_type](**storage_config)
-    return storage_type, storage
+    return storage_config["type"], storage_pool.get(storage_config)
 
 
 def init_executor(executor_config: Optional[dict] = None):
     if not executor_config:
         executor_config = {"type": "local"}
-    executor_config = deepcopy(executor_config)
-    executor_type = executor_config.pop("type")
-    return executor_type, executor_dict[executor_type](**executor_config)
+    return executor_config["type"], executor_pool.get(executor_config)
 
 
-@contextmanager
-def set_directory(workdir: str):
-    cwd = os.getcwd()
-    os.makedirs(workdir, exist_ok=True)
-    try:
-        os.chdir(workdir)
-        yield
-    finally:
-        os.chdir(cwd)
+def get_executor_type(executor_config: Optional[dict] = None):
+    return executor_config["type"] if executor_config else "local"
+
+
+_trace_lock = threading.Lock()
+_last_trace_id = ""
+
+
+def new_trace_id():
+    """Generate a timestamp trace ID, unique within the process"""
+    global _last_trace_id
+    with _trace_lock:
+        while True:
+            trace_id = datetime.today().strftime('%Y-%m-%d-%H:%M:%S.%f')
+            if trace_id > _last_trace_id:
+                _last_trace_id = trace_id
+                return trace_id
+            time.sleep(1e-6)
+
+
+def split_job_id(job_id: str):
+    """Split a job ID into its workdir and the executor's job ID"""
+    trace_id, exec_id = job_id.split("/")
+    return os.path.join(config["base_dir"], trace_id), exec_id
+
+
+_job_registry = None
+_job_registry_lock = threading.Lock()
+
 
+def get_job_registry() -> Optional[JobRegistry]:
+    """Get the job registry, created on first use"""
+    global _job_registry
+    with _job_registry_lock:
+        if _job_registry is None and config["job_registry"]:
+            path = config["job_registry"]
+            if path != ":memory:":
+                path = os.path.join(config["base_dir"], path)
+            _job_registry = JobRegistry(path)
+        return _job_registry
 
-def load_job_info():
-    with open("job.json", "r") as f:
+
+def set_job_registry(registry):
+    """
+    Set the job registry, a JobRegistry, the path of its database, or
+    False to disable it
+    """
+    global _job_registry
+    with _job_registry_lock:
+        if isinstance(registry, str):
+            registry = JobRegistry(registry)
+        if not registry:
+            config["job_registry"] = None
+            registry = None
+        _job_registry = registry
+
+
+def register_job(job_id, workdir, tool_name, executor, storage, **kwargs):
+    registry = get_job_registry()
+    if registry is not None:
+        registry.add(job_id, workdir, tool_name, executor, storage, **kwargs)
+
+
+def update_job(job_id, **kwargs):
+    registry = get_job_registry()
+    if registry is not None:
+        registry.update(job_id, **kwargs)
+
+
+def load_job(job_id: str):
+    """
+    Load the workdir, the executor's job ID and the job info of a job, from
+    the job registry if registered, from job.json in its workdir otherwise
+    """
+    registry = get_job_registry()
+    job_info = registry.get(job_id) if registry is not None else None
+    return _load_job(job_id, job_info)
+
+
+def _load_job(job_id, job_info=None):
+    if job_info is not None:
+        return job_info["workdir"], job_id.split("/")[1], job_info
+    workdir, exec_id = split_job_id(job_id)
+    return workdir, exec_id, load_job_info(workdir)
+
+
+def load_jobs(job_ids: List[str]):
+    """
+    Load many jobs as load_job does, with a single query of the job
+    registry. Return a dict mapping job ID to (workdir, exec_id, job_info),
+    and a dict mapping job ID to the error message of jobs failed to load
+    """
+    registry = get_job_registry()
+    records = registry.get_many(job_ids) if registry is not None else {}
+    jobs = {}
+    errors = {}
+    for job_id in job_ids:
+        try:
+            jobs[job_id] = _load_job(job_id, records.get(job_id))
+        except Exception as e:
+            errors[job_id] = str(e)
+    return jobs, errors
+
+
+def load_job_info(workdir: str = "."):
+    with open(os.path.join(workdir, "job.json"), "r") as f:
         return json.load(f)
 
 
+def dump_job_info(job: dict, workdir: str = "."):
+    with open(os.path.join(workdir, "job.json"), "w") as f:
+        json.dump(job, f, indent=4)
+
+
 def query_job_status(job_id: str, executor: Optional[dict] = None
-                     ) -> Literal["Running", "Succeeded", "Failed"]:
+                     ) -> Literal["Pending", "Running", "Succeeded",
+                                  "Failed"]:
     """
     Query status of a calculation job
     Args:
         job_id (str): The ID of the calculation job
     Returns:
-        status (str): One of "Running", "Succeeded" or "Failed"
+        status (str): One of "Pending" (queued for resources), "Running",
+            "Succeeded" or "Failed"
     """
-    trace_id, exec_id = job_id.split("/")
-    with set_directory(trace_id):
-        executor = load_job_info()["executor"] or executor
-        _, executor = init_executor(executor)
-        status = executor.query_status(exec_id)
-        logger.info("Job %s status is %s" % (job_id, status))
+    workdir, exec_id, job_info = load_job(job_id)
+    if job_info.get("status") in FINISHED_STATUS:
+        return job_info["status"]
+    executor = job_info["executor"] or executor
+    executor_type, executor = init_executor(executor)
+    with metrics.time_phase("status_polling", job_info["tool_name"],
+                            executor_type):
+        status = executor.query_status(exec_id, workdir=workdir)
+    update_job(job_id, status=status)
+    logger.info("Job %s status is %s" % (job_id, status))
     return status
 
 
+def query_jobs_status_batch(jobs: dict, executor: Optional[dict] = None):
+    """
+    Query status of jobs loaded by load_jobs, grouping unfinished jobs by
+    executor configuration so that each executor queries its jobs in one
+    pass. Return a dict mapping job ID to the status or the exception raised
+    """
+    statuses = {}
+    groups = {}
+    for job_id, (workdir, exec_id, job_info) in jobs.items():
+        if job_info.get("status") in FINISHED_STATUS:
+            statuses[job_id] = job_info["status"]
+            continue
+        executor_config = job_info["executor"] or executor
+        key = hash_config(executor_config)
+        groups.setdefault(key, (executor_config, []))[1].append(job_id)
+    for executor_config, job_ids in groups.values():
+        try:
+            _, executor_instance = init_executor(executor_config)
+            results = executor_instance.query_status_batch(
+                [(jobs[job_id][1], jobs[job_id][0]) for job_id in job_ids])
+        except Exception as e:
+            results = [e] * len(job_ids)
+        for job_id, status in zip(job_ids, results):
+            statuses[job_id] = status
+            if not isinstance(status, Exception):
+                update_job(job_id, status=status)
+    return statuses
+
+
+def query_jobs_status(job_ids: List[str], executor: Optional[dict] = None
+                      ) -> List[dict]:
+    """
+    Query status of many calculation jobs in one call
+    Args:
+        job_ids (list): The IDs of the calculation jobs
+    Returns:
+        statuses (list): For each job, the job ID and its status
+            ("Pending", "Running", "Succeeded" or "Failed"), or the error if
+            failed to query
+    """
+    jobs, errors = load_jobs(job_ids)
+    statuses = query_jobs_status_batch(jobs, executor)
+    res = []
+    for job_id in job_ids:
+        status = statuses.get(job_id)
+        if isinstance(status, Exception):
+            errors[job_id] = str(status)
+        if job_id in errors:
+            res.append({"job_id": job_id, "status": None,
+                        "error": errors[job_id]})
+        else:
+            res.append({"job_id": job_id, "status": status})
+    logger.info("Status of jobs %s is %s" % (job_ids, res))
+    return res
+
+
 def terminate_job(job_id: str, executor: Optional[dict] = None):
     """
     Terminate a calculation job
     Args:
         job_id (str): The ID of the calculation job
     """
-    trace_id, exec_id = job_id.split("/")
-    with set_directory(trace_id):
-        executor = load_job_info()["executor"] or executor
-        _, executor = init_executor(executor)
-        executor.terminate(exec_id)
-        logger.info("Job %s is terminated" % job_id)
+    workdir, exec_id, job_info = load_job(job_id)
+    executor = job_info["executor"] or executor
+    _, executor = init_executor(executor)
+    executor.terminate(exec_id, workdir=workdir)
+    if job_info.get("status") not in FINISHED_STATUS:
+        update_job(job_id, status="Failed")
+    logger.info("Job %s is terminated" % job_id)
 
 
-def handle_input_artifacts(fn, kwargs, storage):
-    storage_type, storage = init_storage(storage)
+def _group_downloads(downloads):
+    groups = {}
+    for item in downloads:
+        scheme, key = parse_uri(item["uri"])
+        item["key"] = key
+        groups.setdefault(scheme, []).append(item)
+    return groups
+
+
+def download_artifacts(downloads, storage_type, storage, concurrency=None,
+                       cache=None, workdir=None):
+    """
+    Download artifacts concurrently, with a bounded number of workers per
+    storage scheme
+    Args:
+        downloads (list): Each item is a dict with "uri" and "path" (the
+            directory to download into), "local_path" and "seconds" are
+            filled in after downloading
+        storage_type (str): The type of the default storage
+        storage (BaseStorage): The default storage
+        concurrency (dict): Maximum number of concurrent downloads per
+            storage scheme, "default" for schemes not listed
+        cache (ArtifactCache): Fetch artifacts of remote storages through
+            this cache
+        workdir (str): The job workdir relative paths are resolved against
+    """
+    if concurrency is None:
+        concurrency = config["download_concurrency"]
+    groups = _group_downloads(downloads)
+
+    def download(s, scheme, item):
+        start = time.time()
+        if cache is not None and scheme != "local":
+            item["local_path"] = cache.fetch(
+                s, item["key"], item["uri"], item["path"], workdir)
+        else:
+            item["local_path"] = s.download(
+                item["key"], item["path"], workdir)
+        item["seconds"] = time.time() - start
+
+    pools = []
+    futures = []
+    try:
+        for scheme, items in groups.items():
+            if scheme == storage_type:
+                s = storage
+            else:
+                _, s = init_storage({"type": scheme})
+            max_workers = concurrency.get(
+                scheme, concurrency.get("default", 1))
+            pool = ThreadPoolExecutor(
+                max_workers=max(1, min(max_workers, len(items))),
+                thread_name_prefix="download-%s" % scheme)
+            pools.append(pool)
+            futures.extend(pool.submit(download, s, scheme, item)
+                           for item in items)
+        for future in futures:
+            future.result()
+    finally:
+        for pool in pools:
+            pool.shutdown(wait=True, cancel_futures=True)
+    return downloads
+
+
+async def adownload_artifacts(downloads, storage_type, storage,
+                              concurrency=None, cache=None, workdir=None):
+    """
+    Async counterpart of download_artifacts, the downloads are awaited on
+    the event loop through the async storage API instead of blocking it
+    """
+    if concurrency is None:
+        concurrency = config["download_concurrency"]
+    groups = _group_downloads(downloads)
+
+    async def download(s, semaphore, scheme, item):
+        async with semaphore:
+            start = time.time()
+            if cache is not None and scheme != "local":
+                item["local_path"] = await run_async(
+                    cache.fetch, s, item["key"], item["uri"], item["path"],
+                    workdir)
+            else:
+                item["local_path"] = await s.adownload(
+                    item["key"], item["path"], workdir)
+            item["seconds"] = time.time() - start
+
+    tasks = []
+    try:
+        for scheme, items in groups.items():
+            if scheme == storage_type:
+                s = storage
+            else:
+                _, s = await run_async(init_storage, {"type": scheme})
+            semaphore = asyncio.Semaphore(max(1, concurrency.get(
+                scheme, concurrency.get("default", 1))))
+            tasks.extend(asyncio.ensure_future(
+                download(s, semaphore, scheme, item)) for item in items)
+        await asyncio.gather(*tasks)
+    finally:
+        for task in tasks:
+            task.cancel()
+        await asyncio.gather(*tasks, return_exceptions=True)
+    return downloads
+
+
+def _resolve_downloads(obj, downloads):
+    if isinstance(obj, int):
+        return Path(downloads[obj]["local_path"])
+    if isinstance(obj, list):
+        return [_resolve_downloads(i, downloads) for i in obj]
+    return {k: _resolve_downloads(v, downloads) for k, v in obj.items()}
+
+
+def plan_input_artifacts(fn, kwargs, storage_type):
+    """
+    Collect the downloads of the Path arguments of a tool call
+    Returns:
+        downloads (list): The items to download
+        plans (dict): Indices into downloads of each Path argument
+        input_artifacts (dict): The input artifacts
+    """
     sig = inspect.signature(fn)
     input_artifacts = {}
+    downloads = []
+    plans = {}
+
+    def schedule(name, uri, path, key_name=None):
+        downloads.append({"name": name, "key_name": key_name, "uri": uri,
+                          "path": path})
+        return len(downloads) - 1
+
     for name, param in sig.parameters.items():
         if param.annotation is Path or (
             param.annotation is Optional[Path] and
                 kwargs.get(name) is not None):
             uri = kwargs[name]
-            scheme, key = parse_uri(uri)
-            if scheme == storage_type:
-                s = storage
-            else:
-                s = storage_dict[scheme]()
-            path = s.download(key, "inputs/%s" % name)
-            logger.info("Artifact %s downloaded to %s" % (
-                uri, path))
-            kwargs[name] = Path(path)
+            scheme, _ = parse_uri(uri)
+            plans[name] = schedule(name, uri, "inputs/%s" % name)
             input_artifacts[name] = {
                 "storage_type": scheme,
                 "uri": uri,
@@ -129,18 +458,8 @@ def handle_input_artifacts(fn, kwargs, storage):
             param.annotation is Optional[List[Path]] and
                 kwargs.get(name) is not None):
             uris = kwargs[name]
-            new_paths = []
-            for uri in uris:
-                scheme, key = parse_uri(uri)
-                if scheme == storage_type:
-                    s = storage
-                else:
-                    s = storage_dict[scheme]()
-                path = s.download(key, "inputs/%s" % name)
-                new_paths.append(Path(path))
-                logger.info("Artifact %s downloaded to %s" % (
-                    uri, path))
-            kwargs[name] = new_paths
+            plans[name] = [schedule(name, uri, "inputs/%s" % name)
+                           for uri in uris]
             input_artifacts[name] = {
                 "storage_type": storage_type,
                 "uri": uris,
@@ -149,18 +468,10 @@ def handle_input_artifacts(fn, kwargs, storage):
             param.annotation is Optional[Dict[str, Path]] and
                 kwargs.get(name) is not None):
             uris_dict = kwargs[name]
-            new_paths_dict = {}
-            for key_name, uri in uris_dict.items():
-                scheme, key = parse_uri(uri)
-                if scheme == storage_type:
-                    s = storage
-                else:
-                    s = storage_dict[scheme]()
-                path = s.download(key, f"inputs/{name}/{key_name}")
-                new_paths_dict[key_name] = Path(path)
-                logger.info("Artifact %s (key=%s) downloaded to %s" % (
-                    uri, key_name, path))
-            kwargs[name] = new_paths_dict
+            plans[name] = {
+                key_name: schedule(name, uri, f"inputs/{name}/{key_name}",
+                                   key_name)
+                for key_name, uri in uris_dict.items()}
             input_artifacts[name] = {
                 "storage_type": storage_type,
                 "uri": uris_dict,
@@ -169,62 +480,260 @@ def handle_input_artifacts(fn, kwargs, storage):
             param.annotation is Optional[Dict[str, List[Path]]] and
                 kwargs.get(name) is not None):
             uris_dict = kwargs[name]
-            new_paths_dict = {}
-            for key_name, uris in uris_dict.items():
-                new_paths = []
-                for uri in uris:
-                    scheme, key = parse_uri(uri)
-                    if scheme == storage_type:
-                        s = storage
-                    else:
-                        s = storage_dict[scheme]()
-                    path = s.download(key, f"inputs/{name}/{key_name}")
-                    new_paths.append(Path(path))
-                    logger.info("Artifact %s (key=%s) downloaded to %s" % (
-                        uri, key_name, path))
-                new_paths_dict[key_name] = new_paths
-            kwargs[name] = new_paths_dict
+            plans[name] = {
+                key_name: [schedule(name, uri, f"inputs/{name}/{key_name}",
+                                    key_name) for uri in uris]
+                for key_name, uris in uris_dict.items()}
             input_artifacts[name] = {
                 "storage_type": storage_type,
                 "uri": uris_dict,
             }
-    return kwargs, input_artifacts
+
+    return downloads, plans, input_artifacts
+
+
+def resolve_input_artifacts(kwargs, downloads, plans, timings=None):
+    """Replace the URIs of Path arguments by the downloaded local paths"""
+    for item in downloads:
+        if item["key_name"] is None:
+            logger.info("Artifact %s downloaded to %s" % (
+                item["uri"], item["local_path"]))
+        else:
+            logger.info("Artifact %s (key=%s) downloaded to %s" % (
+                item["uri"], item["key_name"], item["local_path"]))
+        if timings is not None:
+            timings.append({
+                "name": item["name"],
+                "key_name": item["key_name"],
+                "uri": item["uri"],
+                "seconds": item["seconds"],
+            })
+    for name, plan in plans.items():
+        kwargs[name] = _resolve_downloads(plan, downloads)
+    return kwargs
 
 
-def handle_output_artifacts(results, exec_id, storage):
+def handle_input_artifacts(fn, kwargs, storage, concurrency=None,
+                           timings=None, cache=None, workdir=None,
+                           download=True):
+    """
+    Download input artifacts of a tool call, all artifacts of the call are
+    downloaded concurrently
+    Args:
+        fn (Callable): The tool function
+        kwargs (dict): The arguments of the call, URIs of Path arguments are
+            replaced by local paths
+        storage (dict): The storage configuration
+        concurrency (dict): Maximum number of concurrent downloads per
+            storage scheme
+        timings (list): If provided, the download time of each artifact is
+            appended to it
+        cache (ArtifactCache): The artifact cache
+        workdir (str): The job workdir, artifacts are downloaded into its
+            inputs directory and kwargs hold paths relative to it
+        download (bool): If False, only record the input artifacts and keep
+            their URIs in kwargs, for jobs downloading them remotely
+    Returns:
+        kwargs (dict): The arguments with local paths
+        input_artifacts (dict): The input artifacts
+    """
     storage_type, storage = init_storage(storage)
+    downloads, plans, input_artifacts = plan_input_artifacts(
+        fn, kwargs, storage_type)
+    if not download:
+        return kwargs, input_artifacts
+    if downloads:
+        download_artifacts(downloads, storage_type, storage, concurrency,
+                           cache, workdir)
+    kwargs = resolve_input_artifacts(kwargs, downloads, plans, timings)
+    return kwargs, input_artifacts
+
+
+async def ahandle_input_artifacts(fn, kwargs, storage, concurrency=None,
+                                  timings=None, cache=None, workdir=None,
+                                  download=True):
+    """
+    Async counterpart of handle_input_artifacts, which keeps the event loop
+    serving other requests while the artifacts are downloaded
+    """
+    storage_type, storage = await run_async(init_storage, storage)
+    downloads, plans, input_artifacts = plan_input_artifacts(
+        fn, kwargs, storage_type)
+    if not download:
+        return kwargs, input_artifacts
+    if downloads:
+        await adownload_artifacts(downloads, storage_type, storage,
+                                  concurrency, cache, workdir)
+    kwargs = resolve_input_artifacts(kwargs, downloads, plans, timings)
+    return kwargs, input_artifacts
+
+
+def _iter_uris(value):
+    if isinstance(value, list):
+        for v in value:
+            yield from _iter_uris(v)
+    elif isinstance(value, dict):
+        for v in value.values():
+            yield from _iter_uris(v)
+    elif value is not None:
+        yield str(value)
+
+
+def get_cache_key(fn, kwargs, storage):
+    """
+    Key of a tool call for result caching, from the tool name, the
+    arguments, the storage configuration and the md5 of every input
+    artifact. Return None if the md5 of some input artifact is unavailable
+    """
+    storage_type, default_storage = init_storage(storage)
+    sig = inspect.signature(fn)
+    md5s = {}
+    for name, param in sig.parameters.items():
+        if param.annotation not in PATH_ANNOTATIONS:
+            continue
+        for uri in _iter_uris(kwargs.get(name)):
+            scheme, key = parse_uri(uri)
+            if scheme == storage_type:
+                s = default_storage
+            else:
+                _, s = init_storage({"type": scheme})
+            try:
+                md5s[uri] = s.get_md5(key)
+            except Exception as e:
+                logger.info("Not caching since md5 of %s is unavailable: "
+                            "%s" % (uri, e))
+                return None
+            if not md5s[uri]:
+                return None
+    kwargs = {k: v for k, v in kwargs.items()
+              if not isinstance(v, Context)}
+    return make_key(fn.__name__, kwargs, storage, md5s)
+
+
+def upload_artifacts(uploads, storage, concurrency=None, workdir=None):
+    """
+    Upload artifacts concurrently
+    Args:
+        uploads (list): Each item is a dict with "key" (the key prefix) and
+            "path", "uploaded_key" is filled in after uploading
+        storage (BaseStorage): The storage
+        concurrency (int): Maximum number of concurrent uploads
+        workdir (str): The job workdir relative paths are resolved against
+    """
+    if concurrency is None:
+        concurrency = config["upload_concurrency"]
+
+    def upload(item):
+        item["uploaded_key"] = storage.upload(
+            item["key"], item["path"], workdir)
+
+    if len(uploads) <= 1 or concurrency <= 1:
+        for item in uploads:
+            upload(item)
+        return uploads
+    with ThreadPoolExecutor(max_workers=min(concurrency, len(uploads)),
+                            thread_name_prefix="upload") as pool:
+        futures = [pool.submit(upload, item) for item in uploads]
+        for future in futures:
+            future.result()
+    return uploads
+
+
+async def aupload_artifacts(uploads, storage, concurrency=None,
+                            workdir=None):
+    """
+    Async counterpart of upload_artifacts, the uploads are awaited on the
+    event loop through the async storage API instead of blocking it
+    """
+    if concurrency is None:
+        concurrency = config["upload_concurrency"]
+    semaphore = asyncio.Semaphore(max(1, concurrency))
+
+    async def upload(item):
+        async with semaphore:
+            item["uploaded_key"] = await storage.aupload(
+                item["key"], item["path"], workdir)
+
+    tasks = [asyncio.ensure_future(upload(item)) for item in uploads]
+    try:
+        await asyncio.gather(*tasks)
+    finally:
+        for task in tasks:
+            task.cancel()
+        await asyncio.gather(*tasks, return_exceptions=True)
+    return uploads
+
+
+def plan_output_artifacts(results, exec_id):
+    """
+    Collect the uploads of the Path results of a job
+    Returns:
+        uploads (list): The items to upload
+        lists (dict): Placeholders of the URIs of list results
+    """
+    uploads = []
+    lists = {}
+    for name in results:
+        if isinstance(results[name], Path):
+            uploads.append({"name": name, "key": "%s/outputs/%s" % (
+                exec_id, name), "path": results[name]})
+        elif isinstance(results[name], list) and all(
+                isinstance(item, Path) for item in results[name]):
+            lists[name] = [None] * len(results[name])
+            for i, item in enumerate(results[name]):
+                uploads.append({"name": name, "index": i, "key":
+                                "%s/outputs/%s" % (exec_id, name),
+                                "path": item})
+    return uploads, lists
+
+
+def resolve_output_artifacts(results, uploads, lists, storage_type):
+    """Replace the Path results by the URIs of the uploaded artifacts"""
     output_artifacts = {}
-    if isinstance(results, dict):
-        for name in results:
-            if isinstance(results[name], Path):
-                key = storage.upload("%s/outputs/%s" % (exec_id, name),
-                                     results[name])
-                uri = storage_type + "://" + key
-                logger.info("Artifact %s uploaded to %s" % (
-                    results[name], uri))
-                results[name] = uri
-                output_artifacts[name] = {
-                    "storage_type": storage_type,
-                    "uri": uri,
-                }
-            elif isinstance(results[name], list) and all(
-                    isinstance(item, Path) for item in results[name]):
-                new_uris = []
-                for item in results[name]:
-                    key = storage.upload("%s/outputs/%s" % (exec_id, name),
-                                         item)
-                    uri = storage_type + "://" + key
-                    logger.info("Artifact %s uploaded to %s" % (
-                        item, uri))
-                    new_uris.append(uri)
-                results[name] = new_uris
-                output_artifacts[name] = {
-                    "storage_type": storage_type,
-                    "uri": new_uris,
-                }
+    for item in uploads:
+        uri = storage_type + "://" + item["uploaded_key"]
+        logger.info("Artifact %s uploaded to %s" % (item["path"], uri))
+        if "index" in item:
+            lists[item["name"]][item["index"]] = uri
+        else:
+            results[item["name"]] = uri
+            output_artifacts[item["name"]] = {
+                "storage_type": storage_type,
+                "uri": uri,
+            }
+    for name, new_uris in lists.items():
+        results[name] = new_uris
+        output_artifacts[name] = {
+            "storage_type": storage_type,
+            "uri": new_uris,
+        }
     return results, output_artifacts
 
 
+def handle_output_artifacts(results, exec_id, storage, concurrency=None,
+                            workdir=None):
+    storage_type, storage = init_storage(storage)
+    if not isinstance(results, dict):
+        return results, {}
+    uploads, lists = plan_output_artifacts(results, exec_id)
+    upload_artifacts(uploads, storage, concurrency, workdir)
+    return resolve_output_artifacts(results, uploads, lists, storage_type)
+
+
+async def ahandle_output_artifacts(results, exec_id, storage,
+                                   concurrency=None, workdir=None):
+    """
+    Async counterpart of handle_output_artifacts, which keeps the event loop
+    serving other requests while the artifacts are uploaded
+    """
+    storage_type, storage = await run_async(init_storage, storage)
+    if not isinstance(results, dict):
+        return results, {}
+    uploads, lists = plan_output_artifacts(results, exec_id)
+    await aupload_artifacts(uploads, storage, concurrency, workdir)
+    return resolve_output_artifacts(results, uploads, lists, storage_type)
+
+
 # MCP does not regard Any as serializable in Python 3.12
 # use Optional[Any] to work around
 def get_job_results(job_id: str, executor: Optional[dict] = None,
@@ -236,19 +745,96 @@ def get_job_results(job_id: str, executor: Optional[dict] = None,
     Returns:
         results (Any): results of the calculation job
     """
-    trace_id, exec_id = job_id.split("/")
-    with set_directory(trace_id):
-        job_info = load_job_info()
-        executor = job_info["executor"] or executor
-        storage = job_info["storage"] or storage
-        _, executor = init_executor(executor)
-        results = executor.get_results(exec_id)
-        results, output_artifacts = handle_output_artifacts(
-            results, exec_id, storage)
-        logger.info("Job %s result is %s" % (job_id, results))
-    return JobResult(result=results, job_info={
-        "output_artifacts": output_artifacts,
-    }, tool_name=job_info["tool_name"])
+    return _get_job_results(job_id, *load_job(job_id), executor, storage)
+
+
+def _get_job_results(job_id, workdir, exec_id, job_info, executor=None,
+                     storage=None):
+    executor = job_info["executor"] or executor
+    storage = job_info["storage"] or storage
+    executor_type, executor = init_executor(executor)
+    metrics.set_job_labels(job_info["tool_name"], executor_type)
+    with metrics.time_phase("result_collection"):
+        results = executor.get_results(exec_id, workdir=workdir)
+    output_artifacts = executor.get_output_artifacts(exec_id, workdir=workdir)
+    if output_artifacts is None:
+        with metrics.time_phase("output_upload"):
+            results, output_artifacts = handle_output_artifacts(
+                results, exec_id, storage, workdir=workdir)
+    update_job(job_id, status="Succeeded", output_artifacts=output_artifacts)
+    logger.info("Job %s result is %s" % (job_id, results))
+    info = {"output_artifacts": output_artifacts}
+    accounting = executor.get_accounting(exec_id, workdir=workdir)
+    if accounting:
+        info["accounting"] = accounting
+    return JobResult(result=results, job_info=info,
+                     tool_name=job_info["tool_name"])
+
+
+def get_jobs_results(job_ids: List[str], executor: Optional[dict] = None,
+                     storage: Optional[dict] = None) -> List[dict]:
+    """
+    Get results of many calculation jobs in one call, results are returned
+    for finished jobs only
+    Args:
+        job_ids (list): The IDs of the calculation jobs
+    Returns:
+        results (list): For each job, the job ID, its status, and results of
+            the job if finished, or the error if failed
+    """
+    jobs, errors = load_jobs(job_ids)
+    statuses = query_jobs_status_batch(jobs, executor)
+    res = []
+    for job_id in job_ids:
+        status = statuses.get(job_id)
+        if isinstance(status, Exception):
+            errors[job_id] = str(status)
+        if job_id in errors:
+            res.append({"job_id": job_id, "status": None,
+                        "error": errors[job_id]})
+            continue
+        item = {"job_id": job_id, "status": status}
+        if status in FINISHED_STATUS:
+            try:
+                job_result = _get_job_results(job_id, *jobs[job_id],
+                                              executor, storage)
+                item["result"] = job_result.result
+                item["job_info"] = job_result.job_info
+                item["tool_name"] = job_result.tool_name
+            except Exception as e:
+                item["error"] = str(e)
+        res.append(item)
+    return res
+
+
+def list_jobs(status: Optional[Literal["Pending", "Running", "Succeeded",
+                                      "Failed"]] = None,
+              tool_name: Optional[str] = None, limit: int = 100
+              ) -> List[dict]:
+    """
+    List calculation jobs, most recent first
+    Args:
+        status (str): Only list jobs of this status
+        tool_name (str): Only list jobs of this tool
+        limit (int): The maximum number of jobs listed
+    Returns:
+        jobs (list): Job ID, tool name, status, creation/update time and
+            artifacts of the jobs
+    """
+    registry = get_job_registry()
+    if registry is None:
+        raise RuntimeError("Job registry is disabled")
+    return [{
+        "job_id": job["job_id"],
+        "tool_name": job["tool_name"],
+        "status": job["status"],
+        "executor_type": job["executor_type"],
+        "created_at": format_time(job["created_at"]),
+        "updated_at": format_time(job["updated_at"]),
+        "extra_info": job["extra_info"],
+        "input_artifacts": job["input_artifacts"],
+        "output_artifacts": job["output_artifacts"],
+    } for job in registry.list(status, tool_name, limit)]
 
 
 annotation_map = {
@@ -296,14 +882,43 @@ def patch_mcp_close_connection():
 
 class CalculationMCPServer:
     def __init__(self, *args, preprocess_func=None, fastmcp_mode=False,
-                 patch_close_connection=False, **kwargs):
+                 patch_close_connection=False, download_concurrency=None,
+                 artifact_cache=None, job_registry=None, result_cache=None,
+                 **kwargs):
         """
         Args:
             preprocess_func: The preprocess function for all tools
             fastmcp_mode: compatible for fastmcp.FastMCP
+            download_concurrency: Maximum number of concurrent input
+                artifact downloads per storage scheme, e.g. {"default": 8,
+                "oss": 16}, DP_AGENT_DOWNLOAD_CONCURRENCY by default
+            artifact_cache: Cache input artifacts of remote storages shared
+                across jobs, an ArtifactCache or a dict of its arguments,
+                enabled by DP_AGENT_ARTIFACT_CACHE_DIR by default
+            job_registry: The job registry, a JobRegistry, the path of its
+                SQLite database, or False to disable it,
+                DP_AGENT_JOB_REGISTRY ("jobs.db") by default
+            result_cache: The result cache shared by tools with cache=True,
+                a ResultCache or a dict of its arguments, created with
+                DP_AGENT_RESULT_CACHE_TTL and DP_AGENT_RESULT_CACHE_SIZE
+                when first needed by default
         """
         self.preprocess_func = preprocess_func
         self.fastmcp_mode = fastmcp_mode
+        if isinstance(download_concurrency, (int, str)):
+            download_concurrency = parse_concurrency(download_concurrency)
+        self.download_concurrency = download_concurrency
+        if artifact_cache is None and config["artifact_cache_dir"]:
+            artifact_cache = {"root": config["artifact_cache_dir"],
+                              "max_size": config["artifact_cache_size"]}
+        if isinstance(artifact_cache, dict):
+            artifact_cache = ArtifactCache(**artifact_cache)
+        self.artifact_cache = artifact_cache or None
+        if job_registry is not None:
+            set_job_registry(job_registry)
+        if isinstance(result_cache, dict):
+            result_cache = ResultCache(**result_cache)
+        self.result_cache = result_cache
         if patch_close_connection:
             patch_mcp_close_connection()
         self.mcp = FastMCP(*args, **kwargs)
@@ -371,40 +986,135 @@ class CalculationMCPServer:
         self.mcp._tool_manager._tools[tool.name] = tool
         return tool
 
-    def tool(self, preprocess_func=None, create_workdir=None):
+    def get_result_cache(self):
+        if self.result_cache is None:
+            self.result_cache = ResultCache(
+                ttl=config["result_cache_ttl"],
+                max_entries=config["result_cache_size"])
+        return self.result_cache
+
+    def tool(self, preprocess_func=None, create_workdir=None, cache=None,
+             sync_mode=None, resources=None):
+        # Each job works in its own workdir which is passed explicitly to
+        # storages and executors, so jobs can be processed concurrently.
+        # Workdirs are resolved against config["base_dir"] rather than the
+        # current working directory, which in-process tools may change.
         # When create_workdir is None, do not create workdir when fn is async
-        # and running locally to avoid chdir conflicts, create otherwise
+        # and running in the server process, since the working directory
+        # cannot be changed across awaits, create otherwise
+        # When cache is set (True for the server's result cache, or a
+        # ResultCache), identical calls with identical input artifacts
+        # return the cached result, and identical submissions return the
+        # job submitted before unless it failed
+        # sync_mode selects how the local executor runs the tool when it is
+        # synchronous ("inline", "thread" or "process"), and resources the
+        # CPUs and memory required by its local jobs, e.g. {"cpus": 4,
+        # "memory": "8G"}, unless the executor config of the call sets them
+        local_options = dict(resources or {})
+        if sync_mode is not None:
+            local_options["sync_mode"] = sync_mode
+
+        def with_local_options(executor):
+            if local_options and get_executor_type(executor) == "local":
+                return {"type": "local", **local_options, **(executor or {})}
+            return executor
+
         if preprocess_func is None:
             preprocess_func = self.preprocess_func
+        if cache is True:
+            result_cache = self.get_result_cache()
+        elif isinstance(cache, dict):
+            result_cache = ResultCache(**cache)
+        else:
+            result_cache = cache or None
 
         def decorator(fn: Callable) -> Callable:
             def submit_job(executor: Optional[dict] = None,
                            storage: Optional[dict] = None,
                            **kwargs) -> SubmitResult:
-                trace_id = datetime.today().strftime('%Y-%m-%d-%H:%M:%S.%f')
-                logger.info("Job processing (Trace ID: %s)" % trace_id)
-                if create_workdir is False:
-                    workdir = "."
-                else:
-                    workdir = trace_id
-                with set_directory(workdir):
+                metrics.set_job_labels(fn.__name__)
+                with metrics.time_phase("preprocess"):
                     if preprocess_func is not None:
                         executor, storage, kwargs = preprocess_func(
                             executor, storage, kwargs)
-                    job = {
-                        "tool_name": fn.__name__,
-                        "executor": executor,
-                        "storage": storage,
-                    }
-                    with open("job.json", "w") as f:
-                        json.dump(job, f, indent=4)
+                    metrics.set_job_labels(
+                        fn.__name__, get_executor_type(executor))
+                try:
+                    res = _submit_job_cached(executor, storage, kwargs)
+                except Exception:
+                    metrics.jobs_total.inc(
+                        tool=fn.__name__, mode="submit", status="Failed",
+                        executor_type=get_executor_type(executor))
+                    raise
+                metrics.jobs_total.inc(
+                    tool=fn.__name__, mode="submit", status="Cached"
+                    if res.job_info.get("cache_hit") else "Submitted",
+                    executor_type=get_executor_type(executor))
+                return res
+
+            def _submit_job_cached(executor, storage, kwargs):
+                key = None
+                if result_cache is not None:
+                    key = get_cache_key(fn, kwargs, storage)
+                if key is None:
+                    return _submit_job(executor, storage, kwargs)
+                with result_cache.key_lock(key):
+                    submitted = result_cache.get_job(key)
+                    if submitted is not None:
+                        job_id = submitted.job_info["job_id"]
+                        try:
+                            status = query_job_status(job_id)
+                        except Exception:
+                            status = "Failed"
+                        if status != "Failed":
+                            logger.info("Reuse job %s submitted with "
+                                        "identical arguments" % job_id)
+                            # callers get their own copy of the entry
+                            submitted = submitted.model_copy(deep=True)
+                            submitted.job_info["cache_hit"] = True
+                            return submitted
+                        result_cache.remove_job(key)
+                    res = _submit_job(executor, storage, kwargs)
+                    result_cache.set_job(key, res)
+                    return res
+
+            def _submit_job(executor, storage, kwargs):
+                executor = with_local_options(executor)
+                trace_id = new_trace_id()
+                logger.info("Job processing (Trace ID: %s)" % trace_id)
+                if create_workdir is False:
+                    trace_dir = "."
+                else:
+                    trace_dir = trace_id
+                workdir = os.path.normpath(
+                    os.path.join(config["base_dir"], trace_dir))
+                os.makedirs(workdir, exist_ok=True)
+                job = {
+                    "tool_name": fn.__name__,
+                    "executor": executor,
+                    "storage": storage,
+                }
+                dump_job_info(job, workdir)
+                executor_type, executor = init_executor(executor)
+                # jobs transferring artifacts remotely only get their URIs
+                remote = executor.remote_artifacts
+                download_timings = []
+                with metrics.time_phase("input_download"):
                     kwargs, input_artifacts = handle_input_artifacts(
-                        fn, kwargs, storage)
-                    executor_type, executor = init_executor(executor)
-                    res = executor.submit(fn, kwargs)
-                    exec_id = res["job_id"]
-                    job_id = "%s/%s" % (workdir, exec_id)
-                    logger.info("Job submitted (ID: %s)" % job_id)
+                        fn, kwargs, storage, self.download_concurrency,
+                        download_timings, self.artifact_cache, workdir,
+                        download=not remote)
+                options = {"storage": storage} if remote else {}
+                with metrics.time_phase("submit"):
+                    res = executor.submit(fn, kwargs, workdir=workdir,
+                                          **options)
+                exec_id = res["job_id"]
+                job_id = "%s/%s" % (trace_dir, exec_id)
+                register_job(job_id, workdir, fn.__name__, job["executor"],
+                             storage, executor_type=executor_type,
+                             input_artifacts=input_artifacts,
+                             extra_info=res.get("extra_info"))
+                logger.info("Job submitted (ID: %s)" % job_id)
                 result = SubmitResult(
                     job_id=job_id,
                     extra_info=res.get("extra_info"),
@@ -415,44 +1125,108 @@ class CalculationMCPServer:
                     "job_id": job_id,
                     "extra_info": res.get("extra_info"),
                     "input_artifacts": input_artifacts,
+                    "input_download_timings": download_timings,
                 })
 
             async def run_job(executor: Optional[dict] = None,
                               storage: Optional[dict] = None, **kwargs):
                 context = self.mcp.get_context()
-                trace_id = datetime.today().strftime('%Y-%m-%d-%H:%M:%S.%f')
+                metrics.set_job_labels(fn.__name__)
+                with metrics.time_phase("preprocess"):
+                    if preprocess_func is not None:
+                        executor, storage, kwargs = preprocess_func(
+                            executor, storage, kwargs)
+                    executor_type = get_executor_type(executor)
+                    metrics.set_job_labels(fn.__name__, executor_type)
+                labels = {"tool": fn.__name__, "executor_type": executor_type}
+                metrics.jobs_in_flight.inc(**labels)
+                try:
+                    key = None
+                    if result_cache is not None:
+                        key = await run_async(
+                            get_cache_key, fn, kwargs, storage)
+                    if key is None:
+                        result = await _run_job(
+                            executor, storage, kwargs, context)
+                        hit = False
+                    else:
+                        result, hit = await result_cache.get_or_run(
+                            key, lambda: _run_job(
+                                executor, storage, kwargs, context))
+                except Exception:
+                    metrics.jobs_total.inc(mode="run", status="Failed",
+                                           **labels)
+                    raise
+                finally:
+                    metrics.jobs_in_flight.dec(**labels)
+                if hit:
+                    # callers get their own copy of the cached result
+                    result = result.model_copy(deep=True)
+                    logger.info("Return cached result of job %s" %
+                                result.job_info["job_id"])
+                    result.job_info["cache_hit"] = True
+                metrics.jobs_total.inc(mode="run", status="Cached" if hit
+                                       else "Succeeded", **labels)
+                return result
+
+            async def _run_job(executor, storage, kwargs, context):
+                trace_id = new_trace_id()
                 logger.info("Job processing (Trace ID: %s)" % trace_id)
-                if preprocess_func is not None:
-                    executor, storage, kwargs = preprocess_func(
-                        executor, storage, kwargs)
+                executor = with_local_options(executor)
+                executor_config = executor
                 executor_type, executor = init_executor(executor)
                 if create_workdir is False or (
                     create_workdir is None and inspect.iscoroutinefunction(fn)
                         and executor_type == "local"):
-                    workdir = "."
+                    trace_dir = "."
                 else:
-                    workdir = trace_id
-                with set_directory(workdir):
-                    kwargs, input_artifacts = handle_input_artifacts(
-                        fn, kwargs, storage)
+                    trace_dir = trace_id
+                workdir = os.path.normpath(
+                    os.path.join(config["base_dir"], trace_dir))
+                os.makedirs(workdir, exist_ok=True)
+                download_timings = []
+                with metrics.time_phase("input_download"):
+                    downloading = ahandle_input_artifacts(
+                        fn, kwargs, storage, self.download_concurrency,
+                        download_timings, self.artifact_cache, workdir,
+                        download=not executor.remote_artifacts)
+                    kwargs, input_artifacts = await downloading
+                # excluding the submit, status polling and result
+                # collection phases timed by the executor itself
+                with metrics.time_phase("run"):
                     res = await executor.async_run(
-                        fn, kwargs, context, workdir)
-                    exec_id = res["job_id"]
-                    job_id = "%s/%s" % (workdir, exec_id)
-                    results = res["result"]
-                    results, output_artifacts = handle_output_artifacts(
-                        results, exec_id, storage)
-                    logger.info("Job %s result is %s" % (job_id, results))
-                    await context.log(level="info", message="Job %s result is"
-                                      " %s" % (job_id, results))
-                return JobResult(result=results, job_info={
+                        fn, kwargs, context, trace_dir, workdir=workdir,
+                        storage=storage)
+                exec_id = res["job_id"]
+                job_id = "%s/%s" % (trace_dir, exec_id)
+                results = res["result"]
+                output_artifacts = res.get("output_artifacts")
+                if output_artifacts is None:
+                    with metrics.time_phase("output_upload"):
+                        uploading = ahandle_output_artifacts(
+                            results, exec_id, storage, workdir=workdir)
+                        results, output_artifacts = await uploading
+                register_job(job_id, workdir, fn.__name__, executor_config,
+                             storage, executor_type=executor_type,
+                             status="Succeeded",
+                             input_artifacts=input_artifacts,
+                             output_artifacts=output_artifacts,
+                             extra_info=res.get("extra_info"))
+                logger.info("Job %s result is %s" % (job_id, results))
+                await context.log(level="info", message="Job %s result is"
+                                  " %s" % (job_id, results))
+                info = {
                     "trace_id": trace_id,
                     "executor_type": executor_type,
                     "job_id": job_id,
                     "extra_info": res.get("extra_info"),
                     "input_artifacts": input_artifacts,
+                    "input_download_timings": download_timings,
                     "output_artifacts": output_artifacts,
-                })
+                }
+                if res.get("accounting"):
+                    info["accounting"] = res["accounting"]
+                return JobResult(result=results, job_info=info)
 
             self.add_patched_tool(fn, run_job, fn.__name__, is_async=True)
             self.add_patched_tool(
@@ -461,9 +1235,41 @@ class CalculationMCPServer:
             self.add_tool(query_job_status)
             self.add_tool(terminate_job)
             self.add_tool(get_job_results)
+            self.add_tool(query_jobs_status)
+            self.add_tool(get_jobs_results)
+            self.add_tool(list_jobs)
             return fn
         return decorator
 
+    def collect_metrics(self):
+        """Metrics built from the job registry, caches and pools"""
+        extra = []
+        registry = get_job_registry()
+        if registry is not None:
+            metrics.jobs_running.clear()
+            for tool, executor_type, count in registry.count_running():
+                metrics.jobs_running.set(count, tool=tool,
+                                         executor_type=executor_type)
+        extra.extend(metrics.stats_metrics(
+            "dp_agent_pool", "Instance pool statistics", {
+                "storage": storage_pool.stats(),
+                "executor": executor_pool.stats(),
+            }, labelname="pool"))
+        scheduler = get_scheduler(create=False)
+        if scheduler is not None:
+            extra.extend(metrics.stats_metrics(
+                "dp_agent_scheduler", "Local job scheduler statistics",
+                scheduler.stats()))
+        if self.artifact_cache is not None:
+            extra.extend(metrics.stats_metrics(
+                "dp_agent_artifact_cache", "Artifact cache statistics",
+                self.artifact_cache.stats()))
+        if self.result_cache is not None:
+            extra.extend(metrics.stats_metrics(
+                "dp_agent_result_cache", "Result cache statistics",
+                self.result_cache.stats()))
+        return extra
+
     def run(self, **kwargs):
         if os.environ.get("DP_AGENT_RUNNING_MODE") in ["1", "true"]:
             return
@@ -471,6 +1277,17 @@ class CalculationMCPServer:
         async def health_check(request):
             return JSONResponse({"status": "ok"})
 
+        async def metrics_endpoint(request):
+            return PlainTextResponse(
+                metrics.registry.render(self.collect_metrics()),
+                media_type="text/plain; version=0.0.4")
+
+        async def artifact_cache_stats(request):
+            if self.artifact_cache is None:
+                return JSONResponse({"enabled": False})
+            return JSONResponse({"enabled": True,
+                                 **self.artifact_cache.stats()})
+
         self.mcp._custom_starlette_routes.append(
             Route(
                 "/health",
@@ -480,4 +1297,22 @@ class CalculationMCPServer:
                 include_in_schema=True,
             )
         )
+        self.mcp._custom_starlette_routes.append(
+            Route(
+                "/metrics",
+                endpoint=metrics_endpoint,
+                methods=["GET"],
+                name="metrics",
+                include_in_schema=True,
+            )
+        )
+        self.mcp._custom_starlette_routes.append(
+            Route(
+                "/artifact_cache",
+                endpoint=artifact_cache_stats,
+                methods=["GET"],
+                name="artifact_cache_stats",
+                include_in_schema=True,
+            )
+        )
         self.mcp.run(**kwargs)
@@ -1,34 +1,134 @@
 import asyncio
 import logging
+import os
+import random
 from abc import ABC, abstractmethod
 from collections.abc import Callable
-from typing import Any, Literal, TypedDict
+from typing import Any, List, Literal, Optional, Tuple, TypedDict
 
 from mcp.server.fastmcp.server import Context
 from mcp.shared.context import RequestContext
 from starlette.requests import Request
+
+from ..metrics import time_phase
+from ..storage import run_async
 logger = logging.getLogger(__name__)
+config = {
+    "poll_interval_min": float(os.environ.get(
+        "DP_AGENT_POLL_INTERVAL_MIN", "1")),
+    "poll_interval_max": float(os.environ.get(
+        "DP_AGENT_POLL_INTERVAL_MAX", "30")),
+    "poll_backoff_factor": float(os.environ.get(
+        "DP_AGENT_POLL_BACKOFF_FACTOR", "1.5")),
+    "poll_jitter": float(os.environ.get("DP_AGENT_POLL_JITTER", "0.1")),
+}
+
+
+class Backoff:
+    def __init__(self, initial=None, maximum=None, factor=None, jitter=None):
+        """
+        Exponential backoff with jitter for polling job status
+
+        Args:
+            initial: The first interval in seconds
+            maximum: The maximum interval in seconds
+            factor: The interval is multiplied by factor after each poll
+            jitter: Relative random jitter applied to each interval
+        """
+        self.interval = initial if initial is not None else \
+            config["poll_interval_min"]
+        self.maximum = maximum if maximum is not None else \
+            config["poll_interval_max"]
+        self.factor = factor if factor is not None else \
+            config["poll_backoff_factor"]
+        self.jitter = jitter if jitter is not None else config["poll_jitter"]
+
+    def next(self) -> float:
+        interval = min(self.interval, self.maximum)
+        self.interval = interval * self.factor
+        return interval * (1 + random.uniform(-self.jitter, self.jitter))
 
 
 class BaseExecutor(ABC):
+    """
+    All methods receive the workdir of the job explicitly, executors must
+    not rely on or change the working directory of the server process.
+    Executors whose jobs transfer artifacts themselves set remote_artifacts,
+    their submit receives the storage config of the call and the arguments
+    hold the URIs of input artifacts
+    """
+    remote_artifacts = False
+
     @abstractmethod
-    def submit(self, fn: Callable, kwargs: dict) -> TypedDict(
-            'results', {'job_id': str, 'extra_info': dict}):
+    def submit(self, fn: Callable, kwargs: dict, workdir: str = ".") -> \
+            TypedDict('results', {'job_id': str, 'extra_info': dict}):
         pass
 
+    async def async_submit(self, fn: Callable, kwargs: dict,
+                           workdir: str = ".", **options) -> \
+            TypedDict('results', {'job_id': str, 'extra_info': dict}):
+        """
+        Submit from the event loop, the blocking submit runs in a thread.
+        Executors whose submit waits for the job override it to wait
+        without holding a thread
+        """
+        return await run_async(self.submit, fn, kwargs, workdir=workdir,
+                               **options)
+
     @abstractmethod
-    def query_status(self, job_id: str) -> Literal[
-            "Running", "Succeeded", "Failed"]:
+    def query_status(self, job_id: str, workdir: str = ".") -> Literal[
+            "Pending", "Running", "Succeeded", "Failed"]:
         pass
 
     @abstractmethod
-    def terminate(self, job_id: str) -> None:
+    def terminate(self, job_id: str, workdir: str = ".") -> None:
         pass
 
     @abstractmethod
-    def get_results(self, job_id: str) -> dict:
+    def get_results(self, job_id: str, workdir: str = ".") -> dict:
         pass
 
+    def get_accounting(self, job_id: str, workdir: str = ".") -> dict:
+        """
+        Resource usage of a finished job, e.g. exit code, wall time, CPU
+        time and peak RSS, empty if the executor does not record it
+        """
+        return {}
+
+    def get_output_artifacts(self, job_id: str, workdir: str = "."
+                             ) -> Optional[dict]:
+        """
+        Output artifacts uploaded by a finished job itself, None if the
+        server uploads the Path results
+        """
+        return None
+
+    def query_status_batch(self, jobs: List[Tuple[str, str]]) -> list:
+        """
+        Query status of many jobs in one pass
+
+        Args:
+            jobs: (job_id, workdir) of the jobs
+        Returns:
+            The status of each job, or the exception raised querying it
+        """
+        statuses = []
+        for job_id, workdir in jobs:
+            try:
+                statuses.append(self.query_status(job_id, workdir=workdir))
+            except Exception as e:
+                statuses.append(e)
+        return statuses
+
+    async def wait_for_job(self, job_id: str, workdir: str = ".",
+                           timeout: float = 10) -> None:
+        """
+        Wait until the job may have finished or timeout seconds elapsed.
+        Executors which can be notified of job completion override it,
+        others just sleep between polls
+        """
+        await asyncio.sleep(timeout)
+
     def prune_context(self, kwargs: dict):
         for key, value in kwargs.items():
             if isinstance(value, Context):
@@ -51,27 +151,40 @@ class BaseExecutor(ABC):
 
     async def async_run(
         self, fn: Callable, kwargs: dict, context: Context,
-        trace_id: str) -> TypedDict(
-            'results', {'job_id': str, 'extra_info': dict, 'result': Any}):
-        info = self.submit(fn, kwargs)
+        trace_id: str, workdir: str = ".", storage: Optional[dict] = None
+    ) -> TypedDict('results', {'job_id': str, 'extra_info': dict,
+                               'result': Any}):
+        options = {"storage": storage} if self.remote_artifacts else {}
+        with time_phase("submit"):
+            info = await self.async_submit(fn, kwargs, workdir=workdir,
+                                           **options)
         job_id = info["job_id"]
         logger.info("Job submitted (ID: %s)" % job_id)
         await context.log(level="info", message="Job submitted (ID: %s/%s)"
                           % (trace_id, job_id))
         if info.get("extra_info"):
             await context.log(level="info", message=info["extra_info"])
-        while True:
-            status = self.query_status(job_id)
-            logger.info("Job %s status is %s" % (job_id, status))
-            await context.log(level="info", message="Job %s/%s status is %s"
-                              % (trace_id, job_id, status))
-            if status != "Running":
-                break
-            await asyncio.sleep(10)
+        backoff = Backoff()
+        with time_phase("status_polling"):
+            while True:
+                status = await run_async(self.query_status, job_id,
+                                         workdir=workdir)
+                logger.info("Job %s status is %s" % (job_id, status))
+                await context.log(level="info", message="Job %s/%s status "
+                                  "is %s" % (trace_id, job_id, status))
+                if status not in ["Pending", "Running"]:
+                    break
+                await self.wait_for_job(job_id, workdir, backoff.next())
         try:
-            result = self.get_results(job_id)
+            with time_phase("result_collection"):
+                result = await run_async(self.get_results, job_id,
+                                         workdir=workdir)
             logger.info("Job %s result is %s" % (job_id, result))
-            return {**info, "result": result}
+            return {**info, "result": result,
+                    "accounting": await run_async(
+                        self.get_accounting, job_id, workdir),
+                    "output_artifacts": await run_async(
+                        self.get_output_artifacts, job_id, workdir)}
         except Exception as e:
             logger.error("Job %s failed: %s" % (job_id, str(e)))
             await context.log(level="error", message="Job %s/%s failed: %s"
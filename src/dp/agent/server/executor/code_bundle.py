@@ -0,0 +1,129 @@
+import hashlib
+import os
+import threading
+import uuid
+import zipfile
+from typing import List
+
+from ..artifact_cache import link_file
+from ..utils import get_logger
+
+config = {
+    "bundle_dir": os.environ.get("DP_AGENT_BUNDLE_DIR", os.path.join(
+        os.path.expanduser("~"), ".cache", "dp_agent", "bundles")),
+}
+BUNDLE_EXTRACT_DIR = ".dp_agent_bundle"
+logger = get_logger(__name__)
+
+
+def iter_package_files(package: str):
+    """
+    Yield (path, archive name) of files in a package directory or a single
+    module file, skipping bytecode caches
+    """
+    package = os.path.abspath(package)
+    base = os.path.dirname(package)
+    if os.path.isfile(package):
+        yield package, os.path.basename(package)
+        return
+    for root, dirs, files in os.walk(package, followlinks=True):
+        dirs[:] = sorted(d for d in dirs if d != "__pycache__")
+        for f in sorted(files):
+            if f.endswith((".pyc", ".pyo")):
+                continue
+            path = os.path.join(root, f)
+            yield path, os.path.relpath(path, base)
+
+
+class CodeBundleManager:
+    def __init__(self, bundle_dir: str = None):
+        """
+        Build content-hashed zip bundles of the python packages forwarded to
+        jobs. A bundle is built once for each set of package contents and
+        reused by all jobs until a package changes
+
+        Args:
+            bundle_dir: Directory of the bundles, DP_AGENT_BUNDLE_DIR by
+                default
+        """
+        self.bundle_dir = bundle_dir or config["bundle_dir"]
+        self._lock = threading.Lock()
+        # (packages, stat fingerprint) -> bundle path, avoids reading the
+        # packages again if no file has changed
+        self._bundles = {}
+        self.builds = 0
+
+    def fingerprint(self, packages: List[str]):
+        h = hashlib.sha256()
+        for package in packages:
+            for path, name in iter_package_files(package):
+                st = os.stat(path)
+                h.update(("%s\0%s\0%s\0" % (
+                    name, st.st_size, st.st_mtime_ns)).encode())
+        return h.hexdigest()
+
+    def get(self, packages: List[str]) -> str:
+        """Return the path of the bundle of packages, build it if needed"""
+        packages = sorted(set(os.path.abspath(p) for p in packages))
+        key = (tuple(packages), self.fingerprint(packages))
+        with self._lock:
+            path = self._bundles.get(key)
+            if path is not None and os.path.isfile(path):
+                return path
+            path = self._build(packages)
+            self._bundles[key] = path
+            return path
+
+    def _build(self, packages):
+        files = []
+        h = hashlib.sha256()
+        for package in packages:
+            for path, name in iter_package_files(package):
+                with open(path, "rb") as f:
+                    data = f.read()
+                h.update(name.encode() + b"\0")
+                h.update(hashlib.sha256(data).digest())
+                files.append((name, data))
+        digest = h.hexdigest()[:32]
+        os.makedirs(self.bundle_dir, exist_ok=True)
+        path = os.path.join(self.bundle_dir, "bundle-%s.zip" % digest)
+        if os.path.isfile(path):
+            return path
+        tmp = "%s.%s.tmp" % (path, uuid.uuid4().hex)
+        with zipfile.ZipFile(tmp, "w", zipfile.ZIP_DEFLATED) as zf:
+            for name, data in files:
+                zf.writestr(name, data)
+        os.replace(tmp, path)
+        self.builds += 1
+        logger.info("Built code bundle %s of %s" % (path, packages))
+        return path
+
+    def link(self, packages: List[str], workdir: str) -> str:
+        """Materialize the bundle in workdir, return its file name"""
+        path = self.get(packages)
+        name = os.path.basename(path)
+        link_file(path, os.path.join(workdir, name))
+        return name
+
+
+def get_bootstrap_script(bundle: str) -> str:
+    """
+    Script lines extracting the bundle next to the job once and putting it
+    first on sys.path
+    """
+    digest = bundle[len("bundle-"):-len(".zip")]
+    script = "import os, sys, zipfile\n"
+    script += "bundle_dir = os.path.abspath(os.path.join(%r, %r))\n" % (
+        BUNDLE_EXTRACT_DIR, digest)
+    script += "if not os.path.isdir(bundle_dir):\n"
+    script += "    tmp_dir = bundle_dir + '.%d' % os.getpid()\n"
+    script += "    zipfile.ZipFile(%r).extractall(tmp_dir)\n" % bundle
+    script += "    try:\n"
+    script += "        os.rename(tmp_dir, bundle_dir)\n"
+    script += "    except OSError:\n"
+    script += "        pass\n"
+    script += "sys.path.insert(0, bundle_dir)\n"
+    return script
+
+
+bundle_manager = CodeBundleManager()
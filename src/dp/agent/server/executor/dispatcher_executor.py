@@ -3,8 +3,15 @@ import inspect
 import json
 import logging
 import os
+import pickle
 import sys
+import threading
 import time
+import uuid
+import zlib
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+from copy import deepcopy
 from pathlib import Path
 
 import jsonpickle
@@ -12,6 +19,8 @@ from dpdispatcher import Machine, Resources, Task, Submission
 from dpdispatcher.utils.job_status import JobStatus
 
 from .base_executor import BaseExecutor
+from .code_bundle import bundle_manager, get_bootstrap_script
+from ..remote_artifacts import OUTPUT_ARTIFACTS_FILE
 from .... import __path__
 
 config = {
@@ -22,7 +31,15 @@ config = {
     "app_key": os.environ.get("BOHRIUM_APP_KEY", "agent"),
     "bohrium_url": os.environ.get("BOHRIUM_BOHRIUM_URL",
                                   "https://bohrium.dp.tech"),
+    "query_concurrency": int(os.environ.get("DP_AGENT_QUERY_CONCURRENCY",
+                                            "8")),
+    "status_interval": float(os.environ.get("DP_AGENT_STATUS_INTERVAL",
+                                            "10")),
+    "batch_size": int(os.environ.get("DP_AGENT_BATCH_SIZE", "1")),
+    "batch_window": float(os.environ.get("DP_AGENT_BATCH_WINDOW", "1")),
 }
+PAYLOAD_FILE = "payload.bin"
+BATCH_FILE = "batch.json"
 logger = logging.getLogger(__name__)
 
 
@@ -34,19 +51,32 @@ def get_source_code(fn):
     return "".join(pre_lines + source_lines) + "\n"
 
 
-def get_func_def_script(fn):
+def get_func_def_script(fn, functions=None):
+    """
+    Script lines defining fn in the job and the packages it requires.
+    Functions which cannot be imported are cloudpickled, into functions
+    (loaded from the payload file by the job) if given, inline otherwise
+    """
     script = ""
     packages = []
     fn_name = fn.__name__
     module_name = fn.__module__
     module = sys.modules[module_name]
-    if getattr(module, fn_name, None) is not fn:
-        # cannot import from module, maybe a local function
+
+    def pickle_fn():
         import cloudpickle
         packages.extend(cloudpickle.__path__)
-        script += "import cloudpickle\n"
-        script += "%s = cloudpickle.loads(%s)\n" % \
-            (fn_name, cloudpickle.dumps(fn))
+        script = "import cloudpickle\n"
+        if functions is not None:
+            functions[fn_name] = cloudpickle.dumps(fn)
+            return script + "%s = cloudpickle.loads(payload['functions']" \
+                "[%r])\n" % (fn_name, fn_name)
+        return script + "%s = cloudpickle.loads(%s)\n" % (
+            fn_name, cloudpickle.dumps(fn))
+
+    if getattr(module, fn_name, None) is not fn:
+        # cannot import from module, maybe a local function
+        script += pickle_fn()
     elif module_name in ["__main__", "__mp_main__"]:
         if hasattr(module, "__file__"):
             name = os.path.splitext(os.path.basename(module.__file__))[0]
@@ -62,11 +92,7 @@ def get_func_def_script(fn):
                 script += "from %s import %s\n" % (name, fn_name)
         else:
             # cannot get file of __main__, maybe in the interactive mode
-            import cloudpickle
-            packages.extend(cloudpickle.__path__)
-            script += "import cloudpickle\n"
-            script += "%s = cloudpickle.loads(%s)\n" % \
-                (fn_name, cloudpickle.dumps(fn))
+            script += pickle_fn()
     else:
         package_name = module_name.split('.')[0]
         module = importlib.import_module(package_name)
@@ -78,6 +104,337 @@ def get_func_def_script(fn):
     return script, packages
 
 
+def generate_script(fn_name: str, func_def_script: str, is_async: bool,
+                    header: str = "", raise_error: bool = True,
+                    artifacts: bool = False) -> str:
+    """
+    Generate the script of a job calling fn_name defined by
+    func_def_script, with the arguments (and pickled functions) loaded from
+    the payload file written by write_payload. It does not depend on the
+    arguments, so the script stays small whatever the arguments are.
+    If raise_error is False, the script exits normally after recording an
+    error, so that a failed task does not fail the other tasks of its job.
+    If artifacts is True, the script downloads the input artifacts and
+    uploads the output artifacts itself with the storage in the payload
+    """
+    script = header
+    script += "import asyncio, jsonpickle, os, pickle, shutil, zlib\n"
+    script += "from pathlib import Path\n\n"
+    script += "if __name__ == \"__main__\":\n"
+    script += "    cwd = os.getcwd()\n"
+    script += "    with open(%r, 'rb') as f:\n" % PAYLOAD_FILE
+    script += "        payload = pickle.loads(zlib.decompress(f.read()))\n"
+    script += "    kwargs = payload['kwargs']\n"
+    script += "    if payload['format'] == 'jsonpickle':\n"
+    script += "        kwargs = jsonpickle.loads(kwargs)\n"
+    script += "    try:\n"
+    for line in func_def_script.splitlines():
+        if line:
+            script += "        " + line + "\n"
+    if artifacts:
+        script += "        from dp.agent.server.remote_artifacts " \
+            "import download_inputs, remove_inputs, upload_outputs\n"
+        script += "        kwargs = download_inputs(%s, kwargs, " \
+            "payload['storage'])\n" % fn_name
+    if is_async:
+        script += "        results = asyncio.run(%s(**kwargs))\n" % fn_name
+    else:
+        script += "        results = %s(**kwargs)\n" % fn_name
+        script += "        result_dir = None\n"
+        script += "        import uuid\n"
+        script += "        if isinstance(results, dict):\n"
+        script += "            for name in results:\n"
+        script += "                if isinstance(results[name], Path):\n"
+        script += "                    if not results[name].absolute().is_relative_to(cwd):\n"
+        script += "                        if result_dir is None:\n"
+        script += "                            result_dir = Path('result_files_dir_' + str(uuid.uuid4()))\n"
+        script += "                            result_dir.mkdir(parents=True, exist_ok=True)\n"
+        script += "                        dest_path = result_dir / results[name].absolute().relative_to('/')\n"
+        script += "                        dest_path.parent.mkdir(parents=True, exist_ok=True)\n"
+        script += "                        if results[name].is_file():\n"
+        script += "                            shutil.copy2(results[name], dest_path)\n"
+        script += "                        elif results[name].is_dir():\n"
+        script += "                            shutil.copytree(results[name], dest_path, dirs_exist_ok=True)\n"
+        script += "                        results[name] = dest_path.absolute().relative_to(cwd)\n"
+        script += "                    else:\n"
+        script += "                        results[name] = results[name].absolute().relative_to(cwd)\n"
+    if artifacts:
+        script += "        os.chdir(cwd)\n"
+        # the transferred artifacts are not downloaded back with the
+        # results
+        script += "        results, output_artifacts = upload_outputs(" \
+            "results, payload['storage'], remove=True)\n"
+        script += "        remove_inputs()\n"
+        script += "        with open(%r, 'w') as f:\n" % \
+            OUTPUT_ARTIFACTS_FILE
+        script += "            f.write(jsonpickle.dumps(output_artifacts))\n"
+    script += "    except Exception as e:\n"
+    script += "        os.chdir(cwd)\n"
+    script += "        with open('err', 'w') as f:\n"
+    script += "            f.write(str(e))\n"
+    if raise_error:
+        script += "        raise e\n"
+    else:
+        script += "        import traceback\n"
+        script += "        traceback.print_exc()\n"
+        script += "        raise SystemExit(0)\n"
+    script += "    os.chdir(cwd)\n"
+    script += "    with open('results.txt', 'w') as f:\n"
+    script += "        f.write(jsonpickle.dumps(results))\n"
+    return script
+
+
+def write_payload(path: str, kwargs: dict, functions: dict,
+                  storage: dict = None) -> None:
+    """
+    Write the arguments and pickled functions of a job to a compressed
+    binary payload file. The arguments are pickled, which is several times
+    faster to load than jsonpickle, falling back to jsonpickle for objects
+    which cannot be pickled
+    """
+    payload = {"format": "pickle", "kwargs": kwargs, "functions": functions,
+               "storage": storage}
+    try:
+        data = pickle.dumps(payload, protocol=4)
+    except Exception:
+        payload.update(format="jsonpickle", kwargs=jsonpickle.dumps(kwargs))
+        data = pickle.dumps(payload, protocol=4)
+    with open(path, "wb") as f:
+        f.write(zlib.compress(data))
+
+
+class SubmissionEntry:
+    def __init__(self, workdir, submission, status):
+        self.workdir = workdir
+        self.submission = submission
+        self.status = status
+
+
+class StatusPoller:
+    def __init__(self, executor, interval: float, max_finished: int = 1024):
+        """
+        Keep submissions of an executor in memory and refresh the active
+        ones together in a background thread every interval seconds, so
+        that querying status does not reach the remote machine
+
+        Args:
+            executor: The DispatcherExecutor loading and checking
+                submissions
+            interval: Seconds between refreshing passes
+            max_finished: The number of finished submissions whose status
+                is kept
+        """
+        self.executor = executor
+        self.interval = interval
+        self.max_finished = max_finished
+        self._lock = threading.Lock()
+        self._active = {}
+        self._finished = OrderedDict()
+        self._thread = None
+        self.passes = 0
+
+    def query(self, job_id: str, workdir: str = ".") -> str:
+        with self._lock:
+            if job_id in self._finished:
+                return self._finished[job_id]
+            entry = self._active.get(job_id)
+            if entry is not None:
+                return entry.status
+        # not tracked yet, e.g. submitted before the server restarted
+        submission = self.executor.load_submission(job_id, workdir)
+        status = self.executor.check_submission(submission, workdir)
+        self._set(job_id, SubmissionEntry(workdir, submission, status))
+        return status
+
+    def add(self, job_id: str, workdir: str, submission) -> None:
+        self._set(job_id, SubmissionEntry(workdir, submission, "Running"))
+
+    def forget(self, job_id: str):
+        """Stop tracking a submission, return it if it was still active"""
+        with self._lock:
+            entry = self._active.pop(job_id, None)
+            self._finished.pop(job_id, None)
+        return entry.submission if entry is not None else None
+
+    def _set(self, job_id, entry):
+        with self._lock:
+            if entry.status == "Running":
+                self._active[job_id] = entry
+                if self._thread is None:
+                    self._thread = threading.Thread(
+                        target=self._run, name="status-poller", daemon=True)
+                    self._thread.start()
+            else:
+                self._active.pop(job_id, None)
+                self._finished[job_id] = entry.status
+                while len(self._finished) > self.max_finished:
+                    self._finished.popitem(last=False)
+
+    def _check(self, item):
+        job_id, entry = item
+        try:
+            return self.executor.check_submission(
+                entry.submission, entry.workdir)
+        except Exception as e:
+            logger.error("Failed to refresh submission %s: %s" % (job_id, e))
+            return "Running"
+
+    def refresh(self) -> None:
+        """Refresh all active submissions in one pass"""
+        with self._lock:
+            items = list(self._active.items())
+        if not items:
+            return
+        with ThreadPoolExecutor(max_workers=min(
+                len(items), config["query_concurrency"])) as pool:
+            statuses = list(pool.map(self._check, items))
+        for (job_id, entry), status in zip(items, statuses):
+            with self._lock:
+                if self._active.get(job_id) is not entry:
+                    # forgotten or replaced meanwhile
+                    continue
+            entry.status = status
+            if status != "Running":
+                self._set(job_id, entry)
+        self.passes += 1
+
+    def _run(self):
+        while True:
+            time.sleep(self.interval)
+            self.refresh()
+            with self._lock:
+                if not self._active:
+                    self._thread = None
+                    return
+
+    def stats(self):
+        with self._lock:
+            return {"active": len(self._active),
+                    "finished": len(self._finished),
+                    "passes": self.passes}
+
+
+class PendingBatch:
+    def __init__(self, fn):
+        self.fn = fn
+        # job ID -> (kwargs, workdir, storage)
+        self.calls = OrderedDict()
+        self.created = time.time()
+        self.closed = False
+
+    def has_workdir(self, workdir):
+        return any(call[1] == workdir for call in self.calls.values())
+
+
+class TaskBatcher:
+    def __init__(self, executor, size: int, window: float):
+        """
+        Gather calls of the same tool over a window of time and submit them
+        together by executor.submit_batch in a background thread
+
+        Args:
+            executor: The DispatcherExecutor submitting the batches
+            size: The maximum number of calls of a batch, a full batch is
+                submitted without waiting
+            window: Seconds to wait for more calls since the first call of a
+                batch
+        """
+        self.executor = executor
+        self.size = size
+        self.window = window
+        self._cond = threading.Condition()
+        self._open = {}
+        self._ready = []
+        self._pending = {}
+        self._thread = None
+        self.batches = 0
+
+    def add(self, fn, kwargs: dict, workdir: str, storage: dict = None
+            ) -> str:
+        """Add a call to the open batch of fn, return its job ID"""
+        job_id = uuid.uuid4().hex
+        with self._cond:
+            batch = self._open.get(fn)
+            if batch is not None and batch.has_workdir(workdir):
+                # tasks of a submission cannot share a directory
+                self._close(fn)
+                batch = None
+            if batch is None:
+                batch = self._open[fn] = PendingBatch(fn)
+            batch.calls[job_id] = (kwargs, workdir, storage)
+            self._pending[job_id] = batch
+            if len(batch.calls) >= self.size:
+                self._close(fn)
+            if self._thread is None:
+                self._thread = threading.Thread(
+                    target=self._run, name="task-batcher", daemon=True)
+                self._thread.start()
+            self._cond.notify()
+        return job_id
+
+    def _close(self, fn):
+        batch = self._open.pop(fn)
+        batch.closed = True
+        self._ready.append(batch)
+
+    def is_pending(self, job_id: str) -> bool:
+        with self._cond:
+            return job_id in self._pending
+
+    def cancel(self, job_id: str) -> bool:
+        """Remove a call not submitted yet, return whether it is removed"""
+        with self._cond:
+            batch = self._pending.get(job_id)
+            if batch is None or (batch.closed and batch not in self._ready):
+                # being submitted
+                return False
+            del self._pending[job_id]
+            del batch.calls[job_id]
+            if not batch.calls:
+                if batch.closed:
+                    self._ready.remove(batch)
+                else:
+                    del self._open[batch.fn]
+            return True
+
+    def flush(self) -> None:
+        """Submit the open batches without waiting for their windows"""
+        with self._cond:
+            for fn in list(self._open):
+                self._close(fn)
+            self._cond.notify()
+
+    def _run(self):
+        while True:
+            with self._cond:
+                now = time.time()
+                for fn, batch in list(self._open.items()):
+                    if now >= batch.created + self.window:
+                        self._close(fn)
+                if not self._ready:
+                    if not self._open:
+                        self._thread = None
+                        return
+                    self._cond.wait(min(
+                        b.created for b in self._open.values()) +
+                        self.window - now)
+                    continue
+                batch = self._ready.pop(0)
+            try:
+                self.executor.submit_batch(batch)
+            except Exception as e:
+                logger.error("Failed to submit batch: %s" % e)
+            with self._cond:
+                for job_id in batch.calls:
+                    self._pending.pop(job_id, None)
+                self.batches += 1
+
+    def stats(self):
+        with self._cond:
+            return {"pending": len(self._pending),
+                    "batches": self.batches}
+
+
 class DispatcherExecutor(BaseExecutor):
     def __init__(
             self,
@@ -85,6 +442,12 @@ class DispatcherExecutor(BaseExecutor):
             resources=None,
             python_packages=None,
             python_executable="python3",
+            status_interval=None,
+            bundle_code=True,
+            batch_size=None,
+            batch_window=None,
+            group_size=None,
+            remote_artifacts=False,
     ):
         """Use DPDispatcher to execute the tool
         Refer to https://docs.deepmodeling.com/projects/dpdispatcher.
@@ -95,6 +458,28 @@ class DispatcherExecutor(BaseExecutor):
             python_packages: Additional python packages uploaded to runtime
                 environment
             python_executable: Python executable path for running the tool
+            status_interval: Refresh status of submitted jobs in the
+                background every status_interval seconds and answer status
+                queries from memory, DP_AGENT_STATUS_INTERVAL by default, 0
+                to query the remote machine on every call
+            bundle_code: Forward python packages as a content-hashed zip
+                bundle built once and extracted by the job, instead of
+                forwarding the package directories with every job
+            batch_size: Gather up to batch_size calls of the same tool and
+                submit them as the tasks of one submission. Batching is
+                opt-in: DP_AGENT_BATCH_SIZE defaults to 1, submitting every
+                call alone. Each call keeps its own job ID, status and
+                results, but terminating a batched call is best-effort: it
+                fails at once while its task keeps running until every call
+                of the submission is terminated, then the submission is
+                killed
+            batch_window: Seconds to wait for more calls before submitting
+                a batch which is not full, DP_AGENT_BATCH_WINDOW by default
+            group_size: The number of tasks of a batch run by each job of
+                the submission, all of them by default
+            remote_artifacts: Download the input artifacts and upload the
+                output artifacts on the compute node with the storage
+                config of the call, the server only handles their URIs
         """
         self.machine = machine or {}
         self.resources = resources or {}
@@ -102,7 +487,25 @@ class DispatcherExecutor(BaseExecutor):
         self.python_packages.extend(__path__)
         self.python_packages.extend(jsonpickle.__path__)
         self.python_executable = python_executable
+        self.bundle_code = bundle_code
         self.set_defaults()
+        if status_interval is None:
+            status_interval = config["status_interval"]
+        self.poller = StatusPoller(self, status_interval) \
+            if status_interval > 0 else None
+        if batch_size is None:
+            batch_size = config["batch_size"]
+        if batch_window is None:
+            batch_window = config["batch_window"]
+        self.batcher = TaskBatcher(self, batch_size, batch_window) \
+            if batch_size > 1 else None
+        self.group_size = group_size
+        self.remote_artifacts = remote_artifacts
+        self._lock = threading.Lock()
+        # job ID -> batch info of recent batched calls, also kept in the
+        # workdir of each call
+        self._batch_info = OrderedDict()
+        self.max_batch_info = 4096
 
     def set_defaults(self):
         self.machine["local_root"] = "."
@@ -128,92 +531,23 @@ class DispatcherExecutor(BaseExecutor):
             self.resources["envs"] = {}
         self.resources["envs"]["DP_AGENT_RUNNING_MODE"] = "1"
 
-    def submit(self, fn, kwargs):
-        kwargs = self.prune_context(kwargs)
-        script = ""
-        fn_name = fn.__name__
-        func_def_script, packages = get_func_def_script(fn)
-        self.python_packages.extend(packages)
-
-        script += "import asyncio, jsonpickle, os, shutil\n"
-        script += "from pathlib import Path\n\n"
-        script += "if __name__ == \"__main__\":\n"
-        script += "    cwd = os.getcwd()\n"
-        script += "    kwargs = jsonpickle.loads(%s)\n" % repr(
-            jsonpickle.dumps(kwargs))
-        script += "    try:\n"
-        for line in func_def_script.splitlines():
-            if line:
-                script += "        " + line + "\n"
-        if inspect.iscoroutinefunction(fn):
-            script += "        results = asyncio.run(%s(**kwargs))\n" % fn_name
-        else:
-            script += "        results = %s(**kwargs)\n" % fn_name
-            script += "        result_dir = None\n"
-            script += "        import uuid\n"
-            script += "        if isinstance(results, dict):\n"
-            script += "            for name in results:\n"
-            script += "                if isinstance(results[name], Path):\n"
-            script += "                    if not results[name].absolute().is_relative_to(cwd):\n"
-            script += "                        if result_dir is None:\n"
-            script += "                            result_dir = Path('result_files_dir_' + str(uuid.uuid4()))\n"
-            script += "                            result_dir.mkdir(parents=True, exist_ok=True)\n"
-            script += "                        dest_path = result_dir / results[name].absolute().relative_to('/')\n"
-            script += "                        dest_path.parent.mkdir(parents=True, exist_ok=True)\n"
-            script += "                        if results[name].is_file():\n"
-            script += "                            shutil.copy2(results[name], dest_path)\n"
-            script += "                        elif results[name].is_dir():\n"
-            script += "                            shutil.copytree(results[name], dest_path, dirs_exist_ok=True)\n"
-            script += "                        results[name] = dest_path.absolute().relative_to(cwd)\n"
-            script += "                    else:\n"
-            script += "                        results[name] = results[name].absolute().relative_to(cwd)\n"
-        script += "    except Exception as e:\n"
-        script += "        os.chdir(cwd)\n"
-        script += "        with open('err', 'w') as f:\n"
-        script += "            f.write(str(e))\n"
-        script += "        raise e\n"
-        script += "    os.chdir(cwd)\n"
-        script += "    with open('results.txt', 'w') as f:\n"
-        script += "        f.write(jsonpickle.dumps(results))\n"
-        with open("script.py", "w") as f:
-            f.write(script)
-
-        forward_files = ["script.py"]
-        for package in self.python_packages:
-            target = os.path.basename(package)
-            if os.path.abspath(package) != os.path.abspath(target):
-                if os.path.islink(target):
-                    os.remove(target)
-                os.symlink(package, target)
-            if target not in forward_files:
-                forward_files.append(target)
-        for value in kwargs.values():
-            if isinstance(value, Path):
-                forward_files.append(str(value))
+    def get_machine(self, workdir):
+        machine = deepcopy(self.machine)
+        machine["local_root"] = workdir
+        return machine
 
-        task = {
-            "task_work_path": "./",
-            "outlog": "log",
-            "errlog": "log",
-            "command": self.python_executable + " script.py",
-            "forward_files": forward_files,
-        }
-
-        if self.machine.get("context_type") == "Bohrium":
-            self.machine["remote_profile"]["input_data"]["job_name"] = fn_name
-        elif self.machine.get("context_type") == "OpenAPI":
-            self.machine["remote_profile"]["job_name"] = fn_name
-        # ensure submitting a new job
-        self.resources["envs"]["SUBMISSION_TIMESTAMP"] = str(time.time())
-
-        machine = Machine.load_from_dict(self.machine)
-        resources = Resources.load_from_dict(self.resources)
-        task = Task.load_from_dict(task)
-        submission = Submission(
-            work_base='.', machine=machine, resources=resources,
-            task_list=[task])
-        submission.run_submission(exit_on_submit=True)
+    def submit(self, fn, kwargs, workdir=".", storage=None):
+        kwargs = self.prune_context(kwargs)
+        if self.batcher is not None:
+            job_id = self.batcher.add(fn, kwargs, os.path.abspath(workdir),
+                                      storage)
+            self.write_batch_info(workdir, {"job_id": job_id})
+            return {"job_id": job_id}
+        task = self.prepare_task(fn, kwargs, workdir, storage=storage)
+        submission = self.run_tasks(fn.__name__, workdir, [task])
         res = {"job_id": submission.submission_hash}
+        if self.poller is not None:
+            self.poller.add(submission.submission_hash, workdir, submission)
         if self.machine.get("context_type") == "Bohrium":
             job_id = submission.belonging_jobs[0].job_id
             bohr_job_id, bohr_group_id = job_id.split(":job_group_id:")
@@ -236,11 +570,173 @@ class DispatcherExecutor(BaseExecutor):
             res["extra_info"] = extra_info
         return res
 
-    def query_status(self, job_id):
-        machine = Machine.load_from_dict(self.machine)
+    def prepare_task(self, fn, kwargs, workdir=".", raise_error=True,
+                     storage=None):
+        """
+        Write the script and the payload of calling fn with kwargs into
+        workdir, return the DPDispatcher task running it there. storage is
+        the storage config used by the job to transfer artifacts if
+        remote_artifacts is set
+        """
+        script = ""
+        fn_name = fn.__name__
+        functions = {}
+        func_def_script, packages = get_func_def_script(fn, functions)
+        # the executor may be reused across jobs, do not accumulate packages
+        python_packages = self.python_packages + [
+            p for p in packages if p not in self.python_packages]
+
+        forward_files = ["script.py", PAYLOAD_FILE]
+        if self.bundle_code:
+            bundle = bundle_manager.link(python_packages, workdir)
+            forward_files.append(bundle)
+            script += get_bootstrap_script(bundle)
+        else:
+            for package in python_packages:
+                target = os.path.basename(package)
+                link = os.path.join(workdir, target)
+                if os.path.abspath(package) != os.path.abspath(link):
+                    if os.path.islink(link):
+                        os.remove(link)
+                    os.symlink(package, link)
+                if target not in forward_files:
+                    forward_files.append(target)
+        script = generate_script(fn_name, func_def_script,
+                                 inspect.iscoroutinefunction(fn), script,
+                                 raise_error, self.remote_artifacts)
+        with open(os.path.join(workdir, "script.py"), "w") as f:
+            f.write(script)
+        write_payload(os.path.join(workdir, PAYLOAD_FILE), kwargs, functions,
+                      storage)
+
+        for value in kwargs.values():
+            if isinstance(value, Path):
+                forward_files.append(str(value))
+
+        return {
+            "task_work_path": "./",
+            "outlog": "log",
+            "errlog": "log",
+            "command": self.python_executable + " script.py",
+            "forward_files": forward_files,
+        }
+
+    def run_tasks(self, job_name, workdir, tasks, group_size=None):
+        """Submit tasks as one submission rooted at workdir"""
+        machine = self.get_machine(workdir)
+        resources = deepcopy(self.resources)
+        if group_size is not None:
+            resources["group_size"] = group_size
+        if machine.get("context_type") == "Bohrium":
+            machine["remote_profile"]["input_data"]["job_name"] = job_name
+        elif machine.get("context_type") == "OpenAPI":
+            machine["remote_profile"]["job_name"] = job_name
+        # ensure submitting a new job
+        resources["envs"]["SUBMISSION_TIMESTAMP"] = str(time.time())
+
+        machine = Machine.load_from_dict(machine)
+        resources = Resources.load_from_dict(resources)
+        submission = Submission(
+            work_base='.', machine=machine, resources=resources,
+            task_list=[Task.load_from_dict(task) for task in tasks])
+        submission.run_submission(exit_on_submit=True)
+        return submission
+
+    def submit_batch(self, batch):
+        """
+        Submit the calls of a batch as the tasks of one submission rooted at
+        the common parent of their workdirs, and record where each call went
+        """
+        calls = list(batch.calls.items())
+        root = os.path.commonpath([call[1] for _, call in calls])
+        try:
+            tasks = []
+            for job_id, (kwargs, workdir, storage) in calls:
+                task = self.prepare_task(batch.fn, kwargs, workdir,
+                                         raise_error=False, storage=storage)
+                task["task_work_path"] = os.path.relpath(workdir, root) + "/"
+                tasks.append(task)
+            submission = self.run_tasks(batch.fn.__name__, root, tasks,
+                                        self.group_size or len(tasks))
+        except Exception as e:
+            logger.error("Failed to submit batch of %s: %s" % (
+                batch.fn.__name__, e))
+            for job_id, (_, workdir, _) in calls:
+                with open(os.path.join(workdir, "err"), "w") as f:
+                    f.write("Failed to submit batch: %s" % e)
+                self.write_batch_info(workdir, {"job_id": job_id})
+            return
+        logger.info("Submitted %s calls of %s as submission %s" % (
+            len(calls), batch.fn.__name__, submission.submission_hash))
+        if self.poller is not None:
+            self.poller.add(submission.submission_hash, root, submission)
+        terminated = False
+        for job_id, (_, workdir, _) in calls:
+            info = self.get_batch_info(job_id, workdir) or {}
+            info = {
+                "job_id": job_id,
+                "submission": submission.submission_hash,
+                "root": root,
+                "calls": [[j, call[1]] for j, call in calls],
+                # terminated while being submitted
+                "terminated": info.get("terminated", False),
+            }
+            self.write_batch_info(workdir, info)
+            terminated = terminated or info["terminated"]
+        if terminated:
+            self.terminate_batch(info)
+
+    def write_batch_info(self, workdir, info):
+        with open(os.path.join(workdir, BATCH_FILE), "w") as f:
+            json.dump(info, f)
+        with self._lock:
+            self._batch_info[info["job_id"]] = info
+            while len(self._batch_info) > self.max_batch_info:
+                self._batch_info.popitem(last=False)
+
+    def get_batch_info(self, job_id, workdir="."):
+        """Where a batched call went, None for calls not batched"""
+        with self._lock:
+            info = self._batch_info.get(job_id)
+        if info is not None:
+            return info
+        path = os.path.join(workdir, BATCH_FILE)
+        if os.path.isfile(path):
+            with open(path, "r") as f:
+                info = json.load(f)
+            if info["job_id"] == job_id:
+                return info
+        return None
+
+    def load_submission(self, job_id, workdir="."):
+        machine = Machine.load_from_dict(self.get_machine(workdir))
         content = machine.context.read_file(job_id + ".json")
-        submission = Submission.deserialize(
-            submission_dict=json.loads(content))
+        return Submission.deserialize(submission_dict=json.loads(content))
+
+    def query_status(self, job_id, workdir="."):
+        if self.batcher is not None and self.batcher.is_pending(job_id):
+            return "Pending"
+        info = self.get_batch_info(job_id, workdir)
+        if info is None:
+            return self.query_submission(job_id, workdir)
+        if info.get("terminated") or "submission" not in info:
+            # terminated, failed to submit or lost before submitted
+            return "Failed"
+        status = self.query_submission(info["submission"], info["root"])
+        if status == "Running":
+            return "Running"
+        if os.path.isfile(os.path.join(workdir, "results.txt")):
+            return "Succeeded"
+        return "Failed"
+
+    def query_submission(self, submission_hash, workdir="."):
+        if self.poller is not None:
+            return self.poller.query(submission_hash, workdir)
+        return self.check_submission(
+            self.load_submission(submission_hash, workdir), workdir)
+
+    def check_submission(self, submission, workdir="."):
+        """Refresh the state of a submission, retry or download results"""
         submission.update_submission_state()
         if not submission.check_all_finished() and not any(
             job.job_state in [JobStatus.terminated, JobStatus.unknown,
@@ -253,26 +749,84 @@ class DispatcherExecutor(BaseExecutor):
             logger.error(e)
             return "Failed"
         if submission.check_all_finished():
-            if os.path.isfile("results.txt"):
+            if all(os.path.isfile(os.path.join(
+                    workdir, task.task_work_path, "results.txt"))
+                    for task in submission.belonging_tasks):
                 return "Succeeded"
             else:
                 return "Failed"
         else:
             return "Running"
 
-    def terminate(self, job_id):
-        machine = Machine.load_from_dict(self.machine)
-        content = machine.context.read_file(job_id + ".json")
-        submission = Submission.deserialize(
-            submission_dict=json.loads(content))
+    def query_status_batch(self, jobs):
+        # each submission is bound to the machine of its workdir, load
+        # untracked ones concurrently since they are read remotely
+        if len(jobs) <= 1:
+            return super().query_status_batch(jobs)
+
+        def query(job):
+            try:
+                return self.query_status(job[0], workdir=job[1])
+            except Exception as e:
+                return e
+        with ThreadPoolExecutor(max_workers=min(
+                len(jobs), config["query_concurrency"])) as pool:
+            return list(pool.map(query, jobs))
+
+    def terminate(self, job_id, workdir="."):
+        if self.batcher is not None and self.batcher.cancel(job_id):
+            info = {"job_id": job_id}
+        else:
+            info = self.get_batch_info(job_id, workdir)
+        if info is not None:
+            # other calls may share the submission, mark the call failed
+            # and kill the submission once all of its calls are terminated
+            with open(os.path.join(workdir, "err"), "w") as f:
+                f.write("Job was terminated")
+            info = dict(info, terminated=True)
+            self.write_batch_info(workdir, info)
+            self.terminate_batch(info)
+            return
+        submission = None
+        if self.poller is not None:
+            submission = self.poller.forget(job_id)
+        if submission is None:
+            submission = self.load_submission(job_id, workdir)
         submission.remove_unfinished_tasks()
 
-    def get_results(self, job_id):
-        if os.path.isfile("results.txt"):
-            with open("results.txt", "r") as f:
+    def terminate_batch(self, info):
+        """Kill the submission of a batched call if every call is terminated"""
+        if "submission" not in info:
+            return
+        for job_id, workdir in info.get("calls", []):
+            other = self.get_batch_info(job_id, workdir)
+            if other is None or not other.get("terminated"):
+                return
+        submission = None
+        if self.poller is not None:
+            submission = self.poller.forget(info["submission"])
+        if submission is None:
+            submission = self.load_submission(
+                info["submission"], info["root"])
+        submission.remove_unfinished_tasks()
+
+    def get_results(self, job_id, workdir="."):
+        result_file = os.path.join(workdir, "results.txt")
+        err_file = os.path.join(workdir, "err")
+        if os.path.isfile(result_file):
+            with open(result_file, "r") as f:
                 return jsonpickle.loads(f.read())
-        elif os.path.isfile("err"):
-            with open("err", "r") as f:
+        elif os.path.isfile(err_file):
+            with open(err_file, "r") as f:
                 err_msg = f.read()
             raise RuntimeError(err_msg)
         return {}
+
+    def get_output_artifacts(self, job_id, workdir="."):
+        if not self.remote_artifacts:
+            return None
+        path = os.path.join(workdir, OUTPUT_ARTIFACTS_FILE)
+        if not os.path.isfile(path):
+            return {}
+        with open(path, "r") as f:
+            return json.load(f)
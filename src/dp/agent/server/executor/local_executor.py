@@ -2,19 +2,48 @@ import asyncio
 import importlib
 import inspect
 import io
-import jsonpickle
 import os
 import psutil
 import re
 import sys
+import threading
 import time
 import uuid
-from multiprocessing import Process
-from typing import Dict, Optional
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import nullcontext
+from multiprocessing import Pipe, Process
+from typing import Dict, List, Optional
+
+import cloudpickle
 
 from .base_executor import BaseExecutor
-from ..utils import get_logger
+from .scheduler import config as scheduler_config
+from .scheduler import get_scheduler, set_affinity
+from .result_channel import (
+    ResultStore,
+    encode_result,
+    has_result_file,
+    read_result_file,
+    save_message,
+    send_message,
+)
+from .supervisor import Supervisor
+from .worker_pool import WorkerPool
+from ..artifact_cache import parse_size
+from ..utils import (
+    acquire_cwd_lock,
+    acquire_lock,
+    cwd_lock,
+    get_logger,
+    set_directory,
+)
 
+config = {
+    "sync_mode": os.environ.get("DP_AGENT_SYNC_MODE", "thread"),
+    "sync_max_workers": int(os.environ.get("DP_AGENT_SYNC_MAX_WORKERS",
+                                           "4")),
+}
+SYNC_MODES = ["inline", "thread", "process"]
 DFLOW_ID_PATTERN = r"Workflow has been submitted \(ID: ([^,]*), UID: ([^)]*)\)"
 DFLOW_LINK_PATTERN = r"Workflow link: (.*)"
 logger = get_logger(__name__)
@@ -32,29 +61,78 @@ class Tee(io.TextIOBase):
         return len(text)
 
 
-def wrapped_fn(fn, kwargs, redirect_log=False):
-    pid = os.getpid()
+def wrapped_fn(fn, kwargs, redirect_log=False, workdir=None, env=None,
+               job_id=None, conn=None, cpus=None):
+    # the job process owns its working directory, environment and CPUs
+    if workdir is not None:
+        os.chdir(workdir)
+    os.environ.update(env or {})
+    set_affinity(cpus)
+    if job_id is None:
+        job_id = str(os.getpid())
+    message = run_job(fn, kwargs, job_id, redirect_log)
+    if conn is not None:
+        send_message(conn, message)
+    else:
+        save_message(job_id, message)
+    if message["status"] == "Failed":
+        sys.exit(1)
+
+
+def run_job(fn, kwargs, job_id, redirect_log=False):
+    """
+    Run the tool in the working directory, return the message of its
+    result to be sent back to the executor. The error is also written to
+    <job_id>.err, and the process to <job_id>.pid for recovery
+    """
+    p = psutil.Process()
+    with open("%s.pid" % job_id, "w") as f:
+        f.write("%s %s" % (p.pid, p.create_time()))
     # explicitly reload dflow config
     reload_dflow_config()
     if redirect_log:
         stdout = sys.stdout
-        flog = open("%s.log" % pid, "w")
+        flog = open("%s.log" % job_id, "w")
         sys.stdout = Tee(flog, stdout)
+    start, cpu_start = time.time(), time.process_time()
     try:
         if inspect.iscoroutinefunction(fn):
             result = asyncio.run(fn(**kwargs))
         else:
             result = fn(**kwargs)
     except Exception as e:
-        with open("%s.err" % pid, "w") as f:
+        logger.error("Job %s failed: %s" % (job_id, e))
+        with open("%s.err" % job_id, "w") as f:
             f.write(str(e))
-        raise e
+        message = encode_result(job_id, os.getcwd(), error=str(e))
+    else:
+        message = encode_result(job_id, os.getcwd(), result)
     finally:
         if redirect_log:
             sys.stdout = stdout
             flog.close()
-    with open("%s.txt" % pid, "w") as f:
-        f.write(jsonpickle.dumps(result))
+    # refined with the exit code and rusage when the process is reaped
+    message["accounting"] = {"wall_time": time.time() - start,
+                             "cpu_time": time.process_time() - cpu_start}
+    return message
+
+
+def run_pool_job(job_id, payload, workdir, env, redirect_log=False,
+                 cpus=None):
+    """Run a job in a pool worker, which is reused by later jobs"""
+    fn, kwargs = cloudpickle.loads(payload)
+    cwd = os.getcwd()
+    old_env = os.environ.copy()
+    old_cpus = set_affinity(cpus)
+    try:
+        os.chdir(workdir)
+        os.environ.update(env or {})
+        return run_job(fn, kwargs, job_id, redirect_log)
+    finally:
+        os.chdir(cwd)
+        os.environ.clear()
+        os.environ.update(old_env)
+        set_affinity(old_cpus)
 
 
 def reload_dflow_config():
@@ -79,16 +157,81 @@ def reload_dflow_config():
 
 class LocalExecutor(BaseExecutor):
     def __init__(self, env: Optional[Dict[str, str]] = None,
-                 dflow: bool = False):
+                 dflow: bool = False, pool_size: int = 0,
+                 max_jobs_per_worker: Optional[int] = None,
+                 max_worker_rss=None, preload: Optional[List[str]] = None,
+                 sync_mode: Optional[str] = None,
+                 max_workers: Optional[int] = None,
+                 cpus: Optional[int] = None, memory=None):
         """
         Execute the tool locally
         Args:
             env: The environmental variables at run time
             dflow: Wait until workflow submitted in submit method
+            pool_size: Run submitted jobs in a pool of pool_size long-lived
+                worker processes instead of a new process per job, 0
+                disables the pool
+            max_jobs_per_worker: Recycle a worker after it has run this
+                many jobs
+            max_worker_rss: Recycle a worker when its RSS exceeds this size
+                in bytes (or a string like "4G")
+            preload: Modules imported once for all workers, the module of
+                the first submitted tool is preloaded as well. Tools of the
+                main script preload the script itself, whose
+                `if __name__ == "__main__"` block is not run again
+            sync_mode: How synchronous tools are run by async_run, "inline"
+                in the event loop (blocking the server until they return),
+                "thread" in a pool of max_workers threads, or "process" in
+                job processes (the worker pool if pool_size > 0), at most
+                max_workers at a time. DP_AGENT_SYNC_MODE ("thread") by
+                default, which keeps the server responsive. Threads share
+                the working directory and environment of the server, so
+                tools with env or a workdir of their own are run in
+                process mode instead, at the cost of starting a job
+                process and pickling their arguments and results. Inline
+                mode avoids these costs for quick tools
+            max_workers: Concurrency limit of the thread and process modes,
+                DP_AGENT_SYNC_MAX_WORKERS by default
+            cpus: The number of CPUs required by each submitted job, set
+                from the resources declared by the tool, else
+                DP_AGENT_JOB_CPUS (0, unlimited). Jobs requiring CPUs or
+                memory are queued by the scheduler of the server process
+                until these are available, and pinned to their CPUs unless
+                DP_AGENT_CPU_PINNING is off
+            memory: The memory required by each submitted job in bytes (or
+                a string like "8G"), set from the resources declared by the
+                tool, else DP_AGENT_JOB_MEMORY (0, unlimited)
         """
+        if sync_mode is None:
+            sync_mode = config["sync_mode"]
+        if sync_mode not in SYNC_MODES:
+            raise ValueError("Invalid sync_mode %s, expected one of %s" % (
+                sync_mode, SYNC_MODES))
         self.env = env or {}
         self.dflow = dflow
-        self.workflow_id = None
+        self.pool_size = pool_size
+        self.max_jobs_per_worker = max_jobs_per_worker
+        self.max_worker_rss = parse_size(max_worker_rss) \
+            if max_worker_rss is not None else None
+        self.preload = list(preload or [])
+        self.pool = None
+        self._pool_lock = threading.Lock()
+        # results are sent back over pipes, job IDs are unique rather than
+        # process IDs which may be reused
+        self.results = ResultStore()
+        self.supervisor = Supervisor(self.results)
+        # the executor may be reused across jobs, map job ID to workflow ID
+        self.workflow_ids = {}
+        # processes started by this executor and not exited yet
+        self.processes = {}
+        self.sync_mode = sync_mode
+        self.max_workers = max_workers or config["sync_max_workers"]
+        self._threads = None
+        self._slots = threading.BoundedSemaphore(self.max_workers)
+        self.cpus = cpus or scheduler_config["job_cpus"]
+        self.memory = parse_size(memory) if memory is not None else \
+            scheduler_config["job_memory"]
+        self.scheduler = get_scheduler()
 
     def set_env(self):
         old_env = {}
@@ -105,94 +248,309 @@ class LocalExecutor(BaseExecutor):
             else:
                 del os.environ[k]
 
-    def submit(self, fn, kwargs):
+    def get_pool(self, fn):
+        with self._pool_lock:
+            if self.pool is None:
+                preload = list(self.preload)
+                module = fn.__module__
+                if module in ["__main__", "__mp_main__"]:
+                    # the script of the server is imported from its path by
+                    # the forkserver (as __mp_main__, skipping its
+                    # __main__ block), unless it has no file
+                    module = "__main__" if getattr(
+                        sys.modules["__main__"], "__file__", None) else None
+                if module is not None and module not in preload:
+                    preload.append(module)
+                self.pool = WorkerPool(
+                    run_pool_job, size=self.pool_size,
+                    max_jobs=self.max_jobs_per_worker,
+                    max_rss=self.max_worker_rss, preload=preload,
+                    env={"DP_AGENT_RUNNING_MODE": "1"},
+                    on_result=lambda job_id, message: self.results.put(
+                        message),
+                    fallback=save_message)
+            return self.pool
+
+    def schedule_job(self, fn, kwargs, workdir="."):
+        """Queue a job to the scheduler, return its job ID"""
         kwargs = self.prune_context(kwargs)
         os.environ["DP_AGENT_RUNNING_MODE"] = "1"
-        old_env = self.set_env()
-        params = {"fn": fn, "kwargs": kwargs}
-        if self.dflow:
-            params["redirect_log"] = True
-        p = Process(target=wrapped_fn, kwargs=params)
-        p.start()
+        job_id = uuid.uuid4().hex
+        self.scheduler.submit(
+            job_id, lambda cpus: self.start_job(
+                job_id, fn, kwargs, workdir, cpus),
+            cpus=self.cpus, memory=self.memory, owner=self)
+        return job_id
+
+    def submit(self, fn, kwargs, workdir="."):
+        job_id = self.schedule_job(fn, kwargs, workdir)
         extra_info = {}
         if self.dflow:
             while True:
-                alive = p.is_alive()
-                if os.path.isfile("%s.log" % p.pid):
-                    with open("%s.log" % p.pid, "r") as f:
-                        log = f.read()
-                    match_id = re.search(DFLOW_ID_PATTERN, log)
-                    match_link = re.search(DFLOW_LINK_PATTERN, log)
-                    if match_id and match_link:
-                        wf_id = match_id.group(1)
-                        self.workflow_id = wf_id
-                        wf_uid = match_id.group(2)
-                        wf_link = match_link.group(1)
-                        extra_info["workflow_id"] = wf_id
-                        extra_info["workflow_uid"] = wf_uid
-                        extra_info["workflow_link"] = wf_link
-                        break
-                if not alive:
-                    if os.path.isfile("%s.err" % p.pid):
-                        with open("%s.err" % p.pid, "r") as f:
-                            err_msg = f.read()
-                    else:
-                        err_msg = "No workflow submitted"
-                    raise RuntimeError(err_msg)
+                extra_info = self.get_workflow_info(job_id, workdir)
+                if extra_info is not None:
+                    break
                 logger.info("Waiting workflow to be submitted")
                 time.sleep(1)
-        self.recover_env(old_env)
-        return {"job_id": str(p.pid), "extra_info": extra_info}
+        return {"job_id": job_id, "extra_info": extra_info}
+
+    async def async_submit(self, fn, kwargs, workdir="."):
+        job_id = self.schedule_job(fn, kwargs, workdir)
+        if not self.dflow:
+            return {"job_id": job_id, "extra_info": {}}
+        # wait for the scheduler to start the job rather than polling it
+        loop = asyncio.get_running_loop()
+        started = loop.create_future()
+        self.scheduler.add_start_callback(
+            job_id, lambda: loop.call_soon_threadsafe(
+                lambda: started.done() or started.set_result(None)))
+        await started
+        while True:
+            extra_info = self.get_workflow_info(job_id, workdir)
+            if extra_info is not None:
+                return {"job_id": job_id, "extra_info": extra_info}
+            logger.info("Waiting workflow to be submitted")
+            await asyncio.sleep(1)
+
+    def get_workflow_info(self, job_id, workdir="."):
+        """
+        Info of the workflow submitted by a dflow job from its log, None if
+        not submitted yet
+        """
+        alive = self.is_running(job_id)
+        log_file = os.path.join(workdir, "%s.log" % job_id)
+        if os.path.isfile(log_file):
+            with open(log_file, "r") as f:
+                log = f.read()
+            match_id = re.search(DFLOW_ID_PATTERN, log)
+            match_link = re.search(DFLOW_LINK_PATTERN, log)
+            if match_id and match_link:
+                wf_id = match_id.group(1)
+                self.workflow_ids[job_id] = wf_id
+                return {
+                    "workflow_id": wf_id,
+                    "workflow_uid": match_id.group(2),
+                    "workflow_link": match_link.group(1),
+                }
+        if not alive:
+            err_file = os.path.join(workdir, "%s.err" % job_id)
+            if os.path.isfile(err_file):
+                with open(err_file, "r") as f:
+                    err_msg = f.read()
+            else:
+                err_msg = "No workflow submitted"
+            raise RuntimeError(err_msg)
+        return None
+
+    def start_job(self, job_id, fn, kwargs, workdir=".", cpus=None):
+        """Start a job admitted by the scheduler on the CPUs given"""
+        def release():
+            self.scheduler.release(job_id)
 
-    def query_status(self, job_id):
         try:
-            p = psutil.Process(int(job_id))
-            if p.status() not in ["zombie", "dead"]:
-                return "Running"
-        except psutil.NoSuchProcess:
+            if self.pool_size > 0:
+                pool = self.get_pool(fn)
+                pool.submit(job_id, cloudpickle.dumps((fn, kwargs)),
+                            os.path.abspath(workdir), self.env, self.dflow,
+                            cpus)
+                pool.add_done_callback(job_id, release)
+                return
+            conn, child_conn = Pipe(duplex=False)
+            params = {"fn": fn, "kwargs": kwargs, "workdir": workdir,
+                      "env": self.env, "job_id": job_id,
+                      "conn": child_conn, "cpus": cpus}
+            if self.dflow:
+                params["redirect_log"] = True
+            p = Process(target=wrapped_fn, kwargs=params)
+            p.start()
+        except Exception as e:
+            self.results.put({"job_id": job_id, "workdir": workdir,
+                              "status": "Failed", "error": str(e)})
+            raise
+        child_conn.close()
+        self.processes[job_id] = p
+        self.supervisor.add(job_id, conn, p, workdir)
+
+        def done():
+            self.processes.pop(job_id, None)
+            release()
+
+        self.supervisor.add_done_callback(job_id, done)
+
+    def busy(self):
+        """Whether jobs submitted by the executor are pending or running"""
+        return self.scheduler.count(self) > 0
+
+    def is_running(self, job_id, workdir="."):
+        if self.scheduler.is_pending(job_id):
+            return True
+        if self.pool is not None and self.pool.is_active(job_id):
+            return True
+        if self.supervisor.is_active(job_id):
+            return True
+        return self.get_process(job_id, workdir) is not None
+
+    def get_process(self, job_id, workdir="."):
+        """
+        Find the running process of a job not submitted by this executor,
+        e.g. before the server restarted, from <job_id>.pid
+        """
+        if self.results.status(job_id) is not None:
+            return None
+        for ext in ["txt", "err"]:
+            if os.path.isfile(os.path.join(workdir, "%s.%s" % (job_id, ext))):
+                return None
+        pid_file = os.path.join(workdir, "%s.pid" % job_id)
+        try:
+            if os.path.isfile(pid_file):
+                with open(pid_file, "r") as f:
+                    pid, create_time = f.read().split()
+                p = psutil.Process(int(pid))
+                # the process ID may have been reused
+                if abs(p.create_time() - float(create_time)) > 1:
+                    return None
+            else:
+                # jobs submitted by older versions are named by process IDs
+                p = psutil.Process(int(job_id))
+            if p.status() in ["zombie", "dead"]:
+                return None
+            return p
+        except (ValueError, psutil.Error):
+            return None
+
+    async def wait_for_job(self, job_id, workdir=".", timeout=10):
+        if self.scheduler.is_pending(job_id):
+            add_done_callback = self.scheduler.add_start_callback
+        elif self.pool is not None and self.pool.is_active(job_id):
+            add_done_callback = self.pool.add_done_callback
+        elif self.supervisor.is_active(job_id):
+            add_done_callback = self.supervisor.add_done_callback
+        else:
+            return await super().wait_for_job(job_id, workdir, timeout)
+        loop = asyncio.get_running_loop()
+        done = loop.create_future()
+        add_done_callback(job_id, lambda: loop.call_soon_threadsafe(
+            lambda: done.done() or done.set_result(None)))
+        try:
+            await asyncio.wait_for(done, timeout)
+        except asyncio.TimeoutError:
             pass
 
-        if os.path.isfile("%s.txt" % job_id):
+    def query_status(self, job_id, workdir="."):
+        if self.scheduler.is_pending(job_id):
+            return "Pending"
+        if self.is_running(job_id, workdir):
+            return "Running"
+        status = self.results.status(job_id)
+        if status is not None:
+            return status
+        if has_result_file(job_id, workdir):
             return "Succeeded"
         else:
             return "Failed"
 
-    def terminate(self, job_id):
-        if self.workflow_id is not None:
+    def terminate(self, job_id, workdir="."):
+        if job_id in self.workflow_ids:
             try:
                 from dflow import Workflow
-                wf = Workflow(id=self.workflow_id)
+                wf = Workflow(id=self.workflow_ids.pop(job_id))
                 wf.terminate()
             except Exception as e:
                 logger.error(f"Failed to terminate workflow: {e}")
+        if self.scheduler.cancel(job_id):
+            self.results.put({"job_id": job_id, "workdir": workdir,
+                              "status": "Failed",
+                              "error": "Job was terminated before started"})
+            return
+        if self.pool is not None and self.pool.is_active(job_id):
+            self.pool.terminate(job_id)
+            return
         try:
-            p = psutil.Process(int(job_id))
-            p.terminate()
+            if self.supervisor.terminate(job_id):
+                return
+            p = self.get_process(job_id, workdir)
+            if p is not None:
+                p.terminate()
         except Exception as e:
             logger.error(f"Failed to terminate process: {e}")
 
-    def get_results(self, job_id):
-        if os.path.isfile("%s.txt" % job_id):
-            with open("%s.txt" % job_id, "r") as f:
-                return jsonpickle.loads(f.read())
-        elif os.path.isfile("%s.err" % job_id):
-            with open("%s.err" % job_id, "r") as f:
+    def get_accounting(self, job_id, workdir="."):
+        return self.results.accounting(job_id) or {}
+
+    def get_results(self, job_id, workdir="."):
+        found, result = self.results.get(job_id)
+        if found:
+            return result
+        found, result = read_result_file(job_id, workdir)
+        if found:
+            return result
+        err_file = os.path.join(workdir, "%s.err" % job_id)
+        if os.path.isfile(err_file):
+            with open(err_file, "r") as f:
                 err_msg = f.read()
             raise RuntimeError(err_msg)
         return {}
 
-    async def async_run(self, fn, kwargs, context, trace_id):
+    def get_threads(self):
+        with self._pool_lock:
+            if self._threads is None:
+                self._threads = ThreadPoolExecutor(
+                    self.max_workers, thread_name_prefix="local-executor")
+            return self._threads
+
+    def run_in_thread(self, fn, kwargs):
+        # explicitly reload dflow config
+        reload_dflow_config()
+        return fn(**kwargs)
+
+    async def async_run(self, fn, kwargs, context, trace_id, workdir=".",
+                        storage=None):
         os.environ["DP_AGENT_RUNNING_MODE"] = "1"
+        is_async = inspect.iscoroutinefunction(fn)
+        sync_mode = self.sync_mode
+        if sync_mode == "thread" and (
+                self.env or os.path.abspath(workdir) != os.getcwd()):
+            # Threads share the working directory and environment of the
+            # server process, which cannot be changed for one of them
+            sync_mode = "process"
+        if not is_async and sync_mode == "process":
+            # job processes own their working directory and environment
+            await acquire_lock(self._slots)
+            try:
+                return await super().async_run(fn, kwargs, context, trace_id,
+                                               workdir=workdir)
+            finally:
+                self._slots.release()
+        if not is_async and sync_mode == "thread":
+            result = await asyncio.get_running_loop().run_in_executor(
+                self.get_threads(), self.run_in_thread, fn, kwargs)
+            return {
+                "job_id": str(uuid.uuid4()),
+                "result": result,
+            }
+        # The tool runs in the server process, so the process-wide working
+        # directory and environment are changed while holding cwd_lock.
+        # Sync tools block the event loop anyway, coroutine tools running
+        # in the server's working directory without env do not need the
+        # lock and stay concurrent
+        chdir = not is_async or \
+            os.path.abspath(workdir) != os.getcwd()
+        lock = chdir or bool(self.env)
+        if lock:
+            await acquire_cwd_lock()
         old_env = self.set_env()
         try:
-            # explicitly reload dflow config
-            reload_dflow_config()
-            if inspect.iscoroutinefunction(fn):
-                result = await fn(**kwargs)
-            else:
-                result = fn(**kwargs)
+            with set_directory(workdir) if chdir else nullcontext():
+                # explicitly reload dflow config
+                reload_dflow_config()
+                if is_async:
+                    result = await fn(**kwargs)
+                else:
+                    result = fn(**kwargs)
         finally:
             self.recover_env(old_env)
+            if lock:
+                cwd_lock.release()
         return {
             "job_id": str(uuid.uuid4()),
             "result": result,
@@ -0,0 +1,7 @@
+"""
+Preloaded last by the forkserver of worker pools, to import the main script
+of the server, see worker_pool.preload_main
+"""
+from .worker_pool import preload_main
+
+preload_main()
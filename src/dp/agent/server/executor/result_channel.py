@@ -0,0 +1,307 @@
+import logging
+import mmap
+import os
+import pickle
+import threading
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+from multiprocessing import resource_tracker, shared_memory
+
+import jsonpickle
+
+from ..artifact_cache import parse_size
+
+config = {
+    "shm_threshold": parse_size(os.environ.get("DP_AGENT_SHM_THRESHOLD",
+                                               "1M")),
+    "max_results_in_memory": int(os.environ.get(
+        "DP_AGENT_MAX_RESULTS_IN_MEMORY", "256")),
+}
+logger = logging.getLogger(__name__)
+
+
+def create_shm(size):
+    try:
+        return shared_memory.SharedMemory(create=True, size=size,
+                                          track=False)
+    except TypeError:
+        # before Python 3.13, the segment would be unlinked when the job
+        # process exits, the receiver unlinks it instead
+        shm = shared_memory.SharedMemory(create=True, size=size)
+        resource_tracker.unregister(shm._name, "shared_memory")
+        return shm
+
+
+def attach_shm(name, size):
+    """
+    Map a shared memory segment and unlink it. On Linux the segment is
+    mapped directly so that arrays are not copied
+    """
+    if size == 0:
+        return b""
+    path = os.path.join("/dev/shm", name.lstrip("/"))
+    if os.path.exists(path):
+        with open(path, "r+b") as f:
+            buf = mmap.mmap(f.fileno(), size)
+        os.unlink(path)
+        return memoryview(buf)
+    shm = shared_memory.SharedMemory(name=name)
+    try:
+        return bytes(shm.buf[:size])
+    finally:
+        shm.close()
+        shm.unlink()
+
+
+def encode_result(job_id, workdir, result=None, error=None):
+    """
+    Encode the result (or error) of a job to be sent over a pipe. Results
+    are pickled with protocol 5, out-of-band buffers (e.g. NumPy arrays)
+    larger than DP_AGENT_SHM_THRESHOLD are passed in shared memory
+    """
+    message = {"job_id": job_id, "workdir": workdir}
+    if error is not None:
+        message.update(status="Failed", error=error)
+        return message
+    buffers = []
+    try:
+        data = pickle.dumps(result, protocol=5,
+                            buffer_callback=buffers.append)
+    except Exception:
+        message.update(status="Succeeded",
+                       jsonpickle=jsonpickle.dumps(result))
+        return message
+    descs = []
+    try:
+        for buf in buffers:
+            raw = buf.raw()
+            if raw.nbytes >= config["shm_threshold"]:
+                shm = create_shm(raw.nbytes)
+                shm.buf[:raw.nbytes] = raw
+                descs.append(("shm", shm.name, raw.nbytes))
+                shm.close()
+            else:
+                descs.append(("bytes", bytes(raw)))
+    except BaseException:
+        release_message({"buffers": descs})
+        raise
+    message.update(status="Succeeded", data=data, buffers=descs)
+    return message
+
+
+def decode_result(message):
+    if "jsonpickle" in message:
+        return jsonpickle.loads(message["jsonpickle"])
+    buffers = [attach_shm(desc[1], desc[2]) if desc[0] == "shm" else desc[1]
+               for desc in message["buffers"]]
+    return pickle.loads(message["data"], buffers=buffers)
+
+
+def release_message(message):
+    """Unlink shared memory of a message which is not decoded"""
+    for desc in message.get("buffers", []):
+        if desc[0] == "shm":
+            try:
+                shm = shared_memory.SharedMemory(name=desc[1])
+                shm.close()
+                shm.unlink()
+            except FileNotFoundError:
+                pass
+
+
+def write_result_file(job_id, workdir, result):
+    """
+    Write the result to <job_id>.pkl in the workdir, pickled with protocol 5
+    so that large buffers (e.g. NumPy arrays) are written as they are
+    rather than serialized to text
+    """
+    path = os.path.join(workdir, "%s.pkl" % job_id)
+    with open(path + ".tmp", "wb") as f:
+        pickle.dump(result, f, protocol=5)
+    os.replace(path + ".tmp", path)
+
+
+def has_result_file(job_id, workdir):
+    return any(os.path.isfile(os.path.join(workdir, name % job_id))
+               for name in ["%s.pkl", "%s.txt"])
+
+
+def read_result_file(job_id, workdir):
+    """
+    Return (True, result) if the result of the job was written to the
+    workdir, (False, None) if not. <job_id>.txt is written by earlier
+    versions in jsonpickle
+    """
+    path = os.path.join(workdir, "%s.pkl" % job_id)
+    if os.path.isfile(path):
+        with open(path, "rb") as f:
+            return True, pickle.load(f)
+    path = os.path.join(workdir, "%s.txt" % job_id)
+    if os.path.isfile(path):
+        with open(path, "r") as f:
+            return True, jsonpickle.loads(f.read())
+    return False, None
+
+
+def write_error_file(job_id, workdir, error):
+    path = os.path.join(workdir, "%s.err" % job_id)
+    if not os.path.isfile(path):
+        with open(path, "w") as f:
+            f.write(error)
+
+
+def save_message(job_id, message):
+    """
+    Write the result to the workdir if it cannot be delivered over the
+    pipe, e.g. the server has exited
+    """
+    if message.get("status") == "Succeeded":
+        write_result_file(job_id, message["workdir"], decode_result(message))
+
+
+def send_message(conn, message):
+    try:
+        conn.send(message)
+    except (OSError, EOFError):
+        save_message(message["job_id"], message)
+
+
+_writer = None
+_writer_lock = threading.Lock()
+
+
+def get_writer():
+    """The thread writing received results to files, off the hot path"""
+    global _writer
+    with _writer_lock:
+        if _writer is None:
+            _writer = ThreadPoolExecutor(max_workers=1,
+                                         thread_name_prefix="result-writer")
+        return _writer
+
+
+class ResultStore:
+    def __init__(self, max_entries=None):
+        """
+        Results received from job processes. Results of the max_entries
+        most recently used jobs are kept in memory as received, and
+        written to <job_id>.pkl in the workdir in the background as a
+        fallback for executors created after a restart or an eviction
+        from the pool. Errors are written to <job_id>.err at once
+        """
+        self.max_entries = max_entries or config["max_results_in_memory"]
+        self._lock = threading.Lock()
+        self._entries = OrderedDict()
+        self._writes = {}
+
+    def put(self, message):
+        job_id = message["job_id"]
+        message = self.receive(message)
+        with self._lock:
+            self._entries[job_id] = message
+            self._entries.move_to_end(job_id)
+            while len(self._entries) > self.max_entries:
+                # the pending write keeps the result until it is written
+                self._entries.popitem(last=False)
+        if message["status"] == "Succeeded":
+            with self._lock:
+                self._writes[job_id] = (get_writer().submit(
+                    self.write, job_id, message["workdir"],
+                    message["result"]), message)
+
+    def receive(self, message):
+        """
+        Decode the result of a message, which maps its shared memory
+        without copying and releases the segment. Return the message
+        holding the result
+        """
+        job_id = message["job_id"]
+        try:
+            if message["status"] == "Failed":
+                write_error_file(job_id, message["workdir"],
+                                 message["error"])
+                return message
+            if "result" not in message:
+                result = decode_result(message)
+                message = {k: v for k, v in message.items()
+                           if k not in ["data", "buffers", "jsonpickle"]}
+                message["result"] = result
+        except Exception as e:
+            logger.error("Failed to receive result of job %s: %s" % (
+                job_id, e))
+            if "result" not in message and message["status"] != "Failed":
+                release_message(message)
+                message = {**message, "status": "Failed",
+                           "error": "Failed to receive result: %s" % e}
+        return message
+
+    def write(self, job_id, workdir, result):
+        try:
+            write_result_file(job_id, workdir, result)
+        except Exception as e:
+            logger.error("Failed to write result of job %s: %s" % (
+                job_id, e))
+        finally:
+            with self._lock:
+                self._writes.pop(job_id, None)
+
+    def flush(self):
+        """Wait for the results received so far to be written"""
+        with self._lock:
+            writes = list(self._writes.values())
+        for future, _ in writes:
+            future.result()
+
+    def finish(self, job_id, workdir, accounting):
+        """
+        Record resource usage of a job whose process has exited, the job
+        failed if no result was received
+        """
+        with self._lock:
+            message = self.lookup(job_id)
+            if message is not None:
+                message["accounting"] = {**message.get("accounting", {}),
+                                         **accounting}
+                return
+        if has_result_file(job_id, workdir):
+            # received and evicted from memory before the process exited
+            return
+        self.put({"job_id": job_id, "workdir": workdir, "status": "Failed",
+                  "error": "Job process exited with code %s" %
+                  accounting.get("exit_code"), "accounting": accounting})
+
+    def lookup(self, job_id):
+        """
+        The message of a job in memory, including evicted results not
+        written yet, callers hold the lock
+        """
+        message = self._entries.get(job_id)
+        if message is None and job_id in self._writes:
+            message = self._writes[job_id][1]
+        return message
+
+    def accounting(self, job_id):
+        with self._lock:
+            message = self.lookup(job_id)
+            return message.get("accounting") if message is not None \
+                else None
+
+    def status(self, job_id):
+        with self._lock:
+            message = self.lookup(job_id)
+            return message["status"] if message is not None else None
+
+    def get(self, job_id):
+        """
+        Return (True, result) if the result is cached in memory, (False,
+        None) if not, raise RuntimeError if the job failed
+        """
+        with self._lock:
+            message = self.lookup(job_id)
+            if message is None:
+                return False, None
+            if job_id in self._entries:
+                self._entries.move_to_end(job_id)
+            if message["status"] == "Failed":
+                raise RuntimeError(message["error"])
+            return True, message["result"]
@@ -0,0 +1,216 @@
+import logging
+import os
+import threading
+import time
+from collections import OrderedDict
+from typing import Callable, List, Optional
+
+import psutil
+
+from .. import metrics
+from ..artifact_cache import parse_size
+
+config = {
+    "max_cpus": int(os.environ.get("DP_AGENT_MAX_CPUS", "0")),
+    "max_memory": parse_size(os.environ["DP_AGENT_MAX_MEMORY"])
+    if os.environ.get("DP_AGENT_MAX_MEMORY") else None,
+    # jobs of tools declaring cpus or memory in their resources are queued
+    # until these are available, and pinned to the CPUs they reserved.
+    # Other jobs require nothing unless DP_AGENT_JOB_CPUS/MEMORY are set,
+    # so they start at once and are not pinned
+    "cpu_pinning": os.environ.get("DP_AGENT_CPU_PINNING", "1") in [
+        "1", "true"],
+    "job_cpus": int(os.environ.get("DP_AGENT_JOB_CPUS", "0")),
+    "job_memory": parse_size(os.environ.get("DP_AGENT_JOB_MEMORY", "0")),
+}
+logger = logging.getLogger(__name__)
+
+
+def get_available_cpus() -> List[int]:
+    if hasattr(os, "sched_getaffinity"):
+        return sorted(os.sched_getaffinity(0))
+    return list(range(os.cpu_count() or 1))
+
+
+def set_affinity(cpus: Optional[List[int]]) -> Optional[List[int]]:
+    """Pin the current process to cpus, return the former CPU set"""
+    if not cpus or not hasattr(os, "sched_setaffinity"):
+        return None
+    old = sorted(os.sched_getaffinity(0))
+    os.sched_setaffinity(0, cpus)
+    return old
+
+
+class Request:
+    def __init__(self, job_id, cpus, memory, start, owner, labels):
+        self.job_id = job_id
+        self.cpus = cpus
+        self.memory = memory
+        self.start = start
+        self.owner = owner
+        self.labels = labels
+        self.submit_time = time.monotonic()
+        self.cpu_set = []
+        self.callbacks = []
+
+
+class Scheduler:
+    def __init__(self, cpus: Optional[List[int]] = None,
+                 memory: Optional[int] = None,
+                 pinning: Optional[bool] = None):
+        """
+        Admit local jobs according to their CPU and memory requirements,
+        jobs which do not fit are queued in submission order until running
+        jobs release their resources. Each running job is assigned a
+        disjoint set of CPUs
+
+        Args:
+            cpus: The CPUs to schedule jobs on, DP_AGENT_MAX_CPUS of the
+                CPUs available to the server by default
+            memory: The memory in bytes to schedule jobs with,
+                DP_AGENT_MAX_MEMORY (or the total memory) by default
+            pinning: Pin each job reserving CPUs to them,
+                DP_AGENT_CPU_PINNING (on) by default
+        """
+        if cpus is None:
+            cpus = get_available_cpus()
+            if config["max_cpus"] > 0:
+                cpus = cpus[:config["max_cpus"]]
+        if memory is None:
+            memory = config["max_memory"] or psutil.virtual_memory().total
+        self.cpus = list(cpus)
+        self.memory = memory
+        self.pinning = config["cpu_pinning"] if pinning is None else pinning
+        self._lock = threading.Lock()
+        self._free_cpus = list(self.cpus)
+        self._free_memory = memory
+        self._pending = OrderedDict()
+        # admitted, but start has not returned yet
+        self._starting = {}
+        self._running = {}
+
+    def submit(self, job_id: str, start: Callable, cpus: int = 0,
+               memory: int = 0, owner=None) -> None:
+        """
+        Start the job by calling start with its CPUs (None if not pinned)
+        once the resources are available, now if possible
+        """
+        if cpus > len(self.cpus) or memory > self.memory:
+            raise ValueError(
+                "Job requires %s CPUs and %s bytes of memory, exceeding %s "
+                "CPUs and %s bytes of the scheduler" % (
+                    cpus, memory, len(self.cpus), self.memory))
+        request = Request(job_id, cpus, memory, start, owner,
+                          metrics.job_labels.get())
+        with self._lock:
+            self._pending[job_id] = request
+        self._schedule()
+
+    def _schedule(self):
+        started = []
+        with self._lock:
+            # strictly in submission order, so that large jobs are not
+            # starved by small ones
+            while self._pending:
+                request = next(iter(self._pending.values()))
+                if request.cpus > len(self._free_cpus) or \
+                        request.memory > self._free_memory:
+                    break
+                self._pending.popitem(last=False)
+                request.cpu_set = self._free_cpus[:request.cpus]
+                del self._free_cpus[:request.cpus]
+                self._free_memory -= request.memory
+                self._running[request.job_id] = request
+                self._starting[request.job_id] = request
+                started.append(request)
+        for request in started:
+            wait_time = time.monotonic() - request.submit_time
+            metrics.queue_wait_seconds.observe(
+                wait_time, tool=request.labels[0],
+                executor_type=request.labels[1])
+            try:
+                request.start(request.cpu_set if self.pinning else None)
+            except Exception as e:
+                logger.error("Failed to start job %s: %s" % (
+                    request.job_id, e))
+                self.release(request.job_id)
+            with self._lock:
+                self._starting.pop(request.job_id, None)
+                callbacks = request.callbacks
+            for callback in callbacks:
+                try:
+                    callback()
+                except Exception as e:
+                    logger.error("Job %s callback failed: %s" % (
+                        request.job_id, e))
+
+    def release(self, job_id: str) -> None:
+        """Release resources of a finished job and start pending jobs"""
+        with self._lock:
+            request = self._running.pop(job_id, None)
+            if request is None:
+                return
+            self._free_cpus = sorted(self._free_cpus + request.cpu_set)
+            self._free_memory += request.memory
+        self._schedule()
+
+    def cancel(self, job_id: str) -> bool:
+        """Remove a pending job, return whether it was pending"""
+        with self._lock:
+            request = self._pending.pop(job_id, None)
+        if request is None:
+            return False
+        for callback in request.callbacks:
+            callback()
+        return True
+
+    def is_pending(self, job_id: str) -> bool:
+        with self._lock:
+            return job_id in self._pending or job_id in self._starting
+
+    def add_start_callback(self, job_id: str, callback: Callable) -> None:
+        """Call callback once the job is started, now if not pending"""
+        with self._lock:
+            request = self._pending.get(job_id) or \
+                self._starting.get(job_id)
+            if request is not None:
+                request.callbacks.append(callback)
+                return
+        callback()
+
+    def count(self, owner) -> int:
+        """The number of pending and running jobs of owner"""
+        with self._lock:
+            return sum(r.owner is owner for r in list(
+                self._pending.values()) + list(self._running.values()))
+
+    def stats(self):
+        with self._lock:
+            now = time.monotonic()
+            return {
+                "pending": len(self._pending),
+                "running": len(self._running),
+                "cpus": len(self.cpus),
+                "free_cpus": len(self._free_cpus),
+                "memory": self.memory,
+                "free_memory": self._free_memory,
+                "oldest_pending_seconds": max(
+                    [now - r.submit_time for r in self._pending.values()],
+                    default=0),
+            }
+
+
+_scheduler = None
+_scheduler_lock = threading.Lock()
+
+
+def get_scheduler(create: bool = True) -> Optional[Scheduler]:
+    """
+    The scheduler shared by local executors of the server process, None if
+    not created yet and create is False
+    """
+    global _scheduler
+    with _scheduler_lock:
+        if _scheduler is None and create:
+            _scheduler = Scheduler()
+        return _scheduler
@@ -0,0 +1,142 @@
+import logging
+import multiprocessing
+import multiprocessing.process
+import os
+import sys
+import threading
+import time
+from multiprocessing.connection import wait
+
+from .result_channel import ResultStore
+
+logger = logging.getLogger(__name__)
+
+
+class Child:
+    def __init__(self, conn, process, workdir):
+        self.conn = conn
+        self.process = process
+        self.workdir = workdir
+        self.start_time = time.time()
+        self.callbacks = []
+
+
+def reap(process):
+    """
+    Reap an exited child, return its exit code and resource usage (None if
+    not available on the platform)
+    """
+    try:
+        _, status, rusage = os.wait4(process.pid, 0)
+    except (AttributeError, ChildProcessError):
+        process.join()
+        return process.exitcode, None
+    exit_code = os.waitstatus_to_exitcode(status)
+    # the child is reaped, let multiprocessing know its exit code
+    process._popen.returncode = exit_code
+    return exit_code, rusage
+
+
+class Supervisor:
+    def __init__(self, store: ResultStore):
+        """
+        Supervise job processes in a background thread: receive their
+        results over pipes, reap them as soon as they exit (waiting on
+        their sentinels rather than polling) and record exit code, wall
+        time, CPU time and peak RSS of each job in the result store
+        """
+        self.store = store
+        self._lock = threading.Lock()
+        self._children = {}
+        self._wakeup_r, self._wakeup_w = None, None
+        self._thread = None
+
+    def _start(self):
+        self._wakeup_r, self._wakeup_w = multiprocessing.Pipe(duplex=False)
+        self._thread = threading.Thread(
+            target=self._run, name="job-supervisor", daemon=True)
+        self._thread.start()
+
+    def add(self, job_id, conn, process, workdir="."):
+        # reaped by the supervisor, not by multiprocessing when starting
+        # other processes, so that resource usage is not lost
+        multiprocessing.process._children.discard(process)
+        with self._lock:
+            if self._thread is None:
+                self._start()
+            self._children[job_id] = Child(conn, process, workdir)
+        self._wakeup_w.send_bytes(b"")
+
+    def is_active(self, job_id):
+        with self._lock:
+            return job_id in self._children
+
+    def count(self):
+        with self._lock:
+            return len(self._children)
+
+    def terminate(self, job_id):
+        with self._lock:
+            child = self._children.get(job_id)
+        if child is None:
+            return False
+        child.process.terminate()
+        return True
+
+    def add_done_callback(self, job_id, callback):
+        with self._lock:
+            child = self._children.get(job_id)
+            if child is not None:
+                child.callbacks.append(callback)
+                return
+        callback()
+
+    def _receive(self, conn):
+        try:
+            while conn.poll():
+                self.store.put(conn.recv())
+        except (EOFError, OSError):
+            pass
+
+    def _run(self):
+        while True:
+            with self._lock:
+                children = dict(self._children)
+            objects = {self._wakeup_r: None}
+            for job_id, child in children.items():
+                objects[child.conn] = job_id
+                objects[child.process.sentinel] = job_id
+            for obj in wait(list(objects)):
+                if obj is self._wakeup_r:
+                    while self._wakeup_r.poll():
+                        self._wakeup_r.recv_bytes()
+                    continue
+                job_id = objects[obj]
+                child = children[job_id]
+                if job_id not in self._children:
+                    continue
+                self._receive(child.conn)
+                if obj is child.process.sentinel:
+                    self._done(job_id, child)
+
+    def _done(self, job_id, child):
+        # drain results sent right before exiting
+        self._receive(child.conn)
+        child.conn.close()
+        exit_code, rusage = reap(child.process)
+        accounting = {"exit_code": exit_code,
+                      "wall_time": time.time() - child.start_time}
+        if rusage is not None:
+            accounting["cpu_time"] = rusage.ru_utime + rusage.ru_stime
+            # ru_maxrss is in kilobytes on Linux, in bytes on macOS
+            accounting["max_rss"] = rusage.ru_maxrss * (
+                1 if sys.platform == "darwin" else 1024)
+        self.store.finish(job_id, child.workdir, accounting)
+        with self._lock:
+            self._children.pop(job_id, None)
+            callbacks = child.callbacks
+        for callback in callbacks:
+            try:
+                callback()
+            except Exception as e:
+                logger.error("Job %s callback failed: %s" % (job_id, e))
@@ -0,0 +1,319 @@
+import atexit
+import importlib
+import logging
+import multiprocessing
+import os
+import sys
+import threading
+from collections import OrderedDict
+from multiprocessing.connection import wait
+from typing import Callable, List, Optional
+
+import psutil
+
+logger = logging.getLogger(__name__)
+# path of the main script imported by the forkserver, see preload_main
+PRELOAD_MAIN_ENV = "DP_AGENT_PRELOAD_MAIN"
+
+
+def get_mp_context():
+    """
+    Workers are forked from a forkserver which has imported the preloaded
+    modules, so that new and recycled workers start warm
+    """
+    try:
+        return multiprocessing.get_context("forkserver")
+    except ValueError:
+        return multiprocessing.get_context("spawn")
+
+
+def preload_main():
+    """
+    Import the main script of the server, given by PRELOAD_MAIN_ENV, in the
+    forkserver, which preloads the preload_main module calling it once the
+    packages of the script are fully imported. The script is imported as
+    __mp_main__ like multiprocessing does (skipping its __main__ block), so
+    that workers forked from the forkserver start with it loaded. The
+    forkserver of multiprocessing drops the main path it is given, so
+    preloading "__main__" alone has no effect
+    """
+    path = os.environ.get(PRELOAD_MAIN_ENV)
+    main = sys.modules.get("__main__")
+    if not path or getattr(main, "__file__", None) is not None:
+        return
+    from multiprocessing import spawn
+    try:
+        spawn.import_main_path(path)
+    except Exception as e:
+        logger.warning("Failed to preload main script %s: %s" % (path, e))
+
+
+def worker_main(conn, target, preload, env, fallback=None):
+    os.environ.update(env or {})
+    for module in preload:
+        try:
+            importlib.import_module(module)
+        except Exception as e:
+            logger.warning("Failed to preload module %s: %s" % (module, e))
+    while True:
+        try:
+            job = conn.recv()
+        except EOFError:
+            break
+        if job is None:
+            break
+        job_id, args = job
+        try:
+            result = target(job_id, *args)
+        except BaseException as e:
+            # the target records errors of the job itself
+            logger.error("Job %s failed: %s" % (job_id, e))
+            result = None
+        try:
+            conn.send((job_id, psutil.Process().memory_info().rss, result))
+        except OSError:
+            # the pool is gone, keep the result with the fallback
+            if fallback is not None and result is not None:
+                fallback(job_id, result)
+            break
+
+
+class Worker:
+    def __init__(self, process, conn):
+        self.process = process
+        self.conn = conn
+        self.job_id = None
+        self.n_jobs = 0
+
+
+class WorkerPool:
+    def __init__(self, target: Callable, size: int = 4,
+                 max_jobs: Optional[int] = None,
+                 max_rss: Optional[int] = None,
+                 preload: Optional[List[str]] = None,
+                 env: Optional[dict] = None,
+                 on_result: Optional[Callable] = None,
+                 fallback: Optional[Callable] = None):
+        """
+        Pool of long-lived worker processes receiving jobs over pipes
+
+        Args:
+            target: Run a job in a worker, called with the job ID and the
+                arguments given on submission, must be importable. Its
+                return value is sent back to the pool
+            size: The number of workers
+            max_jobs: Recycle a worker after it has run max_jobs jobs
+            max_rss: Recycle a worker when its RSS exceeds max_rss bytes
+                after a job
+            preload: Modules imported by the forkserver and the workers
+                before running jobs, "__main__" for the main script
+            env: Environment variables of the workers
+            on_result: Called with the job ID and the return value of
+                target when a job is done
+            fallback: Called in the worker with the job ID and the return
+                value of target if it cannot be sent back, must be
+                importable
+        """
+        self.target = target
+        self.size = size
+        self.max_jobs = max_jobs
+        self.max_rss = max_rss
+        self.preload = list(preload or [])
+        self.env = env or {}
+        self.on_result = on_result
+        self.fallback = fallback
+        self.ctx = get_mp_context()
+        if self.ctx.get_start_method() == "forkserver":
+            # only effective before the forkserver is started
+            preload = self.preload
+            main_path = getattr(sys.modules["__main__"], "__file__", None)
+            if "__main__" in preload and main_path is not None:
+                os.environ[PRELOAD_MAIN_ENV] = os.path.abspath(main_path)
+                preload = [m for m in preload if m != "__main__"] + [
+                    __package__ + ".preload_main"]
+            self.ctx.set_forkserver_preload(preload)
+        self.recycled = 0
+        self._lock = threading.Lock()
+        self._pending = OrderedDict()
+        self._running = {}
+        self._callbacks = {}
+        self._workers = []
+        self._closed = False
+        self._wakeup_r, self._wakeup_w = multiprocessing.Pipe(duplex=False)
+        for _ in range(size):
+            self._workers.append(self._start_worker())
+        self._thread = threading.Thread(
+            target=self._run, name="worker-pool", daemon=True)
+        self._thread.start()
+        atexit.register(self.close)
+
+    def _start_worker(self):
+        parent_conn, child_conn = self.ctx.Pipe()
+        p = self.ctx.Process(
+            target=worker_main,
+            args=(child_conn, self.target, self.preload, self.env,
+                  self.fallback))
+        p.start()
+        child_conn.close()
+        return Worker(p, parent_conn)
+
+    def _wakeup(self):
+        try:
+            self._wakeup_w.send_bytes(b"")
+        except OSError:
+            pass
+
+    def submit(self, job_id: str, *args) -> None:
+        with self._lock:
+            if self._closed:
+                raise RuntimeError("Worker pool is closed")
+            self._pending[job_id] = args
+        self._wakeup()
+
+    def is_active(self, job_id: str) -> bool:
+        """Whether the job is pending or running"""
+        with self._lock:
+            return job_id in self._pending or job_id in self._running
+
+    def add_done_callback(self, job_id: str, callback: Callable) -> None:
+        """Call callback once the job is done, now if it is not active"""
+        with self._lock:
+            if job_id in self._pending or job_id in self._running:
+                self._callbacks.setdefault(job_id, []).append(callback)
+                return
+        callback()
+
+    def terminate(self, job_id: str) -> None:
+        """Cancel a pending job, or kill the worker running the job"""
+        with self._lock:
+            if self._pending.pop(job_id, None) is not None:
+                callbacks = self._callbacks.pop(job_id, [])
+            else:
+                callbacks = []
+                worker = self._running.get(job_id)
+                if worker is not None:
+                    worker.process.terminate()
+        for callback in callbacks:
+            callback()
+
+    def _done(self, worker):
+        with self._lock:
+            job_id = worker.job_id
+            self._running.pop(job_id, None)
+            callbacks = self._callbacks.pop(job_id, [])
+            worker.job_id = None
+        for callback in callbacks:
+            try:
+                callback()
+            except Exception as e:
+                logger.error("Job %s callback failed: %s" % (job_id, e))
+
+    def _recycle(self, worker, rss):
+        if self.max_jobs is not None and worker.n_jobs >= self.max_jobs:
+            reason = "after %s jobs" % worker.n_jobs
+        elif self.max_rss is not None and rss > self.max_rss:
+            reason = "with RSS %s bytes" % rss
+        else:
+            return
+        logger.info("Recycling worker %s %s" % (worker.process.pid, reason))
+        self._stop_worker(worker)
+        self._workers.remove(worker)
+        self._workers.append(self._start_worker())
+        self.recycled += 1
+
+    def _stop_worker(self, worker, timeout=5):
+        try:
+            worker.conn.send(None)
+        except OSError:
+            pass
+        worker.process.join(timeout)
+        if worker.process.is_alive():
+            worker.process.kill()
+            worker.process.join()
+        worker.conn.close()
+
+    def _dispatch(self):
+        with self._lock:
+            for worker in self._workers:
+                if not self._pending:
+                    break
+                if worker.job_id is not None:
+                    continue
+                job_id, args = self._pending.popitem(last=False)
+                try:
+                    worker.conn.send((job_id, args))
+                except OSError:
+                    # the worker died, retry when it is replaced
+                    self._pending[job_id] = args
+                    self._pending.move_to_end(job_id, last=False)
+                    continue
+                worker.job_id = job_id
+                worker.n_jobs += 1
+                self._running[job_id] = worker
+
+    def _run(self):
+        while True:
+            self._dispatch()
+            objects = [self._wakeup_r]
+            for worker in self._workers:
+                objects.extend([worker.conn, worker.process.sentinel])
+            for obj in wait(objects):
+                if obj is self._wakeup_r:
+                    try:
+                        while self._wakeup_r.poll():
+                            self._wakeup_r.recv_bytes()
+                    except (EOFError, OSError):
+                        return
+                    continue
+                worker = next((w for w in self._workers if
+                               obj in (w.conn, w.process.sentinel)), None)
+                if worker is None:
+                    continue
+                try:
+                    job_id, rss, result = worker.conn.recv()
+                except (EOFError, OSError):
+                    self._replace(worker)
+                    continue
+                if self.on_result is not None and result is not None:
+                    try:
+                        self.on_result(job_id, result)
+                    except Exception as e:
+                        logger.error("Failed to handle result of job %s: "
+                                     "%s" % (job_id, e))
+                self._done(worker)
+                self._recycle(worker, rss)
+            if self._closed:
+                return
+
+    def _replace(self, worker):
+        """The worker exited, e.g. its job was terminated"""
+        worker.process.join()
+        worker.conn.close()
+        if worker.job_id is not None:
+            logger.info("Worker %s running job %s exited with code %s" % (
+                worker.process.pid, worker.job_id, worker.process.exitcode))
+            self._done(worker)
+        self._workers.remove(worker)
+        if not self._closed:
+            self._workers.append(self._start_worker())
+
+    def stats(self):
+        with self._lock:
+            return {
+                "workers": len(self._workers),
+                "pending": len(self._pending),
+                "running": len(self._running),
+                "recycled": self.recycled,
+            }
+
+    def close(self):
+        with self._lock:
+            if self._closed:
+                return
+            self._closed = True
+        self._wakeup()
+        self._thread.join(10)
+        for worker in list(self._workers):
+            self._stop_worker(worker)
+        self._workers.clear()
+        self._wakeup_w.close()
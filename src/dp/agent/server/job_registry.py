@@ -0,0 +1,146 @@
+import json
+import os
+import sqlite3
+import threading
+import time
+from datetime import datetime
+from typing import Dict, List, Optional
+
+FINISHED_STATUS = ["Succeeded", "Failed"]
+JSON_FIELDS = ["executor", "storage", "input_artifacts", "output_artifacts",
+               "extra_info"]
+
+
+class JobRegistry:
+    def __init__(self, path: str = "jobs.db"):
+        """
+        Persistent registry of submitted jobs backed by SQLite, recording
+        tool name, executor/storage config, status, timestamps and artifact
+        URIs of each job
+
+        Args:
+            path: The path of the SQLite database, ":memory:" for a
+                non-persistent registry
+        """
+        if path != ":memory:":
+            path = os.path.abspath(path)
+        self.path = path
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(path, check_same_thread=False)
+        self._conn.row_factory = sqlite3.Row
+        with self._lock, self._conn:
+            if path != ":memory:":
+                self._conn.execute("PRAGMA journal_mode=WAL")
+            self._conn.execute("""
+                CREATE TABLE IF NOT EXISTS jobs (
+                    job_id TEXT PRIMARY KEY,
+                    workdir TEXT,
+                    tool_name TEXT,
+                    executor_type TEXT,
+                    executor TEXT,
+                    storage TEXT,
+                    status TEXT,
+                    created_at REAL,
+                    updated_at REAL,
+                    input_artifacts TEXT,
+                    output_artifacts TEXT,
+                    extra_info TEXT
+                )""")
+            self._conn.execute("CREATE INDEX IF NOT EXISTS idx_jobs_status "
+                               "ON jobs (status, created_at)")
+            self._conn.execute("CREATE INDEX IF NOT EXISTS idx_jobs_tool "
+                               "ON jobs (tool_name, created_at)")
+
+    def add(self, job_id: str, workdir: str, tool_name: str,
+            executor: Optional[dict] = None, storage: Optional[dict] = None,
+            executor_type: Optional[str] = None, status: str = "Running",
+            input_artifacts: Optional[dict] = None,
+            output_artifacts: Optional[dict] = None,
+            extra_info: Optional[dict] = None) -> None:
+        now = time.time()
+        with self._lock, self._conn:
+            self._conn.execute(
+                "INSERT OR REPLACE INTO jobs VALUES "
+                "(?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)",
+                (job_id, workdir, tool_name, executor_type,
+                 json.dumps(executor), json.dumps(storage), status, now, now,
+                 json.dumps(input_artifacts), json.dumps(output_artifacts),
+                 json.dumps(extra_info)))
+
+    def update(self, job_id: str, status: Optional[str] = None,
+               output_artifacts: Optional[dict] = None) -> None:
+        fields = {"updated_at": time.time()}
+        if status is not None:
+            fields["status"] = status
+        if output_artifacts is not None:
+            fields["output_artifacts"] = json.dumps(output_artifacts)
+        with self._lock, self._conn:
+            self._conn.execute(
+                "UPDATE jobs SET %s WHERE job_id = ?" % ", ".join(
+                    "%s = ?" % k for k in fields),
+                (*fields.values(), job_id))
+
+    def _to_dict(self, row):
+        job = dict(row)
+        for k in JSON_FIELDS:
+            job[k] = json.loads(job[k]) if job[k] is not None else None
+        return job
+
+    def get(self, job_id: str) -> Optional[dict]:
+        with self._lock:
+            row = self._conn.execute(
+                "SELECT * FROM jobs WHERE job_id = ?", (job_id,)).fetchone()
+        return self._to_dict(row) if row is not None else None
+
+    def get_many(self, job_ids: List[str]) -> Dict[str, dict]:
+        """Get jobs in one query, jobs not registered are omitted"""
+        jobs = {}
+        # stay below the limit of SQLite host parameters
+        for i in range(0, len(job_ids), 500):
+            chunk = job_ids[i:i + 500]
+            with self._lock:
+                rows = self._conn.execute(
+                    "SELECT * FROM jobs WHERE job_id IN (%s)" % ", ".join(
+                        "?" * len(chunk)), tuple(chunk)).fetchall()
+            for row in rows:
+                jobs[row["job_id"]] = self._to_dict(row)
+        return jobs
+
+    def list(self, status: Optional[str] = None,
+             tool_name: Optional[str] = None, limit: int = 100,
+             offset: int = 0) -> List[dict]:
+        """List jobs filtered by status and tool name, most recent first"""
+        conditions = []
+        params = []
+        if status is not None:
+            conditions.append("status = ?")
+            params.append(status)
+        if tool_name is not None:
+            conditions.append("tool_name = ?")
+            params.append(tool_name)
+        sql = "SELECT * FROM jobs"
+        if conditions:
+            sql += " WHERE " + " AND ".join(conditions)
+        sql += " ORDER BY created_at DESC LIMIT ? OFFSET ?"
+        with self._lock:
+            rows = self._conn.execute(
+                sql, (*params, limit, offset)).fetchall()
+        return [self._to_dict(row) for row in rows]
+
+    def count_running(self) -> List[tuple]:
+        """Count pending or running jobs by tool name and executor type"""
+        with self._lock:
+            rows = self._conn.execute(
+                "SELECT tool_name, executor_type, COUNT(*) FROM jobs "
+                "WHERE status IN ('Pending', 'Running') "
+                "GROUP BY tool_name, executor_type"
+            ).fetchall()
+        return [tuple(row) for row in rows]
+
+    def close(self):
+        with self._lock:
+            self._conn.close()
+
+
+def format_time(timestamp):
+    return datetime.fromtimestamp(timestamp).isoformat()
@@ -0,0 +1,209 @@
+import math
+import threading
+import time
+from contextlib import contextmanager
+from contextvars import ContextVar
+from typing import List, Optional
+
+DEFAULT_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10,
+                   30, 60, 120, 300, 600, 1800, 3600, math.inf)
+# labels (tool, executor_type) of the job being processed, so that phases
+# timed by executors are attributed to the tool
+job_labels = ContextVar("job_labels", default=("", ""))
+# time of the phases nested in the current phase
+_phase_nested = ContextVar("phase_nested", default=None)
+
+
+def format_labels(labelnames, values, extra=None):
+    pairs = list(zip(labelnames, values)) + list(extra or [])
+    if not pairs:
+        return ""
+    return "{%s}" % ",".join('%s="%s"' % (
+        k, str(v).replace("\\", "\\\\").replace('"', '\\"').replace(
+            "\n", "\\n")) for k, v in pairs)
+
+
+def format_value(value):
+    if value == math.inf:
+        return "+Inf"
+    return repr(float(value)) if isinstance(value, float) else str(value)
+
+
+class Metric:
+    type = "untyped"
+
+    def __init__(self, name: str, doc: str, labelnames: List[str] = ()):
+        self.name = name
+        self.doc = doc
+        self.labelnames = list(labelnames)
+        self._lock = threading.Lock()
+        self._values = {}
+
+    def _key(self, labels):
+        return tuple(str(labels.get(n, "")) for n in self.labelnames)
+
+    def samples(self):
+        with self._lock:
+            return [(self.name, key, None, value)
+                    for key, value in sorted(self._values.items())]
+
+    def render(self):
+        lines = ["# HELP %s %s" % (self.name, self.doc),
+                 "# TYPE %s %s" % (self.name, self.type)]
+        for name, key, extra, value in self.samples():
+            lines.append("%s%s %s" % (name, format_labels(
+                self.labelnames, key, extra), format_value(value)))
+        return "\n".join(lines)
+
+    def clear(self):
+        with self._lock:
+            self._values.clear()
+
+
+class Counter(Metric):
+    type = "counter"
+
+    def inc(self, amount: float = 1, **labels):
+        key = self._key(labels)
+        with self._lock:
+            self._values[key] = self._values.get(key, 0) + amount
+
+
+class Gauge(Metric):
+    type = "gauge"
+
+    def set(self, value: float, **labels):
+        with self._lock:
+            self._values[self._key(labels)] = value
+
+    def inc(self, amount: float = 1, **labels):
+        key = self._key(labels)
+        with self._lock:
+            self._values[key] = self._values.get(key, 0) + amount
+
+    def dec(self, amount: float = 1, **labels):
+        self.inc(-amount, **labels)
+
+
+class Histogram(Metric):
+    type = "histogram"
+
+    def __init__(self, name, doc, labelnames=(), buckets=DEFAULT_BUCKETS):
+        super().__init__(name, doc, labelnames)
+        self.buckets = list(buckets)
+        if self.buckets[-1] != math.inf:
+            self.buckets.append(math.inf)
+
+    def observe(self, value: float, **labels):
+        key = self._key(labels)
+        with self._lock:
+            counts, total = self._values.get(
+                key, ([0] * len(self.buckets), 0.0))
+            for i, bound in enumerate(self.buckets):
+                if value <= bound:
+                    counts[i] += 1
+            self._values[key] = (counts, total + value)
+
+    def samples(self):
+        samples = []
+        with self._lock:
+            for key, (counts, total) in sorted(self._values.items()):
+                for bound, count in zip(self.buckets, counts):
+                    samples.append((self.name + "_bucket", key,
+                                    [("le", format_value(bound))], count))
+                samples.append((self.name + "_sum", key, None, total))
+                samples.append((self.name + "_count", key, None, counts[-1]))
+        return samples
+
+
+class MetricsRegistry:
+    def __init__(self):
+        self.metrics = []
+
+    def register(self, metric: Metric) -> Metric:
+        self.metrics.append(metric)
+        return metric
+
+    def render(self, extra: Optional[List[Metric]] = None) -> str:
+        """
+        Render metrics in the Prometheus text format, extra metrics are
+        built at scrape time, e.g. from statistics of caches and pools
+        """
+        metrics = self.metrics + list(extra or [])
+        return "\n".join(m.render() for m in metrics) + "\n"
+
+
+registry = MetricsRegistry()
+phase_seconds = registry.register(Histogram(
+    "dp_agent_phase_seconds",
+    "Time spent in each phase of processing jobs",
+    ["tool", "executor_type", "phase"]))
+jobs_total = registry.register(Counter(
+    "dp_agent_jobs_total", "Jobs processed",
+    ["tool", "executor_type", "mode", "status"]))
+jobs_in_flight = registry.register(Gauge(
+    "dp_agent_jobs_in_flight", "Jobs being run synchronously",
+    ["tool", "executor_type"]))
+queue_wait_seconds = registry.register(Histogram(
+    "dp_agent_queue_wait_seconds",
+    "Time local jobs waited in the scheduler queue for resources",
+    ["tool", "executor_type"]))
+jobs_running = registry.register(Gauge(
+    "dp_agent_jobs_running",
+    "Submitted jobs not finished according to the job registry",
+    ["tool", "executor_type"]))
+
+
+def set_job_labels(tool: str, executor_type: Optional[str] = None):
+    """Set labels of the job being processed in the current context"""
+    if executor_type is None:
+        executor_type = job_labels.get()[1]
+    job_labels.set((tool, executor_type or ""))
+
+
+@contextmanager
+def time_phase(phase: str, tool: Optional[str] = None,
+               executor_type: Optional[str] = None):
+    """
+    Time a phase of the job being processed, even if it fails. Labels not
+    given are read from the context when the phase ends. Time spent in
+    phases nested in it is observed only by the nested phases, so that
+    phases never count the same time twice
+    """
+    start = time.perf_counter()
+    nested = [0.0]
+    token = _phase_nested.set(nested)
+    try:
+        yield
+    finally:
+        _phase_nested.reset(token)
+        elapsed = time.perf_counter() - start
+        parent = _phase_nested.get()
+        if parent is not None:
+            parent[0] += elapsed
+        labels = job_labels.get()
+        phase_seconds.observe(
+            max(elapsed - nested[0], 0.0),
+            tool=tool if tool is not None else labels[0],
+            executor_type=executor_type if executor_type is not None
+            else labels[1], phase=phase)
+
+
+def stats_metrics(prefix: str, doc: str, stats: dict,
+                  labelname: Optional[str] = None) -> List[Metric]:
+    """
+    Expose numeric statistics as gauges named prefix_<key>, stats maps the
+    value of labelname to the statistics if labelname is given
+    """
+    if labelname is None:
+        stats = {None: stats}
+    gauges = {}
+    for label, values in stats.items():
+        for k, v in values.items():
+            if isinstance(v, bool) or not isinstance(v, (int, float)):
+                continue
+            if k not in gauges:
+                gauges[k] = Gauge("%s_%s" % (prefix, k), "%s: %s" % (doc, k),
+                                  [labelname] if labelname else [])
+            gauges[k].set(v, **({labelname: label} if labelname else {}))
+    return list(gauges.values())
@@ -0,0 +1,81 @@
+import hashlib
+import json
+import threading
+import time
+from copy import deepcopy
+from typing import Callable
+
+from .utils import get_logger
+
+logger = get_logger(__name__)
+
+
+def hash_config(config: dict) -> str:
+    """Hash a normalized (key-sorted) configuration"""
+    return hashlib.sha256(json.dumps(
+        config, sort_keys=True, default=str).encode()).hexdigest()
+
+
+class InstancePool:
+    def __init__(self, factory: Callable[[dict], object], ttl: float = 3600):
+        """
+        Pool of live instances (storages, executors) keyed by the hash of
+        their configuration, so that authentication and setup are done once
+        and reused across calls
+
+        Args:
+            factory: Build an instance from a (copied) configuration
+            ttl: Instances unused for ttl seconds are evicted, 0 disables
+                pooling
+        """
+        self.factory = factory
+        self.ttl = ttl
+        self.hits = 0
+        self.misses = 0
+        self._lock = threading.Lock()
+        self._key_locks = {}
+        self._instances = {}
+
+    def get(self, config: dict):
+        if self.ttl <= 0:
+            return self.factory(deepcopy(config))
+        key = hash_config(config)
+        with self._lock:
+            self._evict()
+            key_lock = self._key_locks.setdefault(key, threading.Lock())
+        # build each configuration only once even if requested concurrently
+        with key_lock:
+            with self._lock:
+                entry = self._instances.get(key)
+                if entry is not None:
+                    entry[1] = time.monotonic()
+                    self.hits += 1
+                    return entry[0]
+            instance = self.factory(deepcopy(config))
+            with self._lock:
+                self._instances[key] = [instance, time.monotonic()]
+                self.misses += 1
+            return instance
+
+    def _evict(self):
+        now = time.monotonic()
+        for key, (instance, last_used) in list(self._instances.items()):
+            # keep instances still holding running jobs
+            busy = getattr(instance, "busy", None)
+            if now - last_used > self.ttl and not (busy and busy()):
+                del self._instances[key]
+                self._key_locks.pop(key, None)
+                logger.info("Evicted %s from pool" % type(instance).__name__)
+
+    def clear(self):
+        with self._lock:
+            self._instances.clear()
+            self._key_locks.clear()
+
+    def stats(self):
+        with self._lock:
+            return {
+                "size": len(self._instances),
+                "hits": self.hits,
+                "misses": self.misses,
+            }
@@ -0,0 +1,136 @@
+import inspect
+import os
+import shutil
+import uuid
+from pathlib import Path
+
+from .storage import parse_uri, storage_dict
+
+OUTPUT_ARTIFACTS_FILE = "output_artifacts.json"
+INPUTS_DIR = "inputs"
+
+
+class StorageGetter:
+    def __init__(self, storage: dict = None):
+        """
+        Storages of a job on the compute node, built from the storage
+        config of the tool call for its own scheme and with default
+        arguments for other schemes
+        """
+        self.storage = dict(storage or {"type": "local"})
+        self.storage_type = self.storage.pop("type")
+        self._storages = {}
+
+    def get(self, scheme: str):
+        if scheme not in self._storages:
+            if scheme == self.storage_type:
+                self._storages[scheme] = storage_dict[scheme](**self.storage)
+            else:
+                self._storages[scheme] = storage_dict[scheme]()
+        return self._storages[scheme]
+
+
+def is_path_annotation(annotation) -> bool:
+    if annotation is Path:
+        return True
+    return any(is_path_annotation(a)
+               for a in getattr(annotation, "__args__", ()))
+
+
+def _download(value, path, storages):
+    if isinstance(value, list):
+        return [_download(v, path, storages) for v in value]
+    if isinstance(value, dict):
+        return {k: _download(v, os.path.join(path, k), storages)
+                for k, v in value.items()}
+    scheme, key = parse_uri(str(value))
+    return Path(storages.get(scheme).download(key, path))
+
+
+def download_inputs(fn, kwargs: dict, storage: dict = None) -> dict:
+    """
+    Download the input artifacts of a tool call on the compute node, into
+    the same paths as the server downloads them into
+
+    Args:
+        fn: The tool function
+        kwargs: The arguments of the call, URIs of Path arguments are
+            replaced by local paths
+        storage: The storage configuration of the call
+    """
+    storages = StorageGetter(storage)
+    for name, param in inspect.signature(fn).parameters.items():
+        if is_path_annotation(param.annotation) and \
+                kwargs.get(name) is not None:
+            kwargs[name] = _download(kwargs[name], os.path.join(
+                INPUTS_DIR, name), storages)
+    return kwargs
+
+
+def remove_path(path) -> None:
+    """Remove a file or directory in the working directory of the job"""
+    path = os.path.abspath(path)
+    if os.path.commonpath([path, os.getcwd()]) != os.getcwd():
+        return
+    if os.path.isdir(path) and not os.path.islink(path):
+        shutil.rmtree(path)
+    elif os.path.lexists(path):
+        os.remove(path)
+
+
+def remove_inputs() -> None:
+    """
+    Remove the input artifacts downloaded by download_inputs, so that they
+    are not transferred back with the results of the job
+    """
+    remove_path(INPUTS_DIR)
+
+
+def upload_outputs(results, storage: dict = None, prefix: str = None,
+                   remove: bool = False):
+    """
+    Upload the Path results of a tool call from the compute node, as the
+    server uploads them
+
+    Args:
+        results: The results of the call, Paths (or lists of Paths) are
+            replaced by URIs
+        storage: The storage configuration of the call
+        prefix: Key prefix of the outputs, a random one by default
+        remove: Remove the outputs in the working directory once all of
+            them are uploaded, so that they are not transferred back with
+            the results of the job
+    Returns:
+        results: The results with URIs
+        output_artifacts: The output artifacts
+    """
+    output_artifacts = {}
+    if not isinstance(results, dict):
+        return results, output_artifacts
+    storages = StorageGetter(storage)
+    s = storages.get(storages.storage_type)
+    prefix = prefix or uuid.uuid4().hex
+
+    uploaded = []
+
+    def upload(name, path):
+        key = s.upload("%s/outputs/%s" % (prefix, name), str(path))
+        uploaded.append(path)
+        return storages.storage_type + "://" + key
+
+    for name, value in results.items():
+        if isinstance(value, Path):
+            results[name] = upload(name, value)
+        elif isinstance(value, list) and all(
+                isinstance(item, Path) for item in value):
+            results[name] = [upload(name, item) for item in value]
+        else:
+            continue
+        output_artifacts[name] = {
+            "storage_type": storages.storage_type,
+            "uri": results[name],
+        }
+    if remove:
+        for path in uploaded:
+            remove_path(path)
+    return results, output_artifacts
@@ -0,0 +1,145 @@
+import asyncio
+import hashlib
+import json
+import threading
+import time
+from collections import OrderedDict
+from copy import deepcopy
+from typing import Awaitable, Callable, Optional
+
+from .utils import get_logger
+
+logger = get_logger(__name__)
+
+
+def make_key(tool_name: str, kwargs: dict, storage: Optional[dict],
+             md5s: dict) -> str:
+    """
+    Key of a tool call from the tool name, the canonicalized arguments, the
+    storage configuration and the md5 of every input artifact
+    """
+    return hashlib.sha256(json.dumps({
+        "tool_name": tool_name,
+        "kwargs": kwargs,
+        "storage": storage,
+        "md5s": md5s,
+    }, sort_keys=True, default=str).encode()).hexdigest()
+
+
+class ResultCache:
+    def __init__(self, ttl: float = 86400, max_entries: int = 1024):
+        """
+        In-memory cache of tool results and submitted jobs. Identical calls
+        running concurrently are coalesced into one execution.
+
+        Args:
+            ttl: Entries expire after ttl seconds
+            max_entries: Entries beyond max_entries are evicted in LRU order
+        """
+        self.ttl = ttl
+        self.max_entries = max_entries
+        self.hits = 0
+        self.misses = 0
+        self.coalesced = 0
+        self._lock = threading.Lock()
+        self._key_locks = {}
+        self._results = OrderedDict()
+        self._jobs = OrderedDict()
+        self._inflight = {}
+
+    def _get(self, entries, key):
+        entry = entries.get(key)
+        if entry is None:
+            return None
+        if time.monotonic() > entry[0]:
+            del entries[key]
+            return None
+        entries.move_to_end(key)
+        return deepcopy(entry[1])
+
+    def _set(self, entries, key, value):
+        entries[key] = (time.monotonic() + self.ttl, deepcopy(value))
+        entries.move_to_end(key)
+        while len(entries) > self.max_entries:
+            evicted, _ = entries.popitem(last=False)
+            self._key_locks.pop(evicted, None)
+
+    def get(self, key: str):
+        with self._lock:
+            value = self._get(self._results, key)
+            if value is not None:
+                self.hits += 1
+            return value
+
+    def set(self, key: str, value) -> None:
+        with self._lock:
+            self._set(self._results, key, value)
+
+    async def get_or_run(self, key: str, run: Callable[[], Awaitable]):
+        """
+        Return the cached result of key, or await the identical call in
+        flight, or run it and cache its result. Return the result and
+        whether it was not computed by this call
+        """
+        value = self.get(key)
+        if value is not None:
+            return value, True
+        loop = asyncio.get_running_loop()
+        inflight = self._inflight.get(key)
+        if inflight is not None and inflight[0] is loop:
+            with self._lock:
+                self.coalesced += 1
+            return deepcopy(await asyncio.shield(inflight[1])), True
+        future = loop.create_future()
+        self._inflight[key] = (loop, future)
+        with self._lock:
+            self.misses += 1
+        try:
+            value = await run()
+        except BaseException as e:
+            future.set_exception(e)
+            # the exception is raised here, do not warn if nobody waits
+            future.exception()
+            raise
+        else:
+            self.set(key, value)
+            future.set_result(value)
+        finally:
+            if self._inflight.get(key, (None, future))[1] is future:
+                del self._inflight[key]
+        return value, False
+
+    def key_lock(self, key: str) -> threading.Lock:
+        """The lock serializing submission of identical jobs"""
+        with self._lock:
+            return self._key_locks.setdefault(key, threading.Lock())
+
+    def get_job(self, key: str):
+        with self._lock:
+            return self._get(self._jobs, key)
+
+    def set_job(self, key: str, value) -> None:
+        with self._lock:
+            self._set(self._jobs, key, value)
+
+    def remove_job(self, key: str) -> None:
+        with self._lock:
+            self._jobs.pop(key, None)
+
+    def clear(self):
+        with self._lock:
+            self._results.clear()
+            self._jobs.clear()
+            self._key_locks.clear()
+
+    def stats(self):
+        with self._lock:
+            return {
+                "hits": self.hits,
+                "misses": self.misses,
+                "coalesced": self.coalesced,
+                "results": len(self._results),
+                "jobs": len(self._jobs),
+                "ttl": self.ttl,
+                "max_entries": self.max_entries,
+            }
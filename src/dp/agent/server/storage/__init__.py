@@ -1,4 +1,6 @@
-from .base_storage import BaseStorage
+from urllib.parse import urlparse
+
+from .base_storage import BaseStorage, run_async
 from .bohrium_storage import BohriumStorage
 from .local_storage import LocalStorage
 from .oss_storage import OSSStorage
@@ -12,3 +14,13 @@ storage_dict = {
     "http": HTTPStorage,
     "https": HTTPSStorage,
 }
+
+
+def parse_uri(uri):
+    scheme = urlparse(uri).scheme
+    if scheme == "":
+        key = uri
+        scheme = "local"
+    else:
+        key = uri[len(scheme)+3:]
+    return scheme, key
@@ -1,10 +1,139 @@
+import asyncio
+import contextvars
+import fcntl
+import functools
+import logging
 import os
+import random
+import shutil
 import tarfile
+import tempfile
+import threading
+import time
 from abc import ABC, abstractmethod
-from typing import List
+from concurrent.futures import ThreadPoolExecutor
+from typing import BinaryIO, Callable, List, Optional
+
+config = {
+    "download_workers": int(os.environ.get(
+        "DP_AGENT_STORAGE_DOWNLOAD_WORKERS", "8")),
+    "download_retries": int(os.environ.get(
+        "DP_AGENT_STORAGE_DOWNLOAD_RETRIES", "3")),
+    "retry_backoff": float(os.environ.get(
+        "DP_AGENT_STORAGE_RETRY_BACKOFF", "0.5")),
+    "async_workers": int(os.environ.get(
+        "DP_AGENT_STORAGE_ASYNC_WORKERS", "32")),
+}
+logger = logging.getLogger(__name__)
+FICLONE = 0x40049409
+_async_pool = None
+_async_pool_lock = threading.Lock()
+
+
+def get_async_pool() -> ThreadPoolExecutor:
+    """
+    The thread pool shared by the async API of storages without a native
+    async SDK, DP_AGENT_STORAGE_ASYNC_WORKERS threads at most
+    """
+    global _async_pool
+    with _async_pool_lock:
+        if _async_pool is None:
+            _async_pool = ThreadPoolExecutor(
+                max_workers=config["async_workers"],
+                thread_name_prefix="storage-async")
+        return _async_pool
+
+
+async def run_async(fn: Callable, *args, **kwargs):
+    """
+    Run a blocking storage call in the storage thread pool, so that the
+    event loop keeps serving other requests while it transfers
+    """
+    loop = asyncio.get_running_loop()
+    ctx = contextvars.copy_context()
+    return await loop.run_in_executor(
+        get_async_pool(), functools.partial(ctx.run, fn, *args, **kwargs))
+
+
+def link_file(src, dst, hardlink=True):
+    """
+    Materialize src at dst without copying data when possible: reflink
+    (copy-on-write clone) first, then hardlink unless hardlink is False
+    (dst would share its data with src), then a plain copy
+    """
+    if os.path.lexists(dst):
+        os.remove(dst)
+    try:
+        with open(src, "rb") as fsrc, open(dst, "wb") as fdst:
+            fcntl.ioctl(fdst.fileno(), FICLONE, fsrc.fileno())
+        shutil.copystat(src, dst)
+        return "reflink"
+    except OSError:
+        os.remove(dst)
+    if hardlink:
+        try:
+            os.link(src, dst)
+            return "hardlink"
+        except OSError:
+            pass
+    shutil.copy2(src, dst)
+    return "copy"
+
+
+def is_retryable(e: Exception) -> bool:
+    """Whether a failed transfer may succeed if retried"""
+    if isinstance(e, (FileNotFoundError, IsADirectoryError,
+                      NotImplementedError)):
+        return False
+    status = getattr(e, "status", None) or getattr(
+        getattr(e, "response", None), "status_code", None)
+    return not (isinstance(status, int) and 400 <= status < 500 and
+                status not in [408, 429])
+
+
+def get_items(key: str, objs: List[str], path: str) -> list:
+    """(object, local path) of the objects under prefix key in path"""
+    items = []
+    for obj in objs:
+        rel_path = obj[len(key):]
+        if rel_path[:1] == "/":
+            rel_path = rel_path[1:]
+        items.append((obj, os.path.join(path, rel_path)))
+    return items
+
+
+class DownloadProgress:
+    def __init__(self, total: int, callback: Optional[Callable] = None):
+        """
+        Aggregated progress of downloading many objects, callback is called
+        with (finished objects, total objects, finished bytes) after each
+        object
+        """
+        self.total = total
+        self.callback = callback
+        self.done = 0
+        self.bytes = 0
+        self._lock = threading.Lock()
+
+    def update(self, nbytes: int) -> None:
+        with self._lock:
+            self.done += 1
+            self.bytes += nbytes
+            done, total, nbytes = self.done, self.total, self.bytes
+            if self.callback is not None:
+                self.callback(done, total, nbytes)
+        if done == total or done % 100 == 0:
+            logger.info("Downloaded %d/%d objects (%d bytes)" % (
+                done, total, nbytes))
 
 
 class BaseStorage(ABC):
+    # objects of a prefix downloaded concurrently, and the attempts of each
+    # object, DP_AGENT_STORAGE_DOWNLOAD_WORKERS and
+    # DP_AGENT_STORAGE_DOWNLOAD_RETRIES by default
+    download_workers = None
+    download_retries = None
+
     @abstractmethod
     def _upload(self, key: str, path: str) -> str:
         """
@@ -19,6 +148,20 @@ class BaseStorage(ABC):
         """
         pass
 
+    def _upload_stream(self, key: str, stream: BinaryIO) -> str:
+        """
+        Upload data read from a (non-seekable) stream to key. All storages
+        of this package override it to stream the data; this default, left
+        for storages which can only upload files of known size, spools the
+        stream to a temporary file. An error raised by stream.read must
+        abort the upload without creating the object
+        """
+        with tempfile.NamedTemporaryFile(
+                suffix="_" + os.path.basename(key)) as f:
+            shutil.copyfileobj(stream, f)
+            f.flush()
+            return self._upload(key, f.name)
+
     @abstractmethod
     def list(self, prefix: str, recursive: bool = False) -> List[str]:
         pass
@@ -31,40 +174,237 @@ class BaseStorage(ABC):
     def get_md5(self, key: str) -> str:
         pass
 
-    def download(self, key: str, path: str) -> str:
+    def resolve_key(self, key: str, workdir: str) -> str:
+        """
+        Resolve a key given relative to the job workdir, only meaningful
+        for storages whose keys are local paths
+        """
+        return key
+
+    def download(self, key: str, path: str,
+                 workdir: Optional[str] = None,
+                 workers: Optional[int] = None,
+                 progress: Optional[Callable] = None) -> str:
+        """
+        Download key into the directory path and return the local path.
+        If workdir is given, relative paths are resolved against it without
+        changing the working directory and the returned path stays relative.
+        If key is a prefix, its objects are downloaded by up to workers
+        threads, each object retried with backoff, and progress is called
+        with (finished objects, total objects, finished bytes)
+        """
+        if workdir is not None:
+            key = self.resolve_key(key, workdir)
+            if not os.path.isabs(path):
+                local_path = self.download(key, os.path.join(workdir, path),
+                                           workers=workers,
+                                           progress=progress)
+                return os.path.relpath(local_path, workdir)
         objs = self.list(prefix=key, recursive=True)
         if objs == [key]:
             path = os.path.join(path, os.path.basename(key.split("?")[0]))
-            self._download(key=key, path=path)
+            self._download_with_retry(key, path)
+            if progress is not None:
+                progress(1, 1, os.path.getsize(path))
             if path[-4:] == ".tgz":
                 path = extract(path)
         else:
-            for obj in objs:
-                rel_path = obj[len(key):]
-                if rel_path[:1] == "/":
-                    rel_path = rel_path[1:]
-                file_path = os.path.join(path, rel_path)
-                self._download(key=obj, path=file_path)
+            self.download_objects(get_items(key, objs, path), workers,
+                                  progress)
         return path
 
-    def upload(self, key: str, path: str) -> str:
+    def download_objects(self, items, workers: Optional[int] = None,
+                         progress: Optional[Callable] = None) -> None:
+        """
+        Download (key, path) items concurrently by up to workers threads
+        """
+        # create the directories up front, so that workers never race on
+        # creating a common parent
+        for d in sorted(set(os.path.dirname(p) for _, p in items)):
+            if d:
+                os.makedirs(d, exist_ok=True)
+        tracker = DownloadProgress(len(items), progress)
+
+        def download(item):
+            self._download_with_retry(*item)
+            tracker.update(os.path.getsize(item[1]))
+
+        workers = workers or self.download_workers or \
+            config["download_workers"]
+        if workers <= 1 or len(items) <= 1:
+            for item in items:
+                download(item)
+            return
+        pool = ThreadPoolExecutor(max_workers=min(workers, len(items)),
+                                  thread_name_prefix="storage-download")
+        try:
+            for future in [pool.submit(download, i) for i in items]:
+                future.result()
+        finally:
+            pool.shutdown(wait=True, cancel_futures=True)
+
+    def _download_with_retry(self, key: str, path: str) -> str:
+        attempt = 0
+        while True:
+            try:
+                return self._download(key=key, path=path)
+            except Exception as e:
+                time.sleep(self._retry_delay(key, attempt, e))
+            attempt += 1
+
+    async def _adownload_with_retry(self, key: str, path: str) -> str:
+        attempt = 0
+        while True:
+            try:
+                return await self._adownload(key=key, path=path)
+            except Exception as e:
+                await asyncio.sleep(self._retry_delay(key, attempt, e))
+            attempt += 1
+
+    def _retry_delay(self, key: str, attempt: int, e: Exception) -> float:
+        """
+        The backoff before retrying a failed download of key, e is raised
+        if it is not retried
+        """
+        retries = self.download_retries
+        if retries is None:
+            retries = config["download_retries"]
+        if attempt >= retries or not is_retryable(e):
+            raise e
+        delay = config["retry_backoff"] * 2 ** attempt
+        delay *= 1 + random.uniform(-0.1, 0.1)
+        logger.warning("Failed to download %s (%s), retry in %.1fs"
+                       % (key, e, delay))
+        return delay
+
+    def upload(self, key: str, path: str,
+               workdir: Optional[str] = None) -> str:
+        """
+        Upload a file or a directory (as a .tgz archive) under key. If
+        workdir is given, relative paths are resolved against it
+        """
+        if workdir is not None:
+            key = self.resolve_key(key, workdir)
+            path = os.path.join(workdir, path)
         if os.path.isfile(path):
             key = os.path.join(key, os.path.basename(path))
             key = self._upload(key, path)
         elif os.path.isdir(path):
-            cwd = os.getcwd()
-            if os.path.dirname(path):
-                os.chdir(os.path.dirname(path))
-            fname = os.path.basename(path)
-            with tarfile.open(fname + ".tgz", "w:gz", dereference=True) as tf:
-                tf.add(fname)
-            os.chdir(cwd)
+            fname = os.path.basename(os.path.normpath(path))
             key = os.path.join(key, fname + ".tgz")
-            key = self._upload(key, "%s.tgz" % path)
-            os.remove("%s.tgz" % path)
+            key = self.upload_dir_archive(key, path, fname)
+        return key
+
+    # Async counterparts of the storage API, to be awaited from the event
+    # loop of the server. They run the blocking implementation in the
+    # storage thread pool, storages with a native async SDK override them.
+    # aupload and adownload transfer single files through _aupload and
+    # _adownload, so overriding those is enough
+
+    async def _aupload(self, key: str, path: str) -> str:
+        return await run_async(self._upload, key, path)
+
+    async def _adownload(self, key: str, path: str) -> str:
+        return await run_async(self._download, key, path)
+
+    async def aupload(self, key: str, path: str,
+                      workdir: Optional[str] = None) -> str:
+        if workdir is not None:
+            key = self.resolve_key(key, workdir)
+            path = os.path.join(workdir, path)
+        if os.path.isfile(path):
+            key = os.path.join(key, os.path.basename(path))
+            return await self._aupload(key, path)
+        return await run_async(self.upload, key, path)
+
+    async def adownload(self, key: str, path: str,
+                        workdir: Optional[str] = None,
+                        workers: Optional[int] = None,
+                        progress: Optional[Callable] = None) -> str:
+        if workdir is not None:
+            key = self.resolve_key(key, workdir)
+            if not os.path.isabs(path):
+                local_path = await self.adownload(
+                    key, os.path.join(workdir, path), workers=workers,
+                    progress=progress)
+                return os.path.relpath(local_path, workdir)
+        objs = await self.alist(prefix=key, recursive=True)
+        if objs == [key]:
+            path = os.path.join(path, os.path.basename(key.split("?")[0]))
+            await self._adownload_with_retry(key, path)
+            if progress is not None:
+                progress(1, 1, os.path.getsize(path))
+            if path[-4:] == ".tgz":
+                path = await run_async(extract, path)
+        else:
+            await run_async(self.download_objects, get_items(
+                key, objs, path), workers, progress)
+        return path
+
+    async def alist(self, prefix: str, recursive: bool = False) -> List[str]:
+        return await run_async(self.list, prefix, recursive)
+
+    async def acopy(self, src: str, dst: str) -> None:
+        return await run_async(self.copy, src, dst)
+
+    async def aget_md5(self, key: str) -> str:
+        return await run_async(self.get_md5, key)
+
+    def upload_dir_archive(self, key: str, path: str, arcname: str) -> str:
+        """
+        Upload directory path to key as a .tgz archive, the archive is
+        streamed into the storage without writing it to disk
+        """
+        r, w = os.pipe()
+        errors = []
+
+        def write_archive():
+            fw = os.fdopen(w, "wb")
+            try:
+                with tarfile.open(fileobj=fw, mode="w|gz",
+                                  dereference=True) as tf:
+                    tf.add(path, arcname=arcname)
+            except Exception as e:
+                # recorded before closing the pipe, so that the reader
+                # never takes the truncated archive for a complete one
+                errors.append(e)
+            finally:
+                fw.close()
+
+        writer = threading.Thread(target=write_archive, daemon=True)
+        writer.start()
+        try:
+            with os.fdopen(r, "rb") as fr:
+                key = self._upload_stream(
+                    key, ArchiveStream(fr, writer, errors))
+        finally:
+            writer.join()
+        if errors:
+            raise errors[0]
         return key
 
 
+class ArchiveStream:
+    def __init__(self, f: BinaryIO, writer: threading.Thread,
+                 errors: list):
+        """
+        Read end of an archive pipe, raising the error of the archive
+        writer at the end of the data, before the storage could finalize
+        the upload of a truncated archive
+        """
+        self.f = f
+        self.writer = writer
+        self.errors = errors
+
+    def read(self, size: int = -1) -> bytes:
+        data = self.f.read(size)
+        if not data or size is None or size < 0:
+            self.writer.join()
+            if self.errors:
+                raise self.errors[0]
+        return data
+
+
 def extract(path):
     with tarfile.open(path, "r:gz") as tf:
         common = os.path.commonpath(tf.getnames())
@@ -1,9 +1,13 @@
+import base64
 import json
 import os
+import threading
+import time
 from typing import Optional
 
 import requests
 import tiefblue
+from requests.adapters import HTTPAdapter
 
 from .base_storage import BaseStorage
 
@@ -25,6 +29,11 @@ config = {
     "openapi_url": os.environ.get("BOHRIUM_OPENAPI_URL",
                                   "https://openapi.dp.tech"),
     "app_key": os.environ.get("BOHRIUM_APP_KEY", "agent"),
+    "pool_size": int(os.environ.get("BOHRIUM_POOL_SIZE", "16")),
+    "token_renew_before": float(os.environ.get(
+        "BOHRIUM_TOKEN_RENEW_BEFORE", "300")),
+    "part_size": int(os.environ.get("BOHRIUM_PART_SIZE",
+                                    str(50 * 1024 * 1024))),
 }
 
 
@@ -68,6 +77,64 @@ def _login(login_url=None, username=None, phone=None, password=None):
     return res["data"]["token"]
 
 
+def get_token_expiry(token):
+    """Expiry time of a JWT token, None if it is not a JWT with exp"""
+    try:
+        payload = token.split(".")[1]
+        payload += "=" * (-len(payload) % 4)
+        return float(json.loads(base64.urlsafe_b64decode(payload))["exp"])
+    except Exception:
+        return None
+
+
+class SessionView:
+    """
+    A session with its own headers sending requests through a shared
+    session, so that its connection pool is reused
+    """
+    def __init__(self, session, headers):
+        self.session = session
+        self.headers = headers
+
+    def request(self, method, url, **kwargs):
+        headers = dict(self.headers)
+        headers.update(kwargs.pop("headers", None) or {})
+        return self.session.request(method, url, headers=headers, **kwargs)
+
+    def get(self, url, **kwargs):
+        return self.request("GET", url, **kwargs)
+
+    def post(self, url, **kwargs):
+        return self.request("POST", url, **kwargs)
+
+    def delete(self, url, **kwargs):
+        return self.request("DELETE", url, **kwargs)
+
+
+class TiefblueClient(tiefblue.Client):
+    def __init__(self, base_url, get_token, pool_size=None):
+        """
+        A tiefblue client safe to share across threads, which reuses
+        kept-alive connections and reads the current token of each request
+        from get_token
+        """
+        super().__init__(base_url)
+        self.get_token = get_token
+        pool_size = pool_size or config["pool_size"]
+        self.shared_session = requests.Session()
+        adapter = HTTPAdapter(pool_connections=pool_size,
+                              pool_maxsize=pool_size)
+        self.shared_session.mount("http://", adapter)
+        self.shared_session.mount("https://", adapter)
+
+    def _session(self, header_param: dict = None):
+        header = {"Authorization": "Bearer %s" % self.get_token()}
+        if header_param is not None:
+            header[self.TIEFBLUE_HEADER_KEY] = self._dump_parameter(
+                header_param)
+        return SessionView(self.shared_session, header)
+
+
 class BohriumStorage(BaseStorage):
     def __init__(
             self,
@@ -86,6 +153,9 @@ class BohriumStorage(BaseStorage):
             access_key: Optional[str] = None,
             openapi_url: Optional[str] = None,
             app_key: Optional[str] = None,
+            pool_size: Optional[int] = None,
+            token_renew_before: Optional[float] = None,
+            part_size: Optional[int] = None,
     ) -> None:
         """Bohrium storage interface
 
@@ -99,6 +169,12 @@ class BohriumStorage(BaseStorage):
             prefix: Artifact storage prefix in user's personal storage or
                 project storage
             ticket: The ticket of bohrium
+            pool_size: Maximum number of kept-alive connections to
+                tiefblue, shared by parallel transfers
+            token_renew_before: Renew the storage token this many seconds
+                before it expires, if its expiry is known
+            part_size: Bytes of each part of a streamed upload, 50 MiB by
+                default
         """
         self.bohrium_url = bohrium_url if bohrium_url is not None else \
             config["bohrium_url"]
@@ -123,8 +199,45 @@ class BohriumStorage(BaseStorage):
         self.openapi_url = openapi_url if openapi_url is not None else \
             config["openapi_url"]
         self.app_key = app_key if app_key is not None else config["app_key"]
+        self.token_renew_before = token_renew_before \
+            if token_renew_before is not None else \
+            config["token_renew_before"]
+        self.part_size = part_size or config["part_size"]
+        self._token_lock = threading.Lock()
+        self.token_expiry = get_token_expiry(self.token) \
+            if self.token is not None else None
         if self.token is None:
             self.get_token()
+        self.client = TiefblueClient(self.tiefblue_url, lambda: self.token,
+                                     pool_size)
+
+    def renew_token(self):
+        """
+        Renew the token if it is about to expire. While it is still valid,
+        one caller renews it and the others go on with the current token
+        """
+        expiry = self.token_expiry
+        if expiry is None or \
+                time.time() < expiry - self.token_renew_before:
+            return
+        token = self.token
+        if time.time() >= expiry:
+            self.refresh_token(token)
+        elif self._token_lock.acquire(blocking=False):
+            try:
+                if self.token == token:
+                    self.get_token()
+            finally:
+                self._token_lock.release()
+
+    def refresh_token(self, stale_token):
+        """
+        Refresh an expired token, concurrent callers which got the same
+        expired token only refresh it once
+        """
+        with self._token_lock:
+            if self.token == stale_token:
+                self.get_token()
 
     def get_token(self, retry=1):
         url = self.bohrium_url + "/brm/v1/storage/token"
@@ -155,6 +268,7 @@ class BohriumStorage(BaseStorage):
         res = json.loads(rsp.text)
         _raise_error(res, "get storage token")
         self.token = res["data"]["token"]
+        self.token_expiry = get_token_expiry(self.token)
         self.prefix = res["data"]["path"]
         self.sharePath = res["data"]["sharePath"]
         self.userSharePath = res["data"]["userSharePath"]
@@ -164,57 +278,67 @@ class BohriumStorage(BaseStorage):
             return self.prefix + key
         return key
 
-    def _upload(self, key, path):
-        key = self.prefixing(key)
-        client = tiefblue.Client(base_url=self.tiefblue_url, token=self.token)
+    def call(self, fn):
+        """
+        Call fn with the shared client, renewing the token before it
+        expires, and refreshing it and retrying once if it is rejected
+        """
+        self.renew_token()
+        token = self.token
         try:
-            client.upload_from_file(
-                key, path, progress_bar=config["upload_progress"])
+            return fn(self.client)
         except tiefblue.client.TiefblueException as e:
-            if e.code == 190001:
-                self.get_token()
-                client = tiefblue.Client(base_url=self.tiefblue_url,
-                                         token=self.token)
-                client.upload_from_file(
-                    key, path, progress_bar=config["upload_progress"])
-            else:
+            if e.code != 190001:
                 raise e
+            self.refresh_token(token)
+            return fn(self.client)
+
+    def _upload(self, key, path):
+        key = self.prefixing(key)
+        self.call(lambda client: client.upload_from_file(
+            key, path, progress_bar=config["upload_progress"]))
+        return key
+
+    def _upload_stream(self, key, stream):
+        key = self.prefixing(key)
+        parameter = tiefblue.client.Parameter()
+        parameter.contentDisposition = 'attachment; filename="%s"' % \
+            os.path.basename(key)
+        chunk = stream.read(self.part_size)
+        next_chunk = stream.read(self.part_size) \
+            if len(chunk) == self.part_size else b""
+        if not next_chunk:
+            self.call(lambda client: client.write(key, chunk, parameter))
+            return key
+        initial_key = self.call(lambda client: client.init_upload_by_part(
+            key, parameter))["initialKey"]
+        part_string = []
+        number = 1
+        while chunk:
+            # each part is retried with a refreshed token if rejected
+            part_string.append(self.call(
+                lambda client: client.upload_by_part(
+                    key, initial_key, chunk_size=len(chunk), number=number,
+                    body=chunk))["partString"])
+            chunk, next_chunk = next_chunk, stream.read(self.part_size)
+            number += 1
+        self.call(lambda client: client.complete_upload_by_part(
+            key, initial_key, part_string))
         return key
 
     def _download(self, key, path):
         key = self.prefixing(key)
-        client = tiefblue.Client(base_url=self.tiefblue_url, token=self.token)
         os.makedirs(os.path.dirname(path), exist_ok=True)
-        try:
-            client.download_from_file(key, path)
-        except tiefblue.client.TiefblueException as e:
-            if e.code == 190001:
-                self.get_token()
-                client = tiefblue.Client(base_url=self.tiefblue_url,
-                                         token=self.token)
-                client.download_from_file(key, path)
-            else:
-                raise e
+        self.call(lambda client: client.download_from_file(key, path))
         return path
 
     def list(self, prefix, recursive=False):
         prefix = self.prefixing(prefix)
-        client = tiefblue.Client(base_url=self.tiefblue_url, token=self.token)
         keys = []
         next_token = ""
         while True:
-            try:
-                res = client.list(prefix=prefix, recursive=recursive,
-                                  next_token=next_token)
-            except tiefblue.client.TiefblueException as e:
-                if e.code == 190001:
-                    self.get_token()
-                    client = tiefblue.Client(base_url=self.tiefblue_url,
-                                             token=self.token)
-                    res = client.list(prefix=prefix, recursive=recursive,
-                                      next_token=next_token)
-                else:
-                    raise e
+            res = self.call(lambda client: client.list(
+                prefix=prefix, recursive=recursive, next_token=next_token))
             for obj in res["objects"]:
                 if (recursive or obj["path"] == prefix) and \
                         obj["path"].endswith("/"):
@@ -228,31 +352,11 @@ class BohriumStorage(BaseStorage):
     def copy(self, src, dst):
         src = self.prefixing(src)
         dst = self.prefixing(dst)
-        client = tiefblue.Client(base_url=self.tiefblue_url, token=self.token)
-        try:
-            client.copy(src, dst)
-        except tiefblue.client.TiefblueException as e:
-            if e.code == 190001:
-                self.get_token()
-                client = tiefblue.Client(base_url=self.tiefblue_url,
-                                         token=self.token)
-                client.copy(src, dst)
-            else:
-                raise e
+        self.call(lambda client: client.copy(src, dst))
 
     def get_md5(self, key):
         key = self.prefixing(key)
-        client = tiefblue.Client(base_url=self.tiefblue_url, token=self.token)
-        try:
-            meta = client.meta(key)
-        except tiefblue.client.TiefblueException as e:
-            if e.code == 190001:
-                self.get_token()
-                client = tiefblue.Client(base_url=self.tiefblue_url,
-                                         token=self.token)
-                meta = client.meta(key)
-            else:
-                raise e
+        meta = self.call(lambda client: client.meta(key))
         return meta["entityTag"] if "entityTag" in meta else ""
 
     def get_http_url(self, key):
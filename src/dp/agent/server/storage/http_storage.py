@@ -1,19 +1,83 @@
+import hashlib
+import json
 import os
-import shutil
+import stat
+import threading
+from concurrent.futures import ThreadPoolExecutor
 
 import requests
+from requests.adapters import HTTPAdapter
 
-from .base_storage import BaseStorage
+from .base_storage import BaseStorage, link_file
 
 config = {
     "plugin_type": os.environ.get("HTTP_PLUGIN_TYPE"),
+    "pool_size": int(os.environ.get("HTTP_POOL_SIZE", "16")),
+    "range_threshold": int(os.environ.get("HTTP_RANGE_THRESHOLD",
+                                          str(64 * 1024 * 1024))),
+    "part_size": int(os.environ.get("HTTP_PART_SIZE", str(8 * 1024 * 1024))),
+    "num_threads": int(os.environ.get("HTTP_NUM_THREADS", "4")),
+    "cache_dir": os.environ.get("HTTP_CACHE_DIR"),
 }
+CHUNK_SIZE = 1024 * 1024
+
+
+def link_or_copy(src, dst, read_only=False):
+    """
+    Reflink src to dst, or else copy it, so that the cache and the files
+    handed out never share their data. Cache entries are read-only
+    """
+    link_file(src, dst, hardlink=False)
+    mode = os.stat(dst).st_mode
+    os.chmod(dst, mode & ~0o222 if read_only else mode | stat.S_IWUSR)
+
+
+def write_json(path, obj):
+    tmp = path + ".tmp"
+    with open(tmp, "w") as f:
+        json.dump(obj, f)
+    os.replace(tmp, path)
+
+
+def read_json(path):
+    try:
+        with open(path, "r") as f:
+            return json.load(f)
+    except (OSError, ValueError):
+        return None
+
+
+def get_size(resp):
+    """The size of the object of a full or partial response"""
+    if resp.status_code == 206:
+        total = resp.headers.get("Content-Range", "").split("/")[-1]
+        return int(total) if total.isdigit() else None
+    if "Content-Length" in resp.headers:
+        return int(resp.headers["Content-Length"])
+    return None
 
 
 class HTTPStorage(BaseStorage):
     scheme = "http"
 
-    def __init__(self, plugin: dict = None):
+    def __init__(self, plugin: dict = None, pool_size: int = None,
+                 range_threshold: int = None, part_size: int = None,
+                 num_threads: int = None, cache_dir: str = None):
+        """HTTP storage, downloading through a shared pooled session
+
+        Args:
+            plugin: The storage config used for uploading, whose keys are
+                served over HTTP
+            pool_size: Maximum number of kept-alive connections per host
+            range_threshold: Files of at least this many bytes are
+                downloaded in parallel byte ranges if the server supports
+                them, interrupted downloads of them resume from the ranges
+                already downloaded
+            part_size: Bytes of each range
+            num_threads: The number of ranges downloaded in parallel
+            cache_dir: If set, downloaded files are kept there and
+                downloaded again only if their ETag/Last-Modified changed
+        """
         self.plugin = None
         if plugin is None and config["plugin_type"] is not None:
             plugin = {"type": config["plugin_type"]}
@@ -21,6 +85,17 @@ class HTTPStorage(BaseStorage):
             from . import storage_dict
             storage_type = plugin.pop("type")
             self.plugin = storage_dict[storage_type](**plugin)
+        self.pool_size = pool_size or config["pool_size"]
+        self.range_threshold = range_threshold or config["range_threshold"]
+        self.part_size = part_size or config["part_size"]
+        self.num_threads = num_threads or config["num_threads"]
+        self.cache_dir = cache_dir or config["cache_dir"]
+        self.session = requests.Session()
+        self.session.verify = False
+        adapter = HTTPAdapter(pool_connections=self.pool_size,
+                              pool_maxsize=self.pool_size)
+        self.session.mount("http://", adapter)
+        self.session.mount("https://", adapter)
 
     def _upload(self, key, path):
         if self.plugin is not None:
@@ -30,19 +105,153 @@ class HTTPStorage(BaseStorage):
         else:
             raise NotImplementedError()
 
+    def _upload_stream(self, key, stream):
+        if self.plugin is not None:
+            key = self.plugin._upload_stream(key, stream)
+            url = self.plugin.get_http_url(key)
+            return url.split("://")[1]
+        else:
+            raise NotImplementedError()
+
+    def get_cache_path(self, url):
+        return os.path.join(self.cache_dir,
+                            hashlib.sha256(url.encode()).hexdigest())
+
     def _download(self, key, path):
-        os.makedirs(os.path.dirname(path), exist_ok=True)
-        sess = requests.session()
+        if os.path.dirname(path):
+            os.makedirs(os.path.dirname(path), exist_ok=True)
         url = self.scheme + "://" + key
-        with sess.get(url, stream=True, verify=False) as req:
-            req.raise_for_status()
-            with open(path, 'w') as f:
-                shutil.copyfileobj(req.raw, f.buffer)
+        headers = {}
+        cached = None
+        if self.cache_dir is not None:
+            cached = read_json(self.get_cache_path(url) + ".json")
+            if not os.path.isfile(self.get_cache_path(url)):
+                cached = None
+            if cached is not None and cached.get("etag"):
+                headers["If-None-Match"] = cached["etag"]
+            if cached is not None and cached.get("last_modified"):
+                headers["If-Modified-Since"] = cached["last_modified"]
+        part = path + ".part"
+        state = read_json(part + ".json")
+        offset = 0
+        if state is not None and "done" not in state and \
+                os.path.isfile(part):
+            # resume an interrupted single stream download unless the
+            # object changed
+            offset = os.path.getsize(part)
+            validator = state.get("etag") or state.get("last_modified")
+            if validator and 0 < offset < (state.get("size") or 0):
+                headers["Range"] = "bytes=%d-" % offset
+                headers["If-Range"] = validator
+            else:
+                offset = 0
+        with self.session.get(url, stream=True, headers=headers) as resp:
+            if resp.status_code == 304:
+                link_or_copy(self.get_cache_path(url), path)
+                return path
+            resp.raise_for_status()
+            if resp.status_code != 206:
+                offset = 0
+            info = {
+                "etag": resp.headers.get("ETag"),
+                "last_modified": resp.headers.get("Last-Modified"),
+                "size": get_size(resp),
+            }
+            if state is not None and (
+                    {k: state.get(k) for k in info} != info or
+                    not os.path.isfile(part) or
+                    not (info["etag"] or info["last_modified"])):
+                # the object changed, or cannot tell
+                state = None
+            ranges = resp.headers.get("Accept-Ranges") == "bytes" and \
+                info["size"] is not None
+            if offset == 0 and ranges and (
+                    info["size"] >= self.range_threshold or
+                    state is not None and "done" in state):
+                resp.close()
+                self._download_ranges(url, part, info, state)
+            else:
+                self._download_stream(resp, part, info, offset)
+        os.replace(part, path)
+        if os.path.isfile(part + ".json"):
+            os.remove(part + ".json")
+        if self.cache_dir is not None and (
+                info["etag"] or info["last_modified"]):
+            os.makedirs(self.cache_dir, exist_ok=True)
+            cache_path = self.get_cache_path(url)
+            link_or_copy(path, cache_path, read_only=True)
+            write_json(cache_path + ".json", info)
         return path
 
+    def _download_stream(self, resp, part, info, offset=0):
+        """
+        Write the body of resp into part from offset, recording the object
+        in a state file next to it so that a later call resumes
+        """
+        if offset == 0 and (info["etag"] or info["last_modified"]):
+            write_json(part + ".json", info)
+        elif not resp.headers.get("Content-Range", "").startswith(
+                "bytes %d-" % offset):
+            raise RuntimeError("Unexpected range of %s" % resp.url)
+        with open(part, "ab" if offset > 0 else "wb") as f:
+            for chunk in resp.iter_content(CHUNK_SIZE):
+                f.write(chunk)
+            if info["size"] is not None and f.tell() != info["size"]:
+                raise RuntimeError("Incomplete download of %s" % resp.url)
+
+    def _download_ranges(self, url, part, info, state=None):
+        """
+        Download url into part in parallel byte ranges, recording finished
+        ranges in a state file next to it so that a later call resumes
+        """
+        size = info["size"]
+        if state is None:
+            state = dict(info, done=[])
+            with open(part, "wb") as f:
+                f.truncate(size)
+        done = set(state["done"])
+        lock = threading.Lock()
+        headers = {}
+        if info["etag"]:
+            headers["If-Match"] = info["etag"]
+        elif info["last_modified"]:
+            headers["If-Unmodified-Since"] = info["last_modified"]
+
+        def download(start):
+            end = min(start + self.part_size, size) - 1
+            with self.session.get(url, stream=True, headers=dict(
+                    headers, Range="bytes=%d-%d" % (start, end))) as resp:
+                resp.raise_for_status()
+                if resp.status_code != 206:
+                    raise RuntimeError("Server ignored the range of %s" % url)
+                with open(part, "r+b") as f:
+                    f.seek(start)
+                    for chunk in resp.iter_content(CHUNK_SIZE):
+                        f.write(chunk)
+                    if f.tell() != end + 1:
+                        raise RuntimeError("Incomplete range of %s" % url)
+            with lock:
+                state["done"].append(start)
+                write_json(part + ".json", state)
+
+        starts = [start for start in range(0, size, self.part_size)
+                  if start not in done]
+        write_json(part + ".json", state)
+        pool = ThreadPoolExecutor(max_workers=max(1, min(
+            self.num_threads, len(starts))), thread_name_prefix="download")
+        try:
+            for future in [pool.submit(download, s) for s in starts]:
+                future.result()
+        finally:
+            pool.shutdown(wait=True, cancel_futures=True)
+
     def list(self, prefix, recursive=False):
         return [prefix]
 
+    async def alist(self, prefix, recursive=False):
+        # a URL lists as itself, nothing to hand to a thread
+        return [prefix]
+
     def copy(self, src, dst):
         raise NotImplementedError()
 
@@ -9,11 +9,26 @@ class LocalStorage(BaseStorage):
     def __init__(self):
         pass
 
+    def resolve_key(self, key, workdir):
+        return os.path.join(workdir, key)
+
     def _upload(self, key, path):
         os.makedirs(os.path.dirname(key), exist_ok=True)
         shutil.copy(path, key)
         return os.path.abspath(key)
 
+    def _upload_stream(self, key, stream):
+        os.makedirs(os.path.dirname(key), exist_ok=True)
+        tmp = "%s.%d.tmp" % (key, os.getpid())
+        try:
+            with open(tmp, "wb") as f:
+                shutil.copyfileobj(stream, f)
+            os.replace(tmp, key)
+        finally:
+            if os.path.exists(tmp):
+                os.remove(tmp)
+        return os.path.abspath(key)
+
     def _download(self, key, path):
         os.makedirs(os.path.dirname(path), exist_ok=True)
         shutil.copy(key, path)
@@ -1,4 +1,5 @@
 import os
+import shutil
 from typing import Optional
 
 import oss2
@@ -14,6 +15,10 @@ class OSSStorage(BaseStorage):
             access_key_id: Optional[str] = None,
             access_key_secret: Optional[str] = None,
             prefix: Optional[str] = None,
+            multipart_threshold: Optional[int] = None,
+            part_size: Optional[int] = None,
+            num_threads: Optional[int] = None,
+            checkpoint_dir: Optional[str] = None,
     ) -> None:
         """OSS storage interface
 
@@ -23,6 +28,15 @@ class OSSStorage(BaseStorage):
             access_key_id: The OSS access key
             access_key_secret: The OSS secret key
             prefix: Artifact storage prefix in the OSS bucket
+            multipart_threshold: Files of at least this many bytes are
+                uploaded in parts and downloaded in ranges, in parallel,
+                100 MiB by default
+            part_size: Bytes of each part or range, 16 MiB by default
+            num_threads: The number of parts or ranges transferred in
+                parallel, 4 by default
+            checkpoint_dir: Directory of the checkpoint files recording the
+                transferred parts, so that an interrupted transfer of the
+                same file resumes instead of starting over
         """
         if endpoint is None:
             endpoint = os.environ.get("OSS_ENDPOINT")
@@ -34,11 +48,25 @@ class OSSStorage(BaseStorage):
             access_key_secret = os.environ.get("OSS_ACCESS_KEY_SECRET")
         if prefix is None:
             prefix = os.environ.get("OSS_PREFIX", "")
+        if multipart_threshold is None:
+            multipart_threshold = int(os.environ.get(
+                "OSS_MULTIPART_THRESHOLD", 100 * 1024 * 1024))
+        if part_size is None:
+            part_size = int(os.environ.get("OSS_PART_SIZE", 16 * 1024 * 1024))
+        if num_threads is None:
+            num_threads = int(os.environ.get("OSS_NUM_THREADS", 4))
+        if checkpoint_dir is None:
+            checkpoint_dir = os.environ.get("OSS_CHECKPOINT_DIR", os.path.join(
+                os.path.expanduser("~"), ".cache", "dp_agent", "oss"))
         self.endpoint = endpoint
         self.bucket_name = bucket_name
         self.access_key_id = access_key_id
         self.access_key_secret = access_key_secret
         self.prefix = prefix
+        self.multipart_threshold = multipart_threshold
+        self.part_size = part_size
+        self.num_threads = num_threads
+        self.checkpoint_dir = checkpoint_dir
         auth = oss2.Auth(access_key_id, access_key_secret)
         bucket = oss2.Bucket(auth, endpoint, bucket_name)
         self.bucket = bucket
@@ -50,14 +78,68 @@ class OSSStorage(BaseStorage):
 
     def _upload(self, key, path):
         key = self.prefixing(key)
-        self.bucket.put_object_from_file(key, path)
+        if os.path.getsize(path) < self.multipart_threshold:
+            self.bucket.put_object_from_file(key, path)
+            return key
+        oss2.resumable_upload(
+            self.bucket, key, path,
+            store=oss2.ResumableStore(root=self.checkpoint_dir, dir="upload"),
+            multipart_threshold=self.multipart_threshold,
+            part_size=self.part_size, num_threads=self.num_threads)
+        return key
+
+    def _upload_stream(self, key, stream):
+        key = self.prefixing(key)
+        # oss2 needs the size of the data of a request, so the stream is
+        # uploaded in parts of part_size bytes read one after another
+        upload_id = self.bucket.init_multipart_upload(key).upload_id
+        try:
+            parts = []
+            while True:
+                chunk = stream.read(self.part_size)
+                if not chunk and parts:
+                    break
+                number = len(parts) + 1
+                res = self.bucket.upload_part(key, upload_id, number, chunk)
+                parts.append(oss2.models.PartInfo(number, res.etag))
+                if not chunk:
+                    break
+            self.bucket.complete_multipart_upload(key, upload_id, parts)
+        except Exception as e:
+            self.bucket.abort_multipart_upload(key, upload_id)
+            raise e
         return key
 
     def _download(self, key, path):
         key = self.prefixing(key)
         if os.path.dirname(path):
             os.makedirs(os.path.dirname(path), exist_ok=True)
-        self.bucket.get_object_to_file(key, path)
+        # objects below the threshold are downloaded in one request, the
+        # size is known from its response rather than a HEAD request
+        result = self.bucket.get_object(key)
+        if result.content_length is None or \
+                result.content_length < self.multipart_threshold:
+            with open(path, "wb") as f:
+                if result.content_length is None:
+                    shutil.copyfileobj(result, f)
+                else:
+                    oss2.utils.copyfileobj_and_verify(
+                        result, f, result.content_length,
+                        request_id=result.request_id)
+            if self.bucket.enable_crc:
+                oss2.utils.check_crc("get", result.client_crc,
+                                     result.server_crc, result.request_id)
+            return path
+        # larger ones in ranges in parallel, resuming an interrupted
+        # download. The downloader of resumable_download is sized by the
+        # response above, since resumable_download would send a HEAD first
+        result.close()
+        downloader = oss2.resumable._ResumableDownloader(
+            self.bucket, key, path, oss2.resumable._ObjectInfo.make(result),
+            part_size=self.part_size, num_threads=self.num_threads,
+            store=oss2.ResumableDownloadStore(root=self.checkpoint_dir,
+                                              dir="download"))
+        downloader.download(result.server_crc)
         return path
 
     def list(self, prefix, recursive=False):
@@ -1,5 +1,9 @@
+import asyncio
 import logging
+import os
+import threading
 import traceback
+from contextlib import contextmanager
 from typing import Any
 
 import mcp
@@ -18,6 +22,43 @@ def get_logger(name, level="INFO",
     return logger
 
 
+# Serializes code which has to change the process-wide working directory,
+# e.g. running a tool in the server process
+cwd_lock = threading.Lock()
+
+
+@contextmanager
+def set_directory(workdir: str):
+    """Change the working directory, callers should hold cwd_lock"""
+    cwd = os.getcwd()
+    os.makedirs(workdir, exist_ok=True)
+    try:
+        os.chdir(workdir)
+        yield
+    finally:
+        os.chdir(cwd)
+
+
+async def acquire_lock(lock):
+    """
+    Acquire a threading lock or semaphore from a coroutine without blocking
+    the event loop
+    """
+    if lock.acquire(blocking=False):
+        return
+    future = asyncio.get_running_loop().run_in_executor(None, lock.acquire)
+    try:
+        await asyncio.shield(future)
+    except asyncio.CancelledError:
+        future.add_done_callback(lambda f: lock.release())
+        raise
+
+
+async def acquire_cwd_lock():
+    """Acquire cwd_lock from a coroutine without blocking the event loop"""
+    await acquire_lock(cwd_lock)
+
+
 class JobResult(BaseModel):
     result: Any
     job_info: dict
@@ -0,0 +1,11 @@
+import pytest
+
+from dp.agent.server import calculation_mcp_server
+
+
+@pytest.fixture(autouse=True)
+def base_dir(tmp_path, monkeypatch):
+    # keep the files of the server, like the job registry, in the test's
+    # own directory
+    monkeypatch.setitem(calculation_mcp_server.config, "base_dir",
+                        str(tmp_path))
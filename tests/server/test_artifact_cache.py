@@ -0,0 +1,66 @@
+import os
+
+from dp.agent.server.artifact_cache import ArtifactCache
+from dp.agent.server.storage import LocalStorage
+
+
+class CountingStorage(LocalStorage):
+    def __init__(self):
+        self.downloads = 0
+
+    def _download(self, key, path):
+        self.downloads += 1
+        return super()._download(key, path)
+
+
+def test_artifact_cache(tmp_path):
+    storage = CountingStorage()
+    src = tmp_path / "src"
+    src.mkdir()
+    for name in ["a", "b", "c"]:
+        (src / name).write_text(name * 100)
+    cache = ArtifactCache(str(tmp_path / "cache"), max_size=250)
+
+    path = cache.fetch(storage, str(src / "a"), "x://a",
+                       str(tmp_path / "job1" / "inputs"))
+    assert path == str(tmp_path / "job1" / "inputs" / "a")
+    path = cache.fetch(storage, str(src / "a"), "x://a",
+                       str(tmp_path / "job2" / "inputs"))
+    assert open(path).read() == "a" * 100
+    assert storage.downloads == 1
+    stats = cache.stats()
+    assert stats["hits"] == 1 and stats["misses"] == 1
+    assert stats["bytes_saved"] == 100
+
+    cache.fetch(storage, str(src / "b"), "x://b", str(tmp_path / "job3"))
+    cache.fetch(storage, str(src / "c"), "x://c", str(tmp_path / "job3"))
+    stats = cache.stats()
+    assert stats["evictions"] == 1 and stats["entries"] == 2
+    assert stats["size"] <= 250
+    # the evicted artifact stays in the workdirs linked to it
+    assert os.path.isfile(tmp_path / "job2" / "inputs" / "a")
+
+    # entries survive restarts
+    cache = ArtifactCache(str(tmp_path / "cache"), max_size=250)
+    cache.fetch(storage, str(src / "c"), "x://c", str(tmp_path / "job4"))
+    assert cache.stats()["hits"] == 1
+    assert storage.downloads == 3
+
+
+def test_mutated_input(tmp_path):
+    storage = CountingStorage()
+    (tmp_path / "data").write_text("original")
+    cache = ArtifactCache(str(tmp_path / "cache"))
+    path = cache.fetch(storage, str(tmp_path / "data"), "x://data",
+                       str(tmp_path / "job1"))
+    # a tool editing its input in place
+    with open(path, "w") as f:
+        f.write("modified")
+    path = cache.fetch(storage, str(tmp_path / "data"), "x://data",
+                       str(tmp_path / "job2"))
+    assert open(path).read() == "original"
+    assert storage.downloads == 1
+    # cache entries are read-only
+    entry = os.listdir(tmp_path / "cache")[0]
+    mode = os.stat(tmp_path / "cache" / entry / "data" / "data").st_mode
+    assert mode & 0o222 == 0
@@ -0,0 +1,155 @@
+import asyncio
+import time
+from pathlib import Path
+
+from dp.agent.server.calculation_mcp_server import CalculationMCPServer
+from dp.agent.server.executor.base_executor import BaseExecutor
+from dp.agent.server.storage import LocalStorage, storage_dict
+
+mcp = CalculationMCPServer("test")
+
+
+@mcp.tool(create_workdir=False)
+async def copy_data(data: Path) -> dict:
+    with open("copy.txt", "w") as f:
+        f.write(data.read_text())
+    return {"out": Path("copy.txt")}
+
+
+class SlowStorage(LocalStorage):
+    """A local storage whose transfers take a while, like a large file"""
+    latency = 0.5
+
+    def _upload(self, key, path):
+        time.sleep(self.latency)
+        return super()._upload(key, path)
+
+    def _download(self, key, path):
+        time.sleep(self.latency)
+        return super()._download(key, path)
+
+
+class NativeAsyncStorage(LocalStorage):
+    """A local storage with native async transfers of single files"""
+    def __init__(self):
+        super().__init__()
+        self.calls = []
+
+    def _upload(self, key, path):
+        raise AssertionError("blocking upload")
+
+    def _download(self, key, path):
+        raise AssertionError("blocking download")
+
+    async def _aupload(self, key, path):
+        self.calls.append("upload")
+        return super()._upload(key, path)
+
+    async def _adownload(self, key, path):
+        self.calls.append("download")
+        return super()._download(key, path)
+
+
+class SlowExecutor(BaseExecutor):
+    """An executor whose calls block for latency seconds each"""
+    latency = 0.2
+
+    def submit(self, fn, kwargs, workdir="."):
+        time.sleep(self.latency)
+        return {"job_id": "job", "extra_info": {}}
+
+    def query_status(self, job_id, workdir="."):
+        time.sleep(self.latency)
+        return "Succeeded"
+
+    def terminate(self, job_id, workdir="."):
+        pass
+
+    def get_results(self, job_id, workdir="."):
+        time.sleep(self.latency)
+        return {"done": True}
+
+
+class DummyContext:
+    async def log(self, level, message):
+        pass
+
+
+async def count_ticks(task, interval=0.01):
+    ticks = 0
+    while not task.done():
+        await asyncio.sleep(interval)
+        ticks += 1
+    return ticks
+
+
+def test_async_storage(tmp_path):
+    (tmp_path / "data.txt").write_text("hello")
+    storage = SlowStorage()
+
+    async def run(download):
+        task = asyncio.ensure_future(download(
+            str(tmp_path / "data.txt"), str(tmp_path / "out")))
+        ticks = await count_ticks(task)
+        return task.result(), ticks
+
+    async def blocking_download(key, path):
+        return storage.download(key, path)
+
+    path, ticks = asyncio.run(run(storage.adownload))
+    assert open(path).read() == "hello"
+    # the event loop keeps serving during the transfer
+    assert ticks > 20
+    _, ticks = asyncio.run(run(blocking_download))
+    assert ticks <= 1
+    assert asyncio.run(storage.alist(str(tmp_path / "out"))) == [path]
+    assert asyncio.run(storage.aget_md5(path)) == storage.get_md5(path)
+
+
+def test_run_job_transfers(tmp_path, monkeypatch):
+    monkeypatch.chdir(tmp_path)
+    monkeypatch.setattr(mcp.mcp, "get_context", DummyContext)
+    monkeypatch.setitem(storage_dict, "slow", SlowStorage)
+    (tmp_path / "data.txt").write_text("hello")
+    run_job = mcp.mcp._tool_manager._tools["copy_data"].fn
+
+    async def run():
+        task = asyncio.ensure_future(run_job(
+            data="slow://%s" % (tmp_path / "data.txt"),
+            storage={"type": "slow"}))
+        ticks = await count_ticks(task)
+        return task.result(), ticks
+
+    result, ticks = asyncio.run(run())
+    uri = result.result["out"]
+    assert uri.startswith("slow://")
+    assert open(uri[len("slow://"):]).read() == "hello"
+    # downloading the input and uploading the output took about 1s, during
+    # which other requests were served
+    assert ticks > 40
+
+
+def test_native_async_storage(tmp_path):
+    (tmp_path / "data.txt").write_text("hello")
+    storage = NativeAsyncStorage()
+    key = asyncio.run(storage.aupload(str(tmp_path / "store"),
+                                      str(tmp_path / "data.txt")))
+    path = asyncio.run(storage.adownload(key, str(tmp_path / "out")))
+    assert open(path).read() == "hello"
+    # single files are transferred by the native async implementation
+    assert storage.calls == ["upload", "download"]
+
+
+def test_executor_calls(tmp_path):
+    executor = SlowExecutor()
+
+    async def run():
+        task = asyncio.ensure_future(executor.async_run(
+            copy_data, {}, DummyContext(), "trace", workdir=str(tmp_path)))
+        ticks = await count_ticks(task)
+        return task.result(), ticks
+
+    res, ticks = asyncio.run(run())
+    assert res["result"] == {"done": True}
+    # submit, status polling and result collection do not block the loop
+    assert ticks > 30
@@ -0,0 +1,97 @@
+import os
+import sys
+import time
+
+import pytest
+from dpdispatcher import Submission
+
+from dp.agent.server.executor.code_bundle import bundle_manager
+from dp.agent.server.executor.dispatcher_executor import DispatcherExecutor
+
+
+def square(x):
+    if x < 0:
+        raise ValueError("negative input")
+    return {"square": x * x}
+
+
+def wait(executor, job_id, workdir):
+    while executor.query_status(job_id, workdir) in ["Pending", "Running"]:
+        time.sleep(0.05)
+    return executor.query_status(job_id, workdir)
+
+
+def test_batching(tmp_path, monkeypatch):
+    monkeypatch.chdir(tmp_path)
+    monkeypatch.setattr(bundle_manager, "bundle_dir",
+                        str(tmp_path / "bundles"))
+    executor = DispatcherExecutor(
+        machine={"batch_type": "Shell", "context_type": "LazyLocalContext"},
+        python_executable=sys.executable, status_interval=0.1,
+        batch_size=4, batch_window=0.5, group_size=2)
+    jobs = []
+    for x in [1, 2, -1, 3, 4, 5]:
+        workdir = str(tmp_path / ("job%s" % len(jobs)))
+        os.makedirs(workdir)
+        job_id = executor.submit(square, {"x": x}, workdir=workdir)["job_id"]
+        jobs.append((job_id, workdir, x))
+    # the last calls wait for more calls in the window
+    assert executor.query_status(jobs[-1][0], jobs[-1][1]) == "Pending"
+    executor.terminate(jobs[-1][0], jobs[-1][1])
+    assert len(set(job_id for job_id, _, _ in jobs)) == 6
+
+    for job_id, workdir, x in jobs[:-1]:
+        if x < 0:
+            assert wait(executor, job_id, workdir) == "Failed"
+            with pytest.raises(RuntimeError, match="negative input"):
+                executor.get_results(job_id, workdir)
+        else:
+            assert wait(executor, job_id, workdir) == "Succeeded"
+            assert executor.get_results(job_id, workdir) == {"square": x * x}
+    assert executor.query_status(jobs[-1][0], jobs[-1][1]) == "Failed"
+    # 5 calls in 2 submissions instead of 5
+    submissions = set(executor.get_batch_info(job_id, workdir)["submission"]
+                      for job_id, workdir, _ in jobs[:-1])
+    assert len(submissions) == 2
+    assert executor.batcher.batches == 2
+
+    # status survives restarting the server
+    restarted = DispatcherExecutor(
+        machine={"batch_type": "Shell", "context_type": "LazyLocalContext"},
+        python_executable=sys.executable, status_interval=0, batch_size=4)
+    restarted.query_submission = lambda submission_hash, root: "Succeeded"
+    assert restarted.query_status(jobs[0][0], jobs[0][1]) == "Succeeded"
+    assert restarted.query_status(jobs[2][0], jobs[2][1]) == "Failed"
+
+
+def test_terminate_batch(tmp_path, monkeypatch):
+    monkeypatch.chdir(tmp_path)
+    monkeypatch.setattr(bundle_manager, "bundle_dir",
+                        str(tmp_path / "bundles"))
+    killed = []
+    monkeypatch.setattr(Submission, "remove_unfinished_tasks",
+                        lambda self: killed.append(self.submission_hash))
+    executor = DispatcherExecutor(
+        machine={"batch_type": "Shell", "context_type": "LazyLocalContext"},
+        python_executable=sys.executable, status_interval=0.1,
+        batch_size=2, batch_window=0.1)
+    jobs = []
+    for x in [1, 2]:
+        workdir = str(tmp_path / ("job%s" % len(jobs)))
+        os.makedirs(workdir)
+        job_id = executor.submit(square, {"x": x}, workdir=workdir)["job_id"]
+        jobs.append((job_id, workdir))
+    # the batch is full and submitted without waiting for the window
+    while executor.batcher.is_pending(jobs[0][0]):
+        time.sleep(0.05)
+    info = executor.get_batch_info(*jobs[0])
+    assert info["calls"] == [list(job) for job in jobs]
+
+    # the task of the first call keeps running for the second call
+    executor.terminate(*jobs[0])
+    assert executor.query_status(*jobs[0]) == "Failed"
+    assert killed == []
+    # the submission is killed once all of its calls are terminated
+    executor.terminate(*jobs[1])
+    assert executor.query_status(*jobs[1]) == "Failed"
+    assert killed == [info["submission"]]
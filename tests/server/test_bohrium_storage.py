@@ -0,0 +1,216 @@
+import base64
+import io
+import json
+import socket
+import threading
+import time
+import uuid
+from concurrent.futures import ThreadPoolExecutor
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+import pytest
+import tiefblue
+
+from dp.agent.server.storage import BohriumStorage, base_storage
+
+
+def make_token(ttl):
+    def encode(obj):
+        return base64.urlsafe_b64encode(
+            json.dumps(obj).encode()).decode().rstrip("=")
+    return "%s.%s.sig" % (encode({"alg": "none"}), encode(
+        {"exp": time.time() + ttl, "jti": uuid.uuid4().hex}))
+
+
+class FakeTiefblue(ThreadingHTTPServer):
+    """
+    A local stand-in of the bohrium token API and the tiefblue object API,
+    where setting up a connection costs handshake seconds like TLS
+    """
+    daemon_threads = True
+
+    def __init__(self, handshake=0.005, ttl=3600):
+        super().__init__(("127.0.0.1", 0), FakeTiefblueHandler)
+        self.handshake = handshake
+        self.ttl = ttl
+        self.objects = {}
+        self.tokens = set()
+        self.connections = 0
+        self.refreshes = 0
+        self.rejected = 0
+        self.uploads = {}
+        self.expire_at_part = None
+        self.lock = threading.Lock()
+
+    def handle_error(self, request, client_address):
+        pass
+
+    @property
+    def url(self):
+        return "http://127.0.0.1:%s" % self.server_address[1]
+
+
+class FakeTiefblueHandler(BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1"
+
+    def log_message(self, *args):
+        pass
+
+    def setup(self):
+        super().setup()
+        self.connection.setsockopt(socket.IPPROTO_TCP, socket.TCP_NODELAY, 1)
+        with self.server.lock:
+            self.server.connections += 1
+        time.sleep(self.server.handshake)
+
+    def reply(self, status, body):
+        body = body if isinstance(body, bytes) else json.dumps(body).encode()
+        self.send_response(status)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def authorized(self):
+        token = self.headers.get("Authorization", "")[len("Bearer "):]
+        if token in self.server.tokens:
+            return True
+        with self.server.lock:
+            self.server.rejected += 1
+        self.reply(401, {"code": 190001, "error": {"msg": "token expired"}})
+        return False
+
+    def do_GET(self):
+        if self.path.startswith("/brm/v1/storage/token"):
+            token = make_token(self.server.ttl)
+            with self.server.lock:
+                self.server.tokens.add(token)
+                self.server.refreshes += 1
+            return self.reply(200, {"code": 0, "data": {
+                "token": token, "path": "u/", "sharePath": "",
+                "userSharePath": ""}})
+        if not self.authorized():
+            return
+        key = self.path[len("/api/download/"):]
+        self.reply(200, self.server.objects[key])
+
+    def do_POST(self):
+        data = self.rfile.read(int(self.headers.get("Content-Length", 0)))
+        if self.path == "/api/upload/multipart/upload":
+            return self.upload_part(data)
+        body = json.loads(data or b"{}")
+        if not self.authorized():
+            return
+        if self.path == "/api/upload/multipart/init":
+            initial_key = uuid.uuid4().hex
+            self.server.uploads[initial_key] = {}
+            return self.reply(200, {"code": 0, "data": {
+                "initialKey": initial_key}})
+        if self.path == "/api/upload/multipart/complete":
+            parts = self.server.uploads.pop(body["initialKey"])
+            self.server.objects[body["path"]] = b"".join(
+                parts[p] for p in body["partString"])
+            return self.reply(200, {"code": 0, "data": {}})
+        objects = [{"path": k} for k in sorted(self.server.objects)
+                   if k.startswith(body["prefix"])]
+        self.reply(200, {"code": 0, "data": {"objects": objects,
+                                             "hasNext": False}})
+
+    def upload_part(self, data):
+        param = json.loads(base64.b64decode(
+            self.headers["X-Storage-Param"]))
+        if param["number"] == self.server.expire_at_part:
+            self.server.expire_at_part = None
+            self.server.tokens.clear()
+        if not self.authorized():
+            return
+        part_string = "%s-%d" % (param["initialKey"], param["number"])
+        self.server.uploads[param["initialKey"]][part_string] = data
+        self.reply(200, {"code": 0, "data": {"partString": part_string}})
+
+
+@pytest.fixture
+def server():
+    server = FakeTiefblue()
+    thread = threading.Thread(target=server.serve_forever, daemon=True)
+    thread.start()
+    yield server
+    server.shutdown()
+    server.server_close()
+
+
+def get_storage(server, **kwargs):
+    return BohriumStorage(bohrium_url=server.url, tiefblue_url=server.url,
+                          authorization="auth", project_id="1", **kwargs)
+
+
+def test_client_reuse(server, tmp_path):
+    for i in range(100):
+        server.objects["u/dir/%03d.txt" % i] = b"%d" % i
+    storage = get_storage(server)
+    # keys returned by the storage carry its prefix
+    keys = storage.list("u/dir/", recursive=True)
+    assert len(keys) == 100
+
+    # a new client per object, as before
+    server.connections = 0
+    start = time.perf_counter()
+    for key in keys:
+        tiefblue.Client(base_url=server.url, token=storage.token
+                        ).download_from_file(key, str(tmp_path / "a.txt"))
+    per_object = time.perf_counter() - start
+    per_object_connections = server.connections
+
+    server.connections = 0
+    start = time.perf_counter()
+    storage.download("u/dir/", str(tmp_path / "out"))
+    shared = time.perf_counter() - start
+    assert (tmp_path / "out" / "042.txt").read_bytes() == b"42"
+    assert per_object_connections >= 100
+    # objects are downloaded concurrently, over at most one connection
+    # per worker
+    assert server.connections <= base_storage.config["download_workers"]
+    assert shared < per_object
+
+
+def test_token_refresh(server, tmp_path):
+    for i in range(32):
+        server.objects["u/%02d.txt" % i] = b"%d" % i
+    storage = get_storage(server)
+    assert storage.token_expiry is not None
+    refreshes = server.refreshes
+
+    # a token rejected in the middle of a batch is refreshed once
+    server.tokens.clear()
+    with ThreadPoolExecutor(8) as pool:
+        list(pool.map(lambda i: storage._download(
+            "%02d.txt" % i, str(tmp_path / "a" / ("%02d.txt" % i))),
+            range(32)))
+    assert server.refreshes == refreshes + 1
+    assert server.rejected <= 8
+
+    # a token about to expire is renewed before it is rejected
+    server.ttl = 2
+    storage.get_token()
+    storage.token_renew_before = 1.5
+    refreshes = server.refreshes
+    rejected = server.rejected
+    time.sleep(0.6)
+    with ThreadPoolExecutor(8) as pool:
+        list(pool.map(lambda i: storage._download(
+            "%02d.txt" % i, str(tmp_path / "b" / ("%02d.txt" % i))),
+            range(32)))
+    assert server.refreshes == refreshes + 1
+    assert server.rejected == rejected
+    assert (tmp_path / "b" / "31.txt").read_bytes() == b"31"
+
+
+def test_upload_stream(server):
+    storage = get_storage(server, part_size=4)
+    refreshes = server.refreshes
+    # the token expires in the middle of the parts
+    server.expire_at_part = 2
+    key = storage._upload_stream("stream.bin", io.BytesIO(b"0123456789"))
+    assert server.objects[key] == b"0123456789"
+    assert server.refreshes == refreshes + 1
+    assert server.uploads == {}
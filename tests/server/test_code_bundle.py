@@ -0,0 +1,61 @@
+import os
+import sys
+import time
+import zipfile
+
+from dp.agent.server.executor.code_bundle import (
+    CodeBundleManager,
+    bundle_manager,
+)
+from dp.agent.server.executor.dispatcher_executor import DispatcherExecutor
+
+
+def multiply(a, b):
+    return {"product": a * b}
+
+
+def test_code_bundle(tmp_path):
+    package = tmp_path / "pkg"
+    (package / "__pycache__").mkdir(parents=True)
+    (package / "__init__.py").write_text("X = 1\n")
+    (package / "__pycache__" / "mod.cpython-311.pyc").write_bytes(b"\0")
+    module = tmp_path / "single.py"
+    module.write_text("Y = 2\n")
+    manager = CodeBundleManager(str(tmp_path / "bundles"))
+    bundle = manager.get([str(package), str(module)])
+    assert manager.get([str(module), str(package)]) == bundle
+    assert manager.builds == 1
+    with zipfile.ZipFile(bundle) as zf:
+        assert sorted(zf.namelist()) == ["pkg/__init__.py", "single.py"]
+    # touching a file without changing it reuses the bundle
+    os.utime(module, (time.time() + 10, time.time() + 10))
+    assert manager.get([str(package), str(module)]) == bundle
+    assert manager.builds == 1
+    module.write_text("Y = 3\n")
+    assert manager.get([str(package), str(module)]) != bundle
+    assert manager.builds == 2
+
+
+def test_dispatcher_bundle(tmp_path, monkeypatch):
+    monkeypatch.chdir(tmp_path)
+    monkeypatch.setattr(bundle_manager, "bundle_dir",
+                        str(tmp_path / "bundles"))
+    executor = DispatcherExecutor(
+        machine={"batch_type": "Shell", "context_type": "LazyLocalContext"},
+        python_executable=sys.executable, status_interval=0.1)
+    workdirs = []
+    for i in range(2):
+        workdir = str(tmp_path / ("job%s" % i))
+        os.makedirs(workdir)
+        job_id = executor.submit(multiply, {"a": i, "b": 3},
+                                 workdir=workdir)["job_id"]
+        while executor.query_status(job_id, workdir) == "Running":
+            time.sleep(0.05)
+        assert executor.get_results(job_id, workdir) == {"product": i * 3}
+        workdirs.append(workdir)
+    bundles = [[f for f in os.listdir(w) if f.startswith("bundle-")]
+               for w in workdirs]
+    # one bundle shared by the jobs, instead of the package directories
+    assert len(bundles[0]) == 1 and bundles[0] == bundles[1]
+    assert not any(os.path.islink(os.path.join(w, f))
+                   for w in workdirs for f in os.listdir(w))
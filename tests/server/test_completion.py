@@ -0,0 +1,71 @@
+import asyncio
+import time
+
+from dp.agent.server.executor import LocalExecutor
+from dp.agent.server.executor.base_executor import Backoff, BaseExecutor
+
+
+class DummyContext:
+    async def log(self, level, message):
+        pass
+
+
+def short_job(duration):
+    time.sleep(duration)
+    return {"duration": duration}
+
+
+class DelayedExecutor(BaseExecutor):
+    """Executor which is only aware of job completion by polling"""
+    def __init__(self, duration):
+        self.duration = duration
+        self.start = None
+
+    def submit(self, fn, kwargs, workdir="."):
+        self.start = time.monotonic()
+        return {"job_id": "1"}
+
+    def query_status(self, job_id, workdir="."):
+        if time.monotonic() - self.start < self.duration:
+            return "Running"
+        return "Succeeded"
+
+    def terminate(self, job_id, workdir="."):
+        pass
+
+    def get_results(self, job_id, workdir="."):
+        return {}
+
+
+def test_backoff():
+    backoff = Backoff(initial=1, maximum=4, factor=2, jitter=0)
+    assert [backoff.next() for _ in range(5)] == [1, 2, 4, 4, 4]
+    backoff = Backoff(initial=1, maximum=4, factor=2, jitter=0.1)
+    assert 0.9 <= backoff.next() <= 1.1
+
+
+def test_short_job_latency(tmp_path):
+    # a subprocess job completes as soon as the process exits, instead of
+    # at the next poll (previously every 10 seconds)
+    executor = LocalExecutor()
+    latencies = []
+    for _ in range(5):
+        start = time.monotonic()
+        res = asyncio.run(BaseExecutor.async_run(
+            executor, short_job, {"duration": 0.2}, DummyContext(), "trace",
+            workdir=str(tmp_path)))
+        latencies.append(time.monotonic() - start - 0.2)
+        assert res["result"] == {"duration": 0.2}
+    print("local short job completion latency: %s" % latencies)
+    assert max(latencies) < 2
+    assert executor.processes == {}
+
+
+def test_polling_latency():
+    executor = DelayedExecutor(0.3)
+    start = time.monotonic()
+    asyncio.run(executor.async_run(short_job, {"duration": 0.3},
+                                   DummyContext(), "trace"))
+    latency = time.monotonic() - start - 0.3
+    print("polled short job completion latency: %s" % latency)
+    assert latency < 2
@@ -0,0 +1,71 @@
+import asyncio
+import os
+import time
+from concurrent.futures import ThreadPoolExecutor
+from pathlib import Path
+
+from dp.agent.server.calculation_mcp_server import CalculationMCPServer
+from dp.agent.server.executor import LocalExecutor
+
+mcp = CalculationMCPServer("test")
+
+
+@mcp.tool()
+def concat(data: Path, tag: str) -> dict:
+    text = data.read_text()
+    time.sleep(0.05)
+    with open("out.txt", "w") as f:
+        f.write(text + tag)
+    return {"out": Path("out.txt"), "tag": tag}
+
+
+def call_tool(name, **kwargs):
+    return mcp.mcp._tool_manager._tools[name].fn(**kwargs)
+
+
+def test_concurrent_jobs(tmp_path, monkeypatch):
+    monkeypatch.chdir(tmp_path)
+    n = 24
+    for i in range(n):
+        (tmp_path / ("in%s.txt" % i)).write_text("data%s-" % i)
+
+    def run(i):
+        res = call_tool("submit_concat", data=str(
+            tmp_path / ("in%s.txt" % i)), tag="tag%s" % i)
+        job_id = res.result.job_id
+        while call_tool("query_job_status", job_id=job_id) in [
+                "Pending", "Running"]:
+            time.sleep(0.05)
+        assert call_tool("query_job_status", job_id=job_id) == "Succeeded"
+        return call_tool("get_job_results", job_id=job_id).result
+
+    with ThreadPoolExecutor(max_workers=n) as pool:
+        results = list(pool.map(run, range(n)))
+    assert os.getcwd() == str(tmp_path)
+    for i, result in enumerate(results):
+        assert result["tag"] == "tag%s" % i
+        with open(result["out"][len("local://"):]) as f:
+            assert f.read() == "data%s-tag%s" % (i, i)
+    assert len([d for d in os.listdir(tmp_path) if os.path.isdir(d)]) == n
+
+
+def test_concurrent_in_process_runs(tmp_path, monkeypatch):
+    monkeypatch.chdir(tmp_path)
+    n = 16
+    for i in range(n):
+        (tmp_path / ("in%s.txt" % i)).write_text("data%s-" % i)
+
+    def run(i):
+        workdir = str(tmp_path / ("job%s" % i))
+        os.makedirs(workdir)
+        res = asyncio.run(LocalExecutor(sync_mode="inline").async_run(
+            concat, {"data": tmp_path / ("in%s.txt" % i), "tag": str(i)},
+            None, "job%s" % i, workdir=workdir))
+        return workdir, res["result"]
+
+    with ThreadPoolExecutor(max_workers=n) as pool:
+        results = list(pool.map(run, range(n)))
+    assert os.getcwd() == str(tmp_path)
+    for i, (workdir, result) in enumerate(results):
+        with open(os.path.join(workdir, result["out"])) as f:
+            assert f.read() == "data%s-%s" % (i, i)
@@ -0,0 +1,192 @@
+import hashlib
+import os
+import threading
+import time
+from email.utils import formatdate
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+import pytest
+
+from dp.agent.server.storage import HTTPStorage
+
+MB = 1 << 20
+
+
+class FileServer(ThreadingHTTPServer):
+    """Serve files from memory, throttling each connection to rate B/s"""
+    daemon_threads = True
+
+    def __init__(self, rate):
+        super().__init__(("127.0.0.1", 0), FileHandler)
+        self.rate = rate
+        self.files = {}
+        self.fail = set()
+        self.requests = []
+        self.connections = set()
+        self.lock = threading.Lock()
+
+    def put(self, name, data):
+        self.files[name] = (data, hashlib.md5(data).hexdigest(), time.time())
+
+    def handle_error(self, request, client_address):
+        # clients close the connections of responses they do not read
+        pass
+
+    @property
+    def key(self):
+        return "127.0.0.1:%s" % self.server_address[1]
+
+
+class FileHandler(BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1"
+
+    def log_message(self, *args):
+        pass
+
+    def do_GET(self):
+        with self.server.lock:
+            self.server.connections.add(self.client_address)
+        name = self.path[1:]
+        data, etag, mtime = self.server.files[name]
+        etag = '"%s"' % etag
+        byte_range = self.headers.get("Range")
+        with self.server.lock:
+            self.server.requests.append((name, byte_range))
+        if self.headers.get("If-None-Match") == etag:
+            self.send_response(304)
+            self.send_header("ETag", etag)
+            self.send_header("Content-Length", "0")
+            self.end_headers()
+            return
+        status = 200
+        headers = {"ETag": etag, "Accept-Ranges": "bytes",
+                   "Last-Modified": formatdate(mtime, usegmt=True)}
+        if self.headers.get("If-Range", etag) not in [
+                etag, headers["Last-Modified"]]:
+            # the object changed, send all of it
+            byte_range = None
+        if byte_range is not None:
+            if self.headers.get("If-Match", etag) != etag:
+                self.send_response(412)
+                self.send_header("Content-Length", "0")
+                self.end_headers()
+                return
+            start, end = byte_range.split("=")[1].split("-")
+            start, end = int(start), int(end or len(data) - 1)
+            headers["Content-Range"] = "bytes %d-%d/%d" % (
+                start, end, len(data))
+            data = data[start:end + 1]
+            status = 206
+        self.send_response(status)
+        for k, v in headers.items():
+            self.send_header(k, v)
+        self.send_header("Content-Length", str(len(data)))
+        self.end_headers()
+        for i in range(0, len(data), 256 * 1024):
+            if byte_range in self.server.fail and i >= len(data) // 2:
+                self.server.fail.remove(byte_range)
+                # drop the connection in the middle of the body
+                self.close_connection = True
+                return
+            time.sleep(len(data[i:i + 256 * 1024]) / self.server.rate)
+            self.wfile.write(data[i:i + 256 * 1024])
+
+
+@pytest.fixture
+def server():
+    server = FileServer(rate=16 * MB)
+    thread = threading.Thread(target=server.serve_forever, daemon=True)
+    thread.start()
+    yield server
+    server.shutdown()
+    server.server_close()
+
+
+def test_http_ranges(server, tmp_path):
+    data = os.urandom(16 * MB)
+    server.put("big.bin", data)
+    timings = {}
+    for name, threshold in [("single", 1 << 40), ("ranged", 4 * MB)]:
+        storage = HTTPStorage(range_threshold=threshold, part_size=2 * MB,
+                              num_threads=8)
+        start = time.perf_counter()
+        path = storage._download(server.key + "/big.bin",
+                                 str(tmp_path / name / "big.bin"))
+        timings[name] = time.perf_counter() - start
+        assert open(path, "rb").read() == data
+    print("16 MiB at 16 MiB/s per connection: single %.2fs, ranged %.2fs"
+          % (timings["single"], timings["ranged"]))
+    assert timings["ranged"] < timings["single"] / 2
+
+    # an interrupted download resumes from the finished ranges
+    storage = HTTPStorage(range_threshold=4 * MB, part_size=2 * MB,
+                          num_threads=2)
+    target = str(tmp_path / "resume" / "big.bin")
+    server.fail.add("bytes=%d-%d" % (10 * MB, 12 * MB - 1))
+    with pytest.raises(Exception):
+        storage._download(server.key + "/big.bin", target)
+    assert os.path.isfile(target + ".part.json")
+    server.requests.clear()
+    storage._download(server.key + "/big.bin", target)
+    ranges = [r for _, r in server.requests if r is not None]
+    assert 0 < len(ranges) < 8
+    assert open(target, "rb").read() == data
+    assert not os.path.exists(target + ".part.json")
+
+
+def test_http_pool_and_cache(server, tmp_path):
+    for i in range(20):
+        server.put("small%d.txt" % i, b"%d" % i)
+    storage = HTTPStorage(cache_dir=str(tmp_path / "cache"))
+    for i in range(20):
+        path = storage._download(server.key + "/small%d.txt" % i,
+                                 str(tmp_path / "out" / ("%d.txt" % i)))
+        assert open(path, "rb").read() == b"%d" % i
+    # connections are kept alive and reused across files
+    assert len(server.connections) == 1
+
+    # a tool editing its input in place does not corrupt the cache
+    with open(tmp_path / "out" / "3.txt", "ab") as f:
+        f.write(b"edited")
+    cache_path = storage.get_cache_path("http://" + server.key +
+                                        "/small3.txt")
+    assert not os.stat(cache_path).st_mode & 0o222
+    server.requests.clear()
+    path = storage._download(server.key + "/small3.txt",
+                             str(tmp_path / "again" / "3.txt"))
+    assert open(path, "rb").read() == b"3"
+    assert os.stat(path).st_mode & 0o200
+    server.put("small3.txt", b"changed")
+    path = storage._download(server.key + "/small3.txt",
+                             str(tmp_path / "again" / "3.txt"))
+    assert open(path, "rb").read() == b"changed"
+    assert len(server.requests) == 2
+    assert open(storage.get_cache_path(
+        "http://" + server.key + "/small3.txt"), "rb").read() == b"changed"
+
+
+def test_http_resume_stream(server, tmp_path):
+    data = os.urandom(4 * MB)
+    server.put("stream.bin", data)
+    storage = HTTPStorage(range_threshold=1 << 40)
+    target = str(tmp_path / "stream.bin")
+    # an interrupted single stream download resumes from the bytes written
+    server.fail.add(None)
+    with pytest.raises(Exception):
+        storage._download(server.key + "/stream.bin", target)
+    offset = os.path.getsize(target + ".part")
+    assert 0 < offset < len(data)
+    server.requests.clear()
+    storage._download(server.key + "/stream.bin", target)
+    assert server.requests == [("stream.bin", "bytes=%d-" % offset)]
+    assert open(target, "rb").read() == data
+    assert not os.path.exists(target + ".part.json")
+
+    # unless the object changed in between
+    server.fail.add(None)
+    with pytest.raises(Exception):
+        storage._download(server.key + "/stream.bin", target)
+    changed = os.urandom(4 * MB)
+    server.put("stream.bin", changed)
+    storage._download(server.key + "/stream.bin", target)
+    assert open(target, "rb").read() == changed
@@ -0,0 +1,49 @@
+from pathlib import Path
+from typing import Dict, List, Optional
+
+from dp.agent.server.calculation_mcp_server import (
+    handle_input_artifacts,
+    parse_concurrency,
+)
+
+
+def tool(a: Path, b: List[Path], c: Dict[str, Path],
+         d: Dict[str, List[Path]], e: Optional[Path] = None):
+    pass
+
+
+def test_handle_input_artifacts(tmp_path, monkeypatch):
+    monkeypatch.chdir(tmp_path)
+    src = tmp_path / "src"
+    src.mkdir()
+    for i in range(6):
+        (src / ("f%s.txt" % i)).write_text(str(i))
+    f = [str(src / ("f%s.txt" % i)) for i in range(6)]
+    kwargs = {
+        "a": f[0],
+        "b": [f[1], f[2]],
+        "c": {"x": f[3]},
+        "d": {"y": [f[4], f[5]]},
+        "e": None,
+    }
+    timings = []
+    kwargs, input_artifacts = handle_input_artifacts(
+        tool, kwargs, None, {"default": 4}, timings)
+    assert kwargs["a"] == Path("inputs/a/f0.txt")
+    assert kwargs["b"] == [Path("inputs/b/f1.txt"), Path("inputs/b/f2.txt")]
+    assert kwargs["c"] == {"x": Path("inputs/c/x/f3.txt")}
+    assert kwargs["d"] == {"y": [Path("inputs/d/y/f4.txt"),
+                                 Path("inputs/d/y/f5.txt")]}
+    assert kwargs["e"] is None
+    assert kwargs["d"]["y"][1].read_text() == "5"
+    assert input_artifacts["a"] == {"storage_type": "local", "uri": f[0]}
+    assert input_artifacts["d"]["uri"] == {"y": [f[4], f[5]]}
+    assert "e" not in input_artifacts
+    assert len(timings) == 6
+    assert all(t["seconds"] >= 0 for t in timings)
+
+
+def test_parse_concurrency():
+    assert parse_concurrency("8") == {"default": 8}
+    assert parse_concurrency("8, oss=16,http=4") == {
+        "default": 8, "oss": 16, "http": 4}
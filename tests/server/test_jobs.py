@@ -0,0 +1,86 @@
+import os
+import time
+from pathlib import Path
+
+from dp.agent.server.calculation_mcp_server import (
+    CalculationMCPServer,
+    get_job_registry,
+    set_job_registry,
+)
+
+mcp = CalculationMCPServer("test")
+
+
+@mcp.tool()
+def concat(data: Path, tag: str) -> dict:
+    text = data.read_text()
+    time.sleep(0.05)
+    with open("out.txt", "w") as f:
+        f.write(text + tag)
+    return {"out": Path("out.txt"), "tag": tag}
+
+
+@mcp.tool()
+def idle(seconds: float) -> dict:
+    time.sleep(seconds)
+    return {"seconds": seconds}
+
+
+def call_tool(name, **kwargs):
+    return mcp.mcp._tool_manager._tools[name].fn(**kwargs)
+
+
+def test_job_registry(tmp_path, monkeypatch):
+    monkeypatch.chdir(tmp_path)
+    (tmp_path / "in.txt").write_text("data-")
+    set_job_registry(str(tmp_path / "jobs.db"))
+    res = call_tool("submit_concat", data=str(tmp_path / "in.txt"), tag="x")
+    job_id = res.result.job_id
+    jobs = call_tool("list_jobs", tool_name="concat")
+    assert jobs[0]["job_id"] == job_id
+    assert jobs[0]["status"] == "Running"
+    while call_tool("query_job_status", job_id=job_id) in [
+            "Pending", "Running"]:
+        time.sleep(0.05)
+    call_tool("get_job_results", job_id=job_id)
+    job = get_job_registry().get(job_id)
+    assert job["status"] == "Succeeded"
+    assert job["output_artifacts"]["out"]["storage_type"] == "local"
+    assert call_tool("list_jobs", status="Running") == []
+    # finished jobs are answered from the registry, even without job.json
+    os.remove(os.path.join(job["workdir"], "job.json"))
+    assert call_tool("query_job_status", job_id=job_id) == "Succeeded"
+
+
+def test_batch_tools(tmp_path, monkeypatch):
+    monkeypatch.chdir(tmp_path)
+    set_job_registry(str(tmp_path / "jobs.db"))
+    job_ids = []
+    for i in range(4):
+        (tmp_path / ("in%s.txt" % i)).write_text("data%s-" % i)
+        res = call_tool("submit_concat", data=str(
+            tmp_path / ("in%s.txt" % i)), tag="tag%s" % i)
+        job_ids.append(res.result.job_id)
+    slow_job_id = call_tool("submit_idle", seconds=30).result.job_id
+    job_ids += [slow_job_id, "missing/1"]
+    while True:
+        statuses = call_tool("query_jobs_status", job_ids=job_ids)
+        if all(s["status"] == "Succeeded" for s in statuses[:4]):
+            break
+        time.sleep(0.05)
+    assert [s["job_id"] for s in statuses] == job_ids
+    assert statuses[4]["status"] == "Running"
+    assert statuses[5]["status"] is None and statuses[5]["error"]
+
+    # finished jobs come back with results, running ones without
+    results = call_tool("get_jobs_results", job_ids=job_ids)
+    for i in range(4):
+        assert results[i]["result"]["tag"] == "tag%s" % i
+        assert results[i]["tool_name"] == "concat"
+        assert "out" in results[i]["job_info"]["output_artifacts"]
+    assert results[4]["status"] == "Running" and "result" not in results[4]
+    assert "error" in results[5]
+    call_tool("terminate_job", job_id=slow_job_id)
+    # terminated jobs are no longer listed as running
+    assert get_job_registry().get(slow_job_id)["status"] == "Failed"
+    assert call_tool("list_jobs", status="Running") == []
@@ -0,0 +1,116 @@
+import asyncio
+import json
+import os
+import subprocess
+import sys
+import time
+
+from dp.agent.server.executor import LocalExecutor
+from dp.agent.server.executor.base_executor import BaseExecutor
+
+
+class DummyContext:
+    async def log(self, level, message):
+        pass
+
+
+def get_pid(tag):
+    return {"pid": os.getpid(), "tag": tag, "cwd": os.getcwd()}
+
+
+def idle(seconds):
+    time.sleep(seconds)
+    return {}
+
+
+def wait(executor, job_id, workdir):
+    while executor.query_status(job_id, workdir) in ["Pending", "Running"]:
+        time.sleep(0.02)
+    return executor.query_status(job_id, workdir)
+
+
+def test_pool_mode(tmp_path):
+    executor = LocalExecutor(pool_size=2, max_jobs_per_worker=3)
+    try:
+        jobs = []
+        for i in range(8):
+            workdir = tmp_path / ("job%s" % i)
+            workdir.mkdir()
+            res = executor.submit(get_pid, {"tag": i}, workdir=str(workdir))
+            jobs.append((res["job_id"], str(workdir)))
+        pids = set()
+        for i, (job_id, workdir) in enumerate(jobs):
+            assert wait(executor, job_id, workdir) == "Succeeded"
+            result = executor.get_results(job_id, workdir)
+            assert result["tag"] == i and result["cwd"] == workdir
+            pids.add(result["pid"])
+        # each worker runs up to 3 jobs before it is recycled
+        assert os.getpid() not in pids
+        assert 3 <= len(pids) <= 6
+        assert executor.pool.stats()["recycled"] >= 1
+        assert not executor.busy()
+    finally:
+        executor.pool.close()
+
+
+def test_pool_terminate(tmp_path):
+    executor = LocalExecutor(pool_size=1)
+    try:
+        running = executor.submit(idle, {"seconds": 30},
+                                  workdir=str(tmp_path))["job_id"]
+        pending = executor.submit(idle, {"seconds": 30},
+                                  workdir=str(tmp_path))["job_id"]
+        assert executor.query_status(pending, str(tmp_path)) in [
+            "Pending", "Running"]
+        executor.terminate(pending, str(tmp_path))
+        assert executor.query_status(pending, str(tmp_path)) == "Failed"
+        time.sleep(0.5)
+        executor.terminate(running, str(tmp_path))
+        assert wait(executor, running, str(tmp_path)) == "Failed"
+        # the killed worker is replaced
+        res = asyncio.run(BaseExecutor.async_run(
+            executor, get_pid, {"tag": "x"}, DummyContext(), "trace",
+            workdir=str(tmp_path)))
+        assert res["result"]["tag"] == "x"
+    finally:
+        executor.pool.close()
+
+
+SCRIPT = """
+import json
+import os
+import sys
+import time
+
+from dp.agent.server.executor import LocalExecutor
+
+with open("imports.txt", "a") as f:
+    f.write("%d\\n" % os.getpid())
+
+
+def get_pid():
+    return {"pid": os.getpid()}
+
+
+if __name__ == "__main__":
+    executor = LocalExecutor(pool_size=1)
+    job_id = executor.submit(get_pid, {}, workdir=sys.argv[1])["job_id"]
+    while executor.query_status(job_id, sys.argv[1]) in [
+            "Pending", "Running"]:
+        time.sleep(0.02)
+    print(json.dumps(executor.get_results(job_id, sys.argv[1])))
+    executor.pool.close()
+"""
+
+
+def test_pool_preload_main(tmp_path):
+    # tools defined in the server script warm the pool with the script,
+    # imported once by the forkserver rather than by each worker
+    script = tmp_path / "server.py"
+    script.write_text(SCRIPT)
+    out = subprocess.check_output(
+        [sys.executable, str(script), str(tmp_path)], cwd=str(tmp_path),
+        timeout=60)
+    pid = json.loads(out.splitlines()[-1])["pid"]
+    imports = (tmp_path / "imports.txt").read_text().split()
+    assert len(imports) == 2 and str(pid) not in imports
@@ -0,0 +1,71 @@
+import time
+from pathlib import Path
+
+from dp.agent.server import metrics
+from dp.agent.server.calculation_mcp_server import CalculationMCPServer
+
+mcp = CalculationMCPServer("test")
+
+
+@mcp.tool()
+def echo(data: Path) -> dict:
+    return {"out": data}
+
+
+def call_tool(name, **kwargs):
+    return mcp.mcp._tool_manager._tools[name].fn(**kwargs)
+
+
+def test_histogram():
+    h = metrics.Histogram("t_seconds", "Test", ["phase"], buckets=[0.1, 1])
+    h.observe(0.05, phase="a")
+    h.observe(0.5, phase="a")
+    h.observe(5, phase="a")
+    lines = h.render().splitlines()
+    assert lines[:2] == ["# HELP t_seconds Test",
+                         "# TYPE t_seconds histogram"]
+    assert lines[2:] == [
+        't_seconds_bucket{phase="a",le="0.1"} 1',
+        't_seconds_bucket{phase="a",le="1"} 2',
+        't_seconds_bucket{phase="a",le="+Inf"} 3',
+        't_seconds_sum{phase="a"} 5.55',
+        't_seconds_count{phase="a"} 3',
+    ]
+
+
+def test_phase_metrics(tmp_path, monkeypatch):
+    monkeypatch.chdir(tmp_path)
+    (tmp_path / "in.txt").write_text("data")
+    job_id = call_tool("submit_echo", data=str(tmp_path / "in.txt")
+                       ).result.job_id
+    while call_tool("query_job_status", job_id=job_id) in [
+            "Pending", "Running"]:
+        time.sleep(0.05)
+    call_tool("get_job_results", job_id=job_id)
+    text = metrics.registry.render(mcp.collect_metrics())
+    for phase in ["preprocess", "input_download", "submit", "status_polling",
+                  "result_collection", "output_upload"]:
+        assert ('dp_agent_phase_seconds_count{tool="echo",executor_type='
+                '"local",phase="%s"}' % phase) in text
+    assert ('dp_agent_jobs_total{tool="echo",executor_type="local",'
+            'mode="submit",status="Submitted"} 1') in text
+    assert 'dp_agent_pool_misses{pool="executor"}' in text
+
+
+def get_sum(text, phase):
+    prefix = ('dp_agent_phase_seconds_sum{tool="nested",executor_type="x",'
+              'phase="%s"} ' % phase)
+    for line in text.splitlines():
+        if line.startswith(prefix):
+            return float(line[len(prefix):])
+
+
+def test_nested_phases():
+    with metrics.time_phase("run", "nested", "x"):
+        time.sleep(0.1)
+        with metrics.time_phase("submit", "nested", "x"):
+            time.sleep(0.2)
+    text = metrics.registry.render()
+    # the time of the nested phase is not counted again by the outer one
+    assert get_sum(text, "submit") >= 0.2
+    assert 0.1 <= get_sum(text, "run") < get_sum(text, "submit")
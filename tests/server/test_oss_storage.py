@@ -0,0 +1,294 @@
+import hashlib
+import os
+import tarfile
+import threading
+import time
+import uuid
+from email.utils import formatdate
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import parse_qs, unquote, urlparse
+
+import pytest
+
+from dp.agent.server.storage import OSSStorage
+
+MB = 1 << 20
+
+
+class FakeOSS(ThreadingHTTPServer):
+    """
+    A local stand-in of OSS for the object and multipart APIs, throttling
+    each connection to rate bytes per second like a single TCP stream
+    """
+    daemon_threads = True
+
+    def __init__(self, rate):
+        super().__init__(("127.0.0.1", 0), FakeOSSHandler)
+        self.rate = rate
+        self.objects = {}
+        self.uploads = {}
+        self.fail = set()
+        self.requests = []
+        self.active = 0
+        self.max_active = 0
+        self.lock = threading.Lock()
+
+    @property
+    def endpoint(self):
+        return "http://127.0.0.1:%s" % self.server_address[1]
+
+
+def tracked(method):
+    """Record the maximum number of requests handled concurrently"""
+    def wrapper(self):
+        with self.server.lock:
+            self.server.active += 1
+            self.server.max_active = max(self.server.max_active,
+                                         self.server.active)
+        try:
+            return method(self)
+        finally:
+            with self.server.lock:
+                self.server.active -= 1
+    return wrapper
+
+
+class FakeOSSHandler(BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1"
+
+    def log_message(self, *args):
+        pass
+
+    def parse(self):
+        url = urlparse(self.path)
+        key = unquote(url.path).split("/", 2)[2]
+        query = {k: v[0] for k, v in parse_qs(
+            url.query, keep_blank_values=True).items()}
+        return key, query
+
+    def throttle(self, size):
+        time.sleep(size / self.server.rate)
+
+    def read_body(self):
+        size = int(self.headers.get("Content-Length", 0))
+        chunks = []
+        while size > 0:
+            chunk = self.rfile.read(min(size, 256 * 1024))
+            self.throttle(len(chunk))
+            chunks.append(chunk)
+            size -= len(chunk)
+        return b"".join(chunks)
+
+    def reply(self, status, body=b"", headers=None):
+        self.send_response(status)
+        for k, v in (headers or {}).items():
+            self.send_header(k, v)
+        self.send_header("Content-Length", str(len(body)))
+        self.send_header("x-oss-request-id", uuid.uuid4().hex)
+        self.end_headers()
+        if self.command != "HEAD":
+            for i in range(0, len(body), 256 * 1024):
+                self.throttle(len(body[i:i + 256 * 1024]))
+                self.wfile.write(body[i:i + 256 * 1024])
+
+    def should_fail(self, op):
+        with self.server.lock:
+            self.server.requests.append(op)
+            if op in self.server.fail:
+                self.server.fail.remove(op)
+                return True
+        return False
+
+    @tracked
+    def do_PUT(self):
+        key, query = self.parse()
+        body = self.read_body()
+        if "uploadId" in query:
+            part = int(query["partNumber"])
+            if self.should_fail(("part", part)):
+                return self.reply(500)
+            etag = hashlib.md5(body).hexdigest().upper()
+            self.server.uploads[query["uploadId"]][part] = (body, etag)
+        else:
+            self.should_fail(("put", key))
+            etag = hashlib.md5(body).hexdigest().upper()
+            self.server.objects[key] = (body, etag, time.time())
+        self.reply(200, headers={"ETag": '"%s"' % etag})
+
+    def do_POST(self):
+        key, query = self.parse()
+        self.read_body()
+        if "uploads" in query:
+            upload_id = uuid.uuid4().hex
+            self.server.uploads[upload_id] = {}
+            body = ("<InitiateMultipartUploadResult><Key>%s</Key><UploadId>"
+                    "%s</UploadId></InitiateMultipartUploadResult>" % (
+                        key, upload_id))
+            return self.reply(200, body.encode())
+        self.should_fail(("complete", key))
+        parts = self.server.uploads.pop(query["uploadId"])
+        data = b"".join(parts[n][0] for n in sorted(parts))
+        etag = hashlib.md5(data).hexdigest().upper() + "-%d" % len(parts)
+        self.server.objects[key] = (data, etag, time.time())
+        self.reply(200, b"<CompleteMultipartUploadResult/>",
+                   {"ETag": '"%s"' % etag})
+
+    @tracked
+    def do_GET(self):
+        key, query = self.parse()
+        if "uploadId" in query:
+            parts = self.server.uploads.get(query["uploadId"])
+            if parts is None:
+                return self.reply(404, b"<Error><Code>NoSuchUpload</Code>"
+                                  b"</Error>")
+            body = ("<ListPartsResult><IsTruncated>false</IsTruncated>"
+                    "<NextPartNumberMarker>0</NextPartNumberMarker>")
+            for n in sorted(parts):
+                body += ("<Part><PartNumber>%d</PartNumber><ETag>\"%s\"</ETag>"
+                         "<Size>%d</Size><LastModified>2024-01-01T00:00:00."
+                         "000Z</LastModified></Part>" % (
+                             n, parts[n][1], len(parts[n][0])))
+            body += "</ListPartsResult>"
+            return self.reply(200, body.encode())
+        data, etag, mtime = self.server.objects[key]
+        headers = {"ETag": '"%s"' % etag,
+                   "Last-Modified": formatdate(mtime, usegmt=True)}
+        byte_range = self.headers.get("Range")
+        if byte_range is None:
+            self.should_fail(("get", key))
+            return self.reply(200, data, headers)
+        start, end = map(int, byte_range.split("=")[1].split("-"))
+        if self.should_fail(("range", start)):
+            return self.reply(500)
+        headers["Content-Range"] = "bytes %d-%d/%d" % (start, end, len(data))
+        self.reply(206, data[start:end + 1], headers)
+
+    def do_HEAD(self):
+        key, _ = self.parse()
+        self.should_fail(("head", key))
+        if key not in self.server.objects:
+            return self.reply(404)
+        data, etag, mtime = self.server.objects[key]
+        self.send_response(200)
+        self.send_header("Content-Length", str(len(data)))
+        self.send_header("ETag", '"%s"' % etag)
+        self.send_header("Last-Modified", formatdate(mtime, usegmt=True))
+        self.send_header("x-oss-object-type", "Normal")
+        self.send_header("x-oss-request-id", uuid.uuid4().hex)
+        self.end_headers()
+
+    def do_DELETE(self):
+        key, query = self.parse()
+        self.server.uploads.pop(query.get("uploadId"), None)
+        self.reply(204)
+
+
+@pytest.fixture
+def oss():
+    server = FakeOSS(rate=16 * MB)
+    thread = threading.Thread(target=server.serve_forever, daemon=True)
+    thread.start()
+    yield server
+    server.shutdown()
+    server.server_close()
+
+
+def get_storage(oss, tmp_path, **kwargs):
+    return OSSStorage(endpoint=oss.endpoint, bucket_name="bench",
+                      access_key_id="ak", access_key_secret="sk",
+                      checkpoint_dir=str(tmp_path / "checkpoints"), **kwargs)
+
+
+def test_oss_transfer_requests(oss, tmp_path):
+    path = tmp_path / "checkpoint.bin"
+    path.write_bytes(os.urandom(16 * MB))
+    single = get_storage(oss, tmp_path, multipart_threshold=1 << 40)
+    parallel = get_storage(oss, tmp_path, multipart_threshold=8 * MB,
+                           part_size=2 * MB, num_threads=8)
+
+    def transfer(storage, direction, name):
+        oss.requests.clear()
+        oss.max_active = 0
+        start = time.time()
+        if direction == "upload":
+            storage._upload("%s/checkpoint.bin" % name, str(path))
+        else:
+            target = tmp_path / name / "checkpoint.bin"
+            storage._download("%s/checkpoint.bin" % name, str(target))
+            assert target.read_bytes() == path.read_bytes()
+        return list(oss.requests), oss.max_active, time.time() - start
+
+    # below the threshold, one request without a HEAD
+    requests, _, _ = transfer(single, "upload", "single")
+    assert requests == [("put", "single/checkpoint.bin")]
+    requests, _, single_time = transfer(single, "download", "single")
+    assert requests == [("get", "single/checkpoint.bin")]
+
+    # above it, parts and ranges of part_size bytes transferred concurrently
+    requests, active, _ = transfer(parallel, "upload", "parallel")
+    assert sorted(r[1] for r in requests if r[0] == "part") == \
+        list(range(1, 9))
+    assert ("complete", "parallel/checkpoint.bin") in requests
+    assert active > 1
+    requests, active, parallel_time = transfer(parallel, "download",
+                                               "parallel")
+    # sized by the GET whose body is not read, no HEAD on top of it
+    assert requests[0] == ("get", "parallel/checkpoint.bin")
+    assert sorted(requests[1:]) == [
+        ("range", start) for start in range(0, 16 * MB, 2 * MB)]
+    assert active > 1
+    # each connection is throttled, 16 MiB take 1s in a single stream
+    assert single_time > 0.9
+    assert parallel_time < single_time / 2
+
+
+def test_oss_resume(oss, tmp_path):
+    path = tmp_path / "checkpoint.bin"
+    path.write_bytes(os.urandom(24 * MB))
+    storage = get_storage(oss, tmp_path, multipart_threshold=8 * MB,
+                          part_size=4 * MB, num_threads=2)
+    oss.fail.add(("part", 5))
+    with pytest.raises(Exception):
+        storage._upload("resume/checkpoint.bin", str(path))
+    oss.requests.clear()
+    storage._upload("resume/checkpoint.bin", str(path))
+    # parts uploaded before the failure are not sent again
+    parts = [r for r in oss.requests if r[0] == "part"]
+    assert 0 < len(parts) < 6
+    assert oss.objects["resume/checkpoint.bin"][0] == path.read_bytes()
+
+    target = tmp_path / "out" / "checkpoint.bin"
+    oss.fail.add(("range", 16 * MB))
+    with pytest.raises(Exception):
+        storage._download("resume/checkpoint.bin", str(target))
+    oss.requests.clear()
+    storage._download("resume/checkpoint.bin", str(target))
+    ranges = [r for r in oss.requests if r[0] == "range"]
+    assert 0 < len(ranges) < 6
+    assert target.read_bytes() == path.read_bytes()
+
+
+def test_oss_upload_dir(oss, tmp_path):
+    logs = tmp_path / "logs"
+    (logs / "sub").mkdir(parents=True)
+    (logs / "a.bin").write_bytes(os.urandom(3 * MB))
+    (logs / "sub" / "log.txt").write_text("log")
+    storage = get_storage(oss, tmp_path, part_size=1 * MB)
+    key = storage.upload("job/outputs/logs", str(logs))
+    assert key == "job/outputs/logs/logs.tgz"
+    # the archive is streamed in parts of part_size bytes
+    parts = [r for r in oss.requests if r[0] == "part"]
+    assert len(parts) >= 3
+    storage._download(key, str(tmp_path / "logs.tgz"))
+    with tarfile.open(tmp_path / "logs.tgz") as tf:
+        assert tf.extractfile("logs/sub/log.txt").read() == b"log"
+        assert tf.extractfile("logs/a.bin").read() == \
+            (logs / "a.bin").read_bytes()
+
+    # a failing archive writer aborts the upload instead of storing a
+    # truncated archive
+    os.symlink(str(tmp_path / "missing"), str(logs / "z.txt"))
+    with pytest.raises(FileNotFoundError):
+        storage.upload("job/outputs/broken", str(logs))
+    assert "job/outputs/broken/logs.tgz" not in oss.objects
+    assert oss.uploads == {}
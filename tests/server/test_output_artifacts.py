@@ -0,0 +1,45 @@
+import os
+import tarfile
+from pathlib import Path
+
+import pytest
+
+from dp.agent.server.calculation_mcp_server import handle_output_artifacts
+from dp.agent.server.storage import LocalStorage
+
+
+def test_handle_output_artifacts(tmp_path, monkeypatch):
+    monkeypatch.chdir(tmp_path)
+    (tmp_path / "model.pt").write_text("model")
+    (tmp_path / "logs" / "sub").mkdir(parents=True)
+    (tmp_path / "logs" / "sub" / "log.txt").write_text("log")
+    results = {
+        "model": Path("model.pt"),
+        "logs": Path("logs"),
+        "frames": [Path("model.pt"), Path("logs")],
+        "energy": 1.0,
+    }
+    results, output_artifacts = handle_output_artifacts(
+        results, "job", None, concurrency=4)
+    assert results["model"] == "local://" + str(
+        tmp_path / "job/outputs/model/model.pt")
+    assert results["logs"].endswith("job/outputs/logs/logs.tgz")
+    assert len(results["frames"]) == 2
+    assert output_artifacts["frames"]["uri"] == results["frames"]
+    assert "energy" not in output_artifacts
+    # directories are streamed without leaving an archive next to them
+    assert not (tmp_path / "logs.tgz").exists()
+    with tarfile.open(tmp_path / "job/outputs/logs/logs.tgz") as tf:
+        assert "logs/sub/log.txt" in tf.getnames()
+
+
+def test_failed_archive(tmp_path):
+    logs = tmp_path / "logs"
+    logs.mkdir()
+    (logs / "a.txt").write_bytes(os.urandom(1 << 20))
+    os.symlink(str(tmp_path / "missing"), str(logs / "z.txt"))
+    with pytest.raises(FileNotFoundError):
+        LocalStorage().upload(str(tmp_path / "out"), str(logs))
+    # no truncated archive is left behind
+    assert not (tmp_path / "out").exists() or \
+        os.listdir(tmp_path / "out") == []
@@ -0,0 +1,107 @@
+import os
+import random
+import sys
+import time
+
+import jsonpickle
+
+from dp.agent.server.executor.code_bundle import bundle_manager
+from dp.agent.server.executor.dispatcher_executor import (
+    PAYLOAD_FILE,
+    DispatcherExecutor,
+    generate_script,
+    write_payload,
+)
+
+
+def make_structures(n):
+    random.seed(0)
+    return [{"formula": "Si8", "lattice": [[5.43, 0, 0], [0, 5.43, 0],
+                                           [0, 0, 5.43]],
+             "species": ["Si"] * 8,
+             "coords": [[random.random() for _ in range(3)]
+                        for _ in range(8)],
+             "properties": {"energy": None, "tags": ["bulk", "relaxed"]}}
+            for _ in range(n)]
+
+
+def load_inline(script):
+    exec(compile(script, "script.py", "exec"), {"__name__": "bench"})
+
+
+def load_payload(script, path):
+    ns = {"__name__": "bench"}
+    exec(compile(script, "script.py", "exec"), ns)
+    cwd = os.getcwd()
+    os.chdir(os.path.dirname(path))
+    try:
+        exec(compile(
+            "import pickle, zlib, jsonpickle\n"
+            "with open(%r, 'rb') as f:\n"
+            "    payload = pickle.loads(zlib.decompress(f.read()))\n"
+            "kwargs = payload['kwargs']\n"
+            "if payload['format'] == 'jsonpickle':\n"
+            "    kwargs = jsonpickle.loads(kwargs)\n" % PAYLOAD_FILE,
+            "script.py", "exec"), ns)
+    finally:
+        os.chdir(cwd)
+    return ns["kwargs"]
+
+
+def test_payload_size(tmp_path):
+    kwargs = {"structures": make_structures(2000), "cutoff": 6.0}
+    func_def = "from mymodule import relax\n"
+    script = generate_script("relax", func_def, False)
+    # arguments used to be inlined in the script
+    inline = "kwargs = jsonpickle.loads(%r)\n" % jsonpickle.dumps(kwargs)
+    inline_script = "import jsonpickle\n" + inline
+    path = str(tmp_path / PAYLOAD_FILE)
+    write_payload(path, kwargs, {})
+    payload_size = os.path.getsize(path)
+    assert jsonpickle.dumps(kwargs) not in script
+
+    start = time.perf_counter()
+    for _ in range(5):
+        load_inline(inline_script)
+    inline_time = (time.perf_counter() - start) / 5
+    start = time.perf_counter()
+    for _ in range(5):
+        assert load_payload("", path) == kwargs
+    payload_time = (time.perf_counter() - start) / 5
+    print("script: %d bytes inline, %d + %d bytes payload; startup: "
+          "%.4fs inline, %.4fs payload" % (
+              len(script) + len(inline), len(script), payload_size,
+              inline_time, payload_time))
+    assert len(script) + payload_size < (len(script) + len(inline)) / 2
+    assert payload_time < inline_time
+
+    # objects which cannot be pickled fall back to jsonpickle
+    kwargs = {"key": (lambda x: x), "n": 1}
+    write_payload(path, kwargs, {})
+    assert load_payload("", path)["n"] == 1
+
+
+def test_dispatcher_payload(tmp_path, monkeypatch):
+    monkeypatch.chdir(tmp_path)
+    monkeypatch.setattr(bundle_manager, "bundle_dir",
+                        str(tmp_path / "bundles"))
+    executor = DispatcherExecutor(
+        machine={"batch_type": "Shell", "context_type": "LazyLocalContext"},
+        python_executable=sys.executable, status_interval=0.1)
+    scale = 2.0
+
+    def count_atoms(structures):
+        return {"atoms": sum(len(s["species"]) for s in structures) * scale}
+
+    structures = make_structures(500)
+    workdir = str(tmp_path / "job")
+    os.makedirs(workdir)
+    job_id = executor.submit(count_atoms, {"structures": structures},
+                             workdir=workdir)["job_id"]
+    while executor.query_status(job_id, workdir) in ["Pending", "Running"]:
+        time.sleep(0.05)
+    assert executor.get_results(job_id, workdir) == {"atoms": 8000.0}
+    with open(os.path.join(workdir, "script.py")) as f:
+        script = f.read()
+    assert "coords" not in script and "cloudpickle.loads(b" not in script
+    assert os.path.isfile(os.path.join(workdir, PAYLOAD_FILE))
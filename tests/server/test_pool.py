@@ -0,0 +1,30 @@
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+from dp.agent.server.pool import InstancePool
+
+
+def test_instance_pool():
+    built = []
+
+    def factory(config):
+        time.sleep(0.05)
+        built.append(config)
+        return object()
+
+    pool = InstancePool(factory, ttl=3600)
+    with ThreadPoolExecutor(max_workers=8) as executor:
+        instances = list(executor.map(
+            lambda _: pool.get({"type": "x", "a": {"b": 1, "c": 2}}),
+            range(8)))
+    assert len(built) == 1
+    assert all(i is instances[0] for i in instances)
+    # keys are normalized
+    assert pool.get({"a": {"c": 2, "b": 1}, "type": "x"}) is instances[0]
+    assert pool.get({"type": "y"}) is not instances[0]
+    assert pool.stats() == {"size": 2, "hits": 8, "misses": 2}
+
+    pool.ttl = 0.01
+    time.sleep(0.02)
+    assert pool.get({"type": "x", "a": {"b": 1, "c": 2}}) is not instances[0]
+    assert pool.stats()["size"] == 1
@@ -0,0 +1,60 @@
+import sys
+import time
+from pathlib import Path
+from typing import List
+
+from dp.agent.server.calculation_mcp_server import handle_input_artifacts
+from dp.agent.server.executor.code_bundle import bundle_manager
+from dp.agent.server.executor.dispatcher_executor import DispatcherExecutor
+
+
+def count_lines(structure: Path, extra: List[Path]) -> dict:
+    n = len(structure.read_text().splitlines())
+    n += sum(len(p.read_text().splitlines()) for p in extra)
+    out = Path("report.txt")
+    out.write_text("%s lines\n" % n)
+    return {"lines": n, "report": out}
+
+
+def test_remote_artifacts(tmp_path, monkeypatch):
+    monkeypatch.chdir(tmp_path)
+    monkeypatch.setattr(bundle_manager, "bundle_dir",
+                        str(tmp_path / "bundles"))
+    data = tmp_path / "data"
+    data.mkdir()
+    (data / "a.xyz").write_text("1\n2\n3\n")
+    (data / "b.xyz").write_text("4\n")
+    kwargs = {"structure": "local://%s" % (data / "a.xyz"),
+              "extra": ["local://%s" % (data / "b.xyz")]}
+    workdir = tmp_path / "job"
+    workdir.mkdir()
+    # the server only records the URIs
+    kwargs, input_artifacts = handle_input_artifacts(
+        count_lines, kwargs, {"type": "local"}, workdir=str(workdir),
+        download=False)
+    assert kwargs["structure"].startswith("local://")
+    assert input_artifacts["structure"]["uri"] == kwargs["structure"]
+    assert not (workdir / "inputs").exists()
+
+    executor = DispatcherExecutor(
+        machine={"batch_type": "Shell", "context_type": "LazyLocalContext"},
+        python_executable=sys.executable, status_interval=0.1,
+        remote_artifacts=True)
+    job_id = executor.submit(count_lines, kwargs, workdir=str(workdir),
+                             storage={"type": "local"})["job_id"]
+    while executor.query_status(job_id, str(workdir)) in [
+            "Pending", "Running"]:
+        time.sleep(0.05)
+    results = executor.get_results(job_id, str(workdir))
+    assert results["lines"] == 4
+    output_artifacts = executor.get_output_artifacts(job_id, str(workdir))
+    assert results["report"] == output_artifacts["report"]["uri"]
+    assert results["report"].startswith("local://")
+    # downloaded and uploaded by the job itself, then removed from the
+    # task directory so that they are not returned with the results
+    assert open(results["report"][len("local://"):]).read() == "4 lines\n"
+    assert not (workdir / "inputs").exists()
+    assert not (workdir / "report.txt").exists()
+    assert (workdir / "results.txt").is_file()
+    assert DispatcherExecutor().get_output_artifacts(
+        job_id, str(workdir)) is None
@@ -0,0 +1,91 @@
+import asyncio
+import time
+from pathlib import Path
+
+from dp.agent.server.calculation_mcp_server import CalculationMCPServer
+from dp.agent.server.result_cache import ResultCache
+
+mcp = CalculationMCPServer("test")
+calls = []
+
+
+@mcp.tool(cache=True)
+async def count_lines(data: Path, tag: str) -> dict:
+    calls.append(tag)
+    await asyncio.sleep(0.2)
+    return {"lines": len(data.read_text().splitlines()), "tag": tag}
+
+
+@mcp.tool(cache=True)
+def copy_text(data: Path) -> dict:
+    time.sleep(0.2)
+    with open("out.txt", "w") as f:
+        f.write(data.read_text())
+    return {"out": Path("out.txt")}
+
+
+class DummyContext:
+    async def log(self, level, message):
+        pass
+
+
+def call_tool(name, **kwargs):
+    return mcp.mcp._tool_manager._tools[name].fn(**kwargs)
+
+
+def test_result_cache(tmp_path, monkeypatch):
+    monkeypatch.chdir(tmp_path)
+    monkeypatch.setattr(mcp.mcp, "get_context", DummyContext)
+    data = tmp_path / "in.txt"
+    data.write_text("a\nb\n")
+
+    async def run(n, tag="x"):
+        return await asyncio.gather(*[call_tool(
+            "count_lines", data=str(data), tag=tag) for _ in range(n)])
+
+    # concurrent identical calls are coalesced into one execution
+    results = asyncio.run(run(4))
+    assert calls == ["x"]
+    assert all(r.result == {"lines": 2, "tag": "x"} for r in results)
+    assert sum(bool(r.job_info.get("cache_hit")) for r in results) == 3
+    # then answered from the cache, with a copy callers may modify
+    result = asyncio.run(run(1))[0]
+    assert result.job_info["cache_hit"] and calls == ["x"]
+    result.result["lines"] = 0
+    result.job_info["trace_id"] = None
+    result = asyncio.run(run(1))[0]
+    assert result.result["lines"] == 2 and result.job_info["trace_id"]
+    # other arguments or modified inputs execute again
+    asyncio.run(run(1, tag="y"))
+    assert calls == ["x", "y"]
+    data.write_text("a\nb\nc\n")
+    result = asyncio.run(run(1))[0]
+    assert result.result["lines"] == 3 and calls == ["x", "y", "x"]
+    assert mcp.get_result_cache().stats()["coalesced"] == 3
+
+
+def test_duplicate_submit(tmp_path, monkeypatch):
+    monkeypatch.chdir(tmp_path)
+    data = tmp_path / "in.txt"
+    data.write_text("data")
+    job_id = call_tool("submit_copy_text", data=str(data)).result.job_id
+    assert call_tool("submit_copy_text",
+                     data=str(data)).result.job_id == job_id
+    while call_tool("query_job_status", job_id=job_id) in [
+            "Pending", "Running"]:
+        time.sleep(0.05)
+    assert call_tool("submit_copy_text",
+                     data=str(data)).result.job_id == job_id
+    data.write_text("other")
+    assert call_tool("submit_copy_text",
+                     data=str(data)).result.job_id != job_id
+
+
+def test_ttl_and_size():
+    cache = ResultCache(ttl=0.1, max_entries=2)
+    for i in range(3):
+        cache.set(str(i), i)
+    assert cache.get("0") is None
+    assert cache.get("2") == 2
+    time.sleep(0.15)
+    assert cache.get("2") is None
@@ -0,0 +1,118 @@
+import os
+import time
+from multiprocessing import Pipe
+
+import jsonpickle
+import pytest
+
+from dp.agent.server.executor import LocalExecutor
+from dp.agent.server.executor import result_channel
+from dp.agent.server.executor.result_channel import (
+    ResultStore,
+    decode_result,
+    encode_result,
+    send_message,
+)
+
+np = pytest.importorskip("numpy")
+
+
+def make_array(n):
+    return {"array": np.arange(n, dtype=np.float64), "n": n}
+
+
+def fail():
+    raise ValueError("bad input")
+
+
+def wait(executor, job_id, workdir):
+    while executor.query_status(job_id, workdir) in ["Pending", "Running"]:
+        time.sleep(0.02)
+    return executor.query_status(job_id, workdir)
+
+
+def test_shared_memory(tmp_path):
+    message = encode_result("a", str(tmp_path), make_array(1 << 18))
+    assert message["buffers"][0][0] == "shm"
+    name = message["buffers"][0][1]
+    result = decode_result(message)
+    assert result["array"][-1] == (1 << 18) - 1
+    assert not os.path.exists(os.path.join("/dev/shm", name.lstrip("/")))
+    # small buffers are sent inline
+    message = encode_result("b", str(tmp_path), make_array(10))
+    assert message["buffers"][0][0] == "bytes"
+    assert decode_result(message)["n"] == 10
+
+
+def test_local_executor(tmp_path):
+    executor = LocalExecutor()
+    jobs = []
+    for i in range(3):
+        res = executor.submit(make_array, {"n": 1 << 18}, str(tmp_path))
+        jobs.append(res["job_id"])
+    assert len(set(jobs)) == 3
+    for job_id in jobs:
+        assert wait(executor, job_id, str(tmp_path)) == "Succeeded"
+        result = executor.get_results(job_id, str(tmp_path))
+        assert result["array"].sum() == np.arange(1 << 18).sum()
+    # results are written in the background as a fallback
+    executor.results.flush()
+    for job_id in jobs:
+        assert os.path.exists(tmp_path / ("%s.pkl" % job_id))
+    job_id = executor.submit(fail, {}, str(tmp_path))["job_id"]
+    assert wait(executor, job_id, str(tmp_path)) == "Failed"
+    try:
+        executor.get_results(job_id, str(tmp_path))
+        assert False
+    except RuntimeError as e:
+        assert "bad input" in str(e)
+
+
+def test_fallback(tmp_path, monkeypatch):
+    # the server has gone, the result is written to <job_id>.pkl
+    conn, child_conn = Pipe(duplex=False)
+    conn.close()
+    send_message(child_conn, encode_result("c", str(tmp_path), {"a": 1}))
+    assert (tmp_path / "c.pkl").is_file()
+    executor = LocalExecutor()
+    assert executor.query_status("c", str(tmp_path)) == "Succeeded"
+    assert executor.get_results("c", str(tmp_path)) == {"a": 1}
+
+    # evicted results are read from the files written in the background
+    monkeypatch.setitem(result_channel.config, "shm_threshold", 1)
+    store = ResultStore(max_entries=1)
+    messages = [encode_result(job_id, str(tmp_path), make_array(4 << i))
+                for i, job_id in enumerate(["d", "e"])]
+    for message in messages:
+        store.put(message)
+    store.flush()
+    assert store.status("d") is None
+    assert (tmp_path / "d.pkl").is_file() and (tmp_path / "e.pkl").is_file()
+    assert executor.get_results("d", str(tmp_path))["n"] == 4
+    assert store.get("e")[1]["n"] == 8
+    # shared memory is released even if the results are never fetched
+    for message in messages:
+        for desc in message["buffers"]:
+            assert not os.path.exists(
+                os.path.join("/dev/shm", desc[1].lstrip("/")))
+
+
+def test_restart(tmp_path):
+    executor = LocalExecutor()
+    job_id = executor.submit(make_array, {"n": 1 << 18},
+                             str(tmp_path))["job_id"]
+    assert wait(executor, job_id, str(tmp_path)) == "Succeeded"
+    executor.results.flush()
+    # an executor created after a restart or a pool eviction
+    executor = LocalExecutor()
+    assert executor.query_status(job_id, str(tmp_path)) == "Succeeded"
+    result = executor.get_results(job_id, str(tmp_path))
+    assert result["array"].sum() == np.arange(1 << 18).sum()
+
+
+def test_legacy_result_file(tmp_path):
+    # written by earlier versions
+    (tmp_path / "f.txt").write_text(jsonpickle.dumps({"a": 1}))
+    executor = LocalExecutor()
+    assert executor.query_status("f", str(tmp_path)) == "Succeeded"
+    assert executor.get_results("f", str(tmp_path)) == {"a": 1}
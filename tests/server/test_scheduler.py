@@ -0,0 +1,162 @@
+import asyncio
+import os
+import time
+
+from dp.agent.server import metrics
+from dp.agent.server.calculation_mcp_server import (
+    CalculationMCPServer,
+    set_job_registry,
+)
+from dp.agent.server.executor import LocalExecutor
+from dp.agent.server.executor import scheduler as scheduler_module
+from dp.agent.server.executor.scheduler import (
+    Scheduler,
+    get_available_cpus,
+)
+
+
+def get_affinity(duration):
+    time.sleep(duration)
+    if hasattr(os, "sched_getaffinity"):
+        return {"cpus": sorted(os.sched_getaffinity(0))}
+    return {"cpus": None}
+
+
+mcp = CalculationMCPServer("test")
+
+
+@mcp.tool(resources={"cpus": 1})
+def pinned(duration: float) -> dict:
+    return get_affinity(duration)
+
+
+def submit_workflow(duration):
+    print("Workflow has been submitted (ID: wf-1, UID: uid-1)")
+    print("Workflow link: https://dflow/wf-1", flush=True)
+    time.sleep(duration)
+    return {}
+
+
+async def count_ticks(task, interval=0.01):
+    ticks = 0
+    while not task.done():
+        await asyncio.sleep(interval)
+        ticks += 1
+    return ticks
+
+
+def wait(executor, job_id, workdir):
+    while executor.query_status(job_id, workdir) in ["Pending", "Running"]:
+        time.sleep(0.02)
+    return executor.query_status(job_id, workdir)
+
+
+def test_scheduler():
+    scheduler = Scheduler(cpus=[0, 1, 2, 3], memory=100, pinning=True)
+    started = {}
+
+    def start(job_id):
+        return lambda cpus: started.setdefault(job_id, cpus)
+
+    scheduler.submit("a", start("a"), cpus=2, memory=10)
+    scheduler.submit("b", start("b"), cpus=1, memory=80)
+    scheduler.submit("c", start("c"), cpus=2, memory=10)
+    # small jobs do not overtake the job at the head of the queue
+    scheduler.submit("d", start("d"), cpus=1, memory=0)
+    assert started == {"a": [0, 1], "b": [2]}
+    assert scheduler.is_pending("c") and scheduler.is_pending("d")
+    assert scheduler.stats()["pending"] == 2
+    scheduler.release("a")
+    assert started["c"] == [0, 1] and started["d"] == [3]
+    assert scheduler.cancel("c") is False
+    scheduler.submit("e", start("e"), cpus=1)
+    assert scheduler.cancel("e") and "e" not in started
+    try:
+        scheduler.submit("f", start("f"), cpus=8)
+        assert False
+    except ValueError:
+        pass
+
+
+def test_local_executor(tmp_path, monkeypatch):
+    cpus = get_available_cpus()[:1]
+    monkeypatch.setattr(scheduler_module, "_scheduler",
+                        Scheduler(cpus=cpus, memory=1 << 30))
+    # jobs requiring resources are queued and pinned by default
+    executor = LocalExecutor(cpus=1, memory="512M")
+    jobs = [executor.submit(get_affinity, {"duration": 0.3},
+                            str(tmp_path))["job_id"] for _ in range(3)]
+    assert executor.query_status(jobs[0], str(tmp_path)) == "Running"
+    assert executor.query_status(jobs[2], str(tmp_path)) == "Pending"
+    assert executor.busy()
+    for job_id in jobs:
+        assert wait(executor, job_id, str(tmp_path)) == "Succeeded"
+        result = executor.get_results(job_id, str(tmp_path))
+        if result["cpus"] is not None:
+            assert result["cpus"] == cpus
+    assert not executor.busy()
+    assert 'dp_agent_queue_wait_seconds_count' in metrics.registry.render()
+
+    # pending jobs are cancelled by terminate
+    jobs = [executor.submit(get_affinity, {"duration": 0.3},
+                            str(tmp_path))["job_id"] for _ in range(2)]
+    executor.terminate(jobs[1], str(tmp_path))
+    assert executor.query_status(jobs[1], str(tmp_path)) == "Failed"
+    assert wait(executor, jobs[0], str(tmp_path)) == "Succeeded"
+
+
+def test_unlimited_default(tmp_path, monkeypatch):
+    monkeypatch.setattr(scheduler_module, "_scheduler",
+                        Scheduler(cpus=get_available_cpus()[:1]))
+    executor = LocalExecutor()
+    jobs = [executor.submit(get_affinity, {"duration": 0.3},
+                            str(tmp_path))["job_id"] for _ in range(3)]
+    # jobs are neither queued nor pinned unless they require resources
+    for job_id in jobs:
+        assert executor.query_status(job_id, str(tmp_path)) == "Running"
+    for job_id in jobs:
+        assert wait(executor, job_id, str(tmp_path)) == "Succeeded"
+        result = executor.get_results(job_id, str(tmp_path))
+        if result["cpus"] is not None:
+            assert result["cpus"] == get_available_cpus()
+
+
+def test_dflow_pending(tmp_path, monkeypatch):
+    monkeypatch.setattr(scheduler_module, "_scheduler",
+                        Scheduler(cpus=get_available_cpus()[:1]))
+    executor = LocalExecutor(cpus=1)
+    running = executor.submit(get_affinity, {"duration": 0.5},
+                              str(tmp_path))["job_id"]
+    dflow_executor = LocalExecutor(cpus=1, dflow=True)
+
+    async def run():
+        task = asyncio.ensure_future(dflow_executor.async_submit(
+            submit_workflow, {"duration": 0}, str(tmp_path)))
+        ticks = await count_ticks(task)
+        return task.result(), ticks
+
+    info, ticks = asyncio.run(run())
+    assert info["extra_info"]["workflow_id"] == "wf-1"
+    assert info["extra_info"]["workflow_link"] == "https://dflow/wf-1"
+    # the event loop keeps serving while the job is pending
+    assert ticks > 20
+    assert wait(executor, running, str(tmp_path)) == "Succeeded"
+    assert wait(dflow_executor, info["job_id"], str(tmp_path)) == \
+        "Succeeded"
+
+
+def test_tool_resources(tmp_path, monkeypatch):
+    monkeypatch.chdir(tmp_path)
+    set_job_registry(str(tmp_path / "jobs.db"))
+    cpus = get_available_cpus()[:1]
+    monkeypatch.setattr(scheduler_module, "_scheduler", Scheduler(cpus=cpus))
+    submit = mcp.mcp._tool_manager._tools["submit_pinned"].fn
+    query = mcp.mcp._tool_manager._tools["query_job_status"].fn
+    jobs = [submit(duration=0.3).result.job_id for _ in range(2)]
+    # a tool declaring its CPUs is queued without any configuration
+    assert query(job_id=jobs[0]) == "Running"
+    assert query(job_id=jobs[1]) == "Pending"
+    for job_id in jobs:
+        while query(job_id=job_id) in ["Pending", "Running"]:
+            time.sleep(0.02)
+        assert query(job_id=job_id) == "Succeeded"
@@ -0,0 +1,54 @@
+import os
+import sys
+import time
+
+from dp.agent.server.executor.code_bundle import bundle_manager
+from dp.agent.server.executor.dispatcher_executor import DispatcherExecutor
+
+
+def add(a, b):
+    return {"sum": a + b}
+
+
+class CountingExecutor(DispatcherExecutor):
+    def __init__(self, *args, **kwargs):
+        self.checks = 0
+        super().__init__(*args, **kwargs)
+
+    def check_submission(self, submission, workdir="."):
+        self.checks += 1
+        return super().check_submission(submission, workdir)
+
+
+def test_status_poller(tmp_path, monkeypatch):
+    monkeypatch.chdir(tmp_path)
+    monkeypatch.setattr(bundle_manager, "bundle_dir",
+                        str(tmp_path / "bundles"))
+    executor = CountingExecutor(
+        machine={"batch_type": "Shell", "context_type": "LazyLocalContext"},
+        python_executable=sys.executable, status_interval=0.2)
+    jobs = []
+    for i in range(3):
+        workdir = str(tmp_path / ("job%s" % i))
+        os.makedirs(workdir)
+        jobs.append((executor.submit(add, {"a": i, "b": 1},
+                                     workdir=workdir)["job_id"], workdir))
+    queries = 0
+    while True:
+        statuses = executor.query_status_batch(jobs)
+        queries += len(jobs)
+        if all(s != "Running" for s in statuses):
+            break
+        time.sleep(0.01)
+    assert statuses == ["Succeeded"] * 3
+    # submissions are refreshed together in the background, not per query
+    assert executor.checks <= 3 * executor.poller.passes
+    assert executor.checks < queries
+    for i, (job_id, workdir) in enumerate(jobs):
+        assert executor.get_results(job_id, workdir) == {"sum": i + 1}
+
+    # finished submissions are answered from memory
+    checks = executor.checks
+    for _ in range(3):
+        assert executor.query_status(*jobs[0]) == "Succeeded"
+    assert executor.checks == checks
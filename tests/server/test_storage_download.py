@@ -0,0 +1,80 @@
+import os
+import threading
+import time
+
+import pytest
+
+from dp.agent.server.storage import LocalStorage
+from dp.agent.server.storage import base_storage
+
+
+class SlowStorage(LocalStorage):
+    """A local storage with per-request latency and transient failures"""
+    def __init__(self, latency=0.01, failures=None):
+        self.latency = latency
+        self.failures = dict(failures or {})
+        self.calls = {}
+        self.active = 0
+        self.max_active = 0
+        self.lock = threading.Lock()
+
+    def _download(self, key, path):
+        with self.lock:
+            self.calls[key] = self.calls.get(key, 0) + 1
+            self.active += 1
+            self.max_active = max(self.max_active, self.active)
+            fail = self.failures.get(key, 0) > 0
+            if fail:
+                self.failures[key] -= 1
+        try:
+            time.sleep(self.latency)
+            if fail:
+                raise ConnectionError("connection reset")
+            return super()._download(key, path)
+        finally:
+            with self.lock:
+                self.active -= 1
+
+
+@pytest.fixture
+def dataset(tmp_path):
+    root = tmp_path / "dataset"
+    for i in range(200):
+        d = root / ("group%d" % (i % 7)) / ("sub%d" % (i % 3))
+        d.mkdir(parents=True, exist_ok=True)
+        (d / ("%03d.dat" % i)).write_bytes(b"x" * i)
+    return str(root)
+
+
+def test_parallel_download(dataset, tmp_path, monkeypatch):
+    monkeypatch.setitem(base_storage.config, "retry_backoff", 0.01)
+    timings = {}
+    for workers in [1, 16]:
+        storage = SlowStorage()
+        reports = []
+        start = time.perf_counter()
+        path = storage.download(
+            dataset, str(tmp_path / ("out%d" % workers)), workers=workers,
+            progress=lambda *args: reports.append(args))
+        timings[workers] = time.perf_counter() - start
+        assert storage.max_active <= workers
+        assert reports[-1] == (200, 200, sum(range(200)))
+        assert len(reports) == 200
+        assert open(os.path.join(
+            path, "group5", "sub2", "005.dat"), "rb").read() == b"x" * 5
+    print("200 objects at 10ms each: %.2fs sequential, %.2fs with 16 "
+          "workers" % (timings[1], timings[16]))
+    assert timings[16] < timings[1] / 4
+
+    # transient failures are retried per object
+    key = os.path.join(dataset, "group1", "sub1", "001.dat")
+    storage = SlowStorage(latency=0, failures={key: 2})
+    path = storage.download(dataset, str(tmp_path / "retry"), workers=8)
+    assert storage.calls[key] == 3
+    assert os.path.isfile(os.path.join(path, "group1", "sub1", "001.dat"))
+
+    storage = SlowStorage(latency=0, failures={key: 10})
+    storage.download_retries = 1
+    with pytest.raises(ConnectionError):
+        storage.download(dataset, str(tmp_path / "fail"), workers=8)
+    assert storage.calls[key] == 2
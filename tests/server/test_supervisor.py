@@ -0,0 +1,68 @@
+import asyncio
+import os
+import time
+
+import psutil
+
+from dp.agent.server.executor import LocalExecutor
+from dp.agent.server.executor.base_executor import BaseExecutor
+
+
+class DummyContext:
+    async def log(self, level, message):
+        pass
+
+
+def busy_job(size):
+    data = bytearray(size)
+    start = time.process_time()
+    while time.process_time() - start < 0.2:
+        pass
+    return {"size": len(data)}
+
+
+def fail():
+    raise ValueError("bad input")
+
+
+def wait(executor, job_id, workdir):
+    while executor.query_status(job_id, workdir) in ["Pending", "Running"]:
+        time.sleep(0.02)
+    return executor.query_status(job_id, workdir)
+
+
+def test_accounting(tmp_path):
+    executor = LocalExecutor()
+    res = asyncio.run(BaseExecutor.async_run(
+        executor, busy_job, {"size": 64 << 20}, DummyContext(), "trace",
+        workdir=str(tmp_path)))
+    accounting = res["accounting"]
+    assert accounting["exit_code"] == 0
+    assert accounting["cpu_time"] >= 0.2
+    assert accounting["wall_time"] >= accounting["cpu_time"] - 0.05
+    assert accounting["max_rss"] >= 64 << 20
+
+    job_id = executor.submit(fail, {}, str(tmp_path))["job_id"]
+    assert wait(executor, job_id, str(tmp_path)) == "Failed"
+    assert executor.get_accounting(job_id)["exit_code"] == 1
+
+    job_id = executor.submit(busy_job, {"size": 0}, str(tmp_path))["job_id"]
+    executor.terminate(job_id, str(tmp_path))
+    assert wait(executor, job_id, str(tmp_path)) == "Failed"
+    assert executor.get_accounting(job_id)["exit_code"] < 0
+
+
+def test_no_zombies(tmp_path):
+    executor = LocalExecutor()
+    jobs = [executor.submit(busy_job, {"size": 0}, str(tmp_path))["job_id"]
+            for _ in range(4)]
+    for job_id in jobs:
+        assert wait(executor, job_id, str(tmp_path)) == "Succeeded"
+    assert not executor.busy()
+    # status of finished jobs does not touch the file system or processes
+    os.rename(tmp_path, str(tmp_path) + ".moved")
+    assert all(executor.query_status(job_id, str(tmp_path)) == "Succeeded"
+               for job_id in jobs)
+    zombies = [p for p in psutil.Process().children()
+               if p.status() == psutil.STATUS_ZOMBIE]
+    assert zombies == []
@@ -0,0 +1,128 @@
+import asyncio
+import os
+import threading
+import time
+
+from dp.agent.server.calculation_mcp_server import CalculationMCPServer
+from dp.agent.server.executor import LocalExecutor
+
+mcp = CalculationMCPServer("test")
+
+
+@mcp.tool(sync_mode="thread", create_workdir=False)
+def heavy(duration: float) -> dict:
+    time.sleep(duration)
+    return {"thread": threading.current_thread().name}
+
+
+def get_env(name, duration):
+    time.sleep(duration)
+    return {"value": os.environ.get(name), "pid": os.getpid()}
+
+
+class DummyContext:
+    async def log(self, level, message):
+        pass
+
+
+def call_tool(name, **kwargs):
+    return mcp.mcp._tool_manager._tools[name].fn(**kwargs)
+
+
+async def count_ticks(task, interval=0.01):
+    ticks = 0
+    while not task.done():
+        await asyncio.sleep(interval)
+        ticks += 1
+    return ticks
+
+
+def test_thread_mode(tmp_path, monkeypatch):
+    monkeypatch.chdir(tmp_path)
+    monkeypatch.setattr(mcp.mcp, "get_context", DummyContext)
+
+    async def run():
+        task = asyncio.ensure_future(asyncio.gather(*[
+            call_tool("heavy", duration=0.5) for _ in range(2)]))
+        ticks = await count_ticks(task)
+        return task.result(), ticks
+
+    start = time.monotonic()
+    results, ticks = asyncio.run(run())
+    # the event loop keeps serving while the tools run concurrently
+    assert time.monotonic() - start < 0.9
+    assert ticks > 10
+    assert all(r.result["thread"].startswith("local-executor")
+               for r in results)
+
+
+def get_cwd():
+    return {"cwd": os.getcwd(), "pid": os.getpid()}
+
+
+def test_thread_mode_fallback(tmp_path, monkeypatch):
+    monkeypatch.chdir(tmp_path)
+
+    def run(executor, fn, kwargs, workdir):
+        return asyncio.run(executor.async_run(
+            fn, kwargs, DummyContext(), "trace", workdir=workdir))["result"]
+
+    # tools with env or a workdir of their own run in job processes
+    executor = LocalExecutor(env={"DP_TEST_VALUE": "1"}, sync_mode="thread")
+    result = run(executor, get_env, {"name": "DP_TEST_VALUE",
+                                     "duration": 0}, str(tmp_path))
+    assert result["value"] == "1" and result["pid"] != os.getpid()
+    assert "DP_TEST_VALUE" not in os.environ
+    (tmp_path / "trace").mkdir()
+    result = run(LocalExecutor(sync_mode="thread"), get_cwd, {},
+                 str(tmp_path / "trace"))
+    assert result["cwd"] == str(tmp_path / "trace")
+    assert result["pid"] != os.getpid()
+    assert os.getcwd() == str(tmp_path)
+    # others in threads of the server process
+    result = run(LocalExecutor(sync_mode="thread"), get_cwd, {},
+                 str(tmp_path))
+    assert result["pid"] == os.getpid()
+
+
+def test_process_mode(tmp_path):
+    executors = [LocalExecutor(env={"DP_TEST_VALUE": str(i)},
+                               sync_mode="process", max_workers=2)
+                 for i in range(2)]
+
+    async def run():
+        task = asyncio.ensure_future(asyncio.gather(*[
+            executor.async_run(get_env, {"name": "DP_TEST_VALUE",
+                                         "duration": 0.5}, DummyContext(),
+                               "trace", workdir=str(tmp_path))
+            for executor in executors]))
+        ticks = await count_ticks(task)
+        return task.result(), ticks
+
+    results, ticks = asyncio.run(run())
+    assert [r["result"]["value"] for r in results] == ["0", "1"]
+    assert all(r["result"]["pid"] != os.getpid() for r in results)
+    assert "DP_TEST_VALUE" not in os.environ
+    assert ticks > 10
+
+
+def test_process_mode_limit(tmp_path):
+    executor = LocalExecutor(sync_mode="process", max_workers=1)
+
+    async def run():
+        return await asyncio.gather(*[executor.async_run(
+            get_env, {"name": "HOME", "duration": 0.3}, DummyContext(),
+            "trace", workdir=str(tmp_path)) for _ in range(2)])
+
+    start = time.monotonic()
+    asyncio.run(run())
+    # the jobs are run one by one
+    assert time.monotonic() - start >= 0.6
+
+
+def test_invalid_mode():
+    try:
+        LocalExecutor(sync_mode="fork")
+        assert False
+    except ValueError:
+        pass